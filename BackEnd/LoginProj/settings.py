@@ -207,4 +207,92 @@ Path(PDF_TEMP_ROOT).mkdir(exist_ok=True)
 
 #for graphs temp images
 IMAGE_TEMP_ROOT = os.path.join(BASE_DIR, 'temp_images')
-Path(IMAGE_TEMP_ROOT).mkdir(exist_ok=True)
\ No newline at end of file
+Path(IMAGE_TEMP_ROOT).mkdir(exist_ok=True)
+
+#for parsed datasets kept in memory between analyze_data calls
+DATASET_REGISTRY_MAX_BYTES = int(os.getenv('DATASET_REGISTRY_MAX_BYTES', 512 * 1024 * 1024))
+
+#CSV parser: 'native' (pandas/pyarrow) or 'h2o' for the legacy JVM import
+CSV_INGEST_ENGINE = os.getenv('CSV_INGEST_ENGINE', 'native')
+
+#for the on-disk columnar copy of parsed datasets (shared by all workers)
+DATASET_CACHE_ROOT = os.path.join(BASE_DIR, 'dataset_cache')
+DATASET_CACHE_MAX_BYTES = int(os.getenv('DATASET_CACHE_MAX_BYTES', 20 * 1024 * 1024 * 1024))
+Path(DATASET_CACHE_ROOT).mkdir(exist_ok=True)
+
+#for trained AutoML models reused across analyze_data calls
+MODEL_CACHE_MAX_BYTES = int(os.getenv('MODEL_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+MODEL_CACHE_TTL = int(os.getenv('MODEL_CACHE_TTL', 60 * 60))
+
+#for background analysis jobs (state files are shared by all workers)
+JOB_ROOT = os.path.join(BASE_DIR, 'job_results')
+JOB_RESULT_TTL = int(os.getenv('JOB_RESULT_TTL', 60 * 60))
+ANALYSIS_JOB_WORKERS = int(os.getenv('ANALYSIS_JOB_WORKERS', 4))
+Path(JOB_ROOT).mkdir(exist_ok=True)
+
+#'balanced' model tier: fall back to AutoML when the closed-form fit explains less than this
+FAST_MODEL_MIN_R2 = float(os.getenv('FAST_MODEL_MIN_R2', 0.3))
+
+#analysis responses holding more values than this are streamed
+STREAMING_JSON_MIN_ITEMS = int(os.getenv('STREAMING_JSON_MIN_ITEMS', 200000))
+
+#batch analysis: specs per request and threads running them
+BATCH_MAX_SPECS = int(os.getenv('BATCH_MAX_SPECS', 50))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 4))
+
+#streaming=true analysis: rows parsed per chunk and plotted points kept
+STREAMING_CHUNK_ROWS = int(os.getenv('STREAMING_CHUNK_ROWS', 200000))
+STREAMING_MAX_POINTS = int(os.getenv('STREAMING_MAX_POINTS', 5000))
+#distinct values counted exactly per streamed column; above this a HyperLogLog estimate (about 1% error)
+STREAMING_DISTINCT_MAX = int(os.getenv('STREAMING_DISTINCT_MAX', 100000))
+STREAMING_DISTINCT_PRECISION = int(os.getenv('STREAMING_DISTINCT_PRECISION', 14))
+
+#approximate=true analysis: default relative error of the sketches and pie slices before "Other"
+SKETCH_ERROR = float(os.getenv('SKETCH_ERROR', 0.01))
+SKETCH_PIE_SLICES = int(os.getenv('SKETCH_PIE_SLICES', 20))
+
+#shared H2O cluster (one JVM per host for all workers); H2O_MAX_MEM_SIZE like '4G', empty for the JVM default
+H2O_IP = os.getenv('H2O_IP', '127.0.0.1')
+H2O_PORT = int(os.getenv('H2O_PORT', 54321))
+H2O_CLUSTER_NAME = os.getenv('H2O_CLUSTER_NAME', 'datalysis')
+H2O_MAX_MEM_SIZE = os.getenv('H2O_MAX_MEM_SIZE') or None
+H2O_NTHREADS = int(os.getenv('H2O_NTHREADS', -1))
+H2O_HEALTH_TTL = int(os.getenv('H2O_HEALTH_TTL', 30))
+H2O_START_TIMEOUT = int(os.getenv('H2O_START_TIMEOUT', 120))
+H2O_PREWARM = os.getenv('H2O_PREWARM', 'true').lower() in ('1', 'true', 'yes')
+
+#training frames kept resident in the H2O cluster between requests (estimated from pandas size)
+H2O_FRAME_CACHE_MAX_BYTES = int(os.getenv('H2O_FRAME_CACHE_MAX_BYTES', 1024 * 1024 * 1024))
+
+#json_url sources: pooled fetches with timeouts, a size cap and a revalidated on-disk response cache
+JSON_FETCH_POOL_SIZE = int(os.getenv('JSON_FETCH_POOL_SIZE', 10))
+JSON_FETCH_CONNECT_TIMEOUT = float(os.getenv('JSON_FETCH_CONNECT_TIMEOUT', 5))
+JSON_FETCH_READ_TIMEOUT = float(os.getenv('JSON_FETCH_READ_TIMEOUT', 60))
+JSON_FETCH_MAX_BYTES = int(os.getenv('JSON_FETCH_MAX_BYTES', 512 * 1024 * 1024))
+JSON_FETCH_CACHE_ROOT = os.path.join(BASE_DIR, 'fetch_cache')
+JSON_FETCH_CACHE_MAX_BYTES = int(os.getenv('JSON_FETCH_CACHE_MAX_BYTES', 2 * 1024 * 1024 * 1024))
+Path(JSON_FETCH_CACHE_ROOT).mkdir(exist_ok=True)
+
+#JSON arrays larger than this are decoded item by item instead of in one orjson call
+JSON_STREAM_MIN_BYTES = int(os.getenv('JSON_STREAM_MIN_BYTES', 64 * 1024 * 1024))
+
+#queued PDF reports: built in a process pool (one per core by default), kept for JOB_RESULT_TTL
+PDF_JOB_ROOT = os.path.join(BASE_DIR, 'report_jobs')
+PDF_JOB_WORKERS = int(os.getenv('PDF_JOB_WORKERS', os.cpu_count() or 1))
+Path(PDF_JOB_ROOT).mkdir(exist_ok=True)
+
+#report charts: resampled to this resolution at their printed size; JPEG quality for photographic images
+REPORT_IMAGE_DPI = int(os.getenv('REPORT_IMAGE_DPI', 150))
+REPORT_IMAGE_JPEG_QUALITY = int(os.getenv('REPORT_IMAGE_JPEG_QUALITY', 85))
+
+#finished PDF reports served again for identical inputs, least recently served evicted first
+REPORT_CACHE_ROOT = os.path.join(BASE_DIR, 'report_cache')
+REPORT_CACHE_MAX_BYTES = int(os.getenv('REPORT_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+Path(REPORT_CACHE_ROOT).mkdir(exist_ok=True)
+
+#server-side report charts: points drawn per scatter series at most
+REPORT_CHART_MAX_POINTS = int(os.getenv('REPORT_CHART_MAX_POINTS', 2000))
+
+#calculate endpoint: compiled formulas kept, and values returned per array result at most
+FORMULA_CACHE_SIZE = int(os.getenv('FORMULA_CACHE_SIZE', 1024))
+FORMULA_MAX_RESULT_VALUES = int(os.getenv('FORMULA_MAX_RESULT_VALUES', 10000))
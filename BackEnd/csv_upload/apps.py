@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class CsvUploadConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'csv_upload'
+
+    def ready(self):
+        # boot the shared H2O cluster at worker start instead of on the first request
+        from .h2o_cluster import cluster, serving
+        if settings.H2O_PREWARM and serving():
+            cluster.prewarm()
@@ -0,0 +1,89 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache bounded by a byte budget.
+    `sizeof(value)` gives the cost of each entry; the oldest entries are
+    evicted once the total cost goes over `max_bytes`. With `ttl` set,
+    entries also expire that many seconds after being stored.
+    `on_evict(key, value)` is called (outside the lock) for every entry
+    that leaves the cache, e.g. to free resources held elsewhere.
+    """
+
+    def __init__(self, max_bytes, sizeof=None, ttl=None, on_evict=None):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof or (lambda value: 1)
+        self._on_evict = on_evict
+        self._entries = OrderedDict()  # key -> (value, nbytes, stored_at)
+        self._total = 0
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return default
+            if self.ttl is not None and time.monotonic() - item[2] > self.ttl:
+                self.pop(key)
+                return default
+            self._entries.move_to_end(key)
+            return item[0]
+
+    def put(self, key, value):
+        """
+        Store `value` under `key`. Returns False when the value alone is
+        bigger than the whole budget (nothing is stored in that case).
+        """
+        nbytes = int(self._sizeof(value))
+        if nbytes > self.max_bytes:
+            return False
+        evicted = []
+        with self._lock:
+            self.pop(key)
+            self._entries[key] = (value, nbytes, time.monotonic())
+            self._total += nbytes
+            while self._total > self.max_bytes:
+                evicted.append(self._evict_oldest())
+        self._notify(evicted)
+        return True
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._entries.pop(key, None)
+            if item is None:
+                return default
+            self._total -= item[1]
+        self._notify([(key, item[0])])
+        return item[0]
+
+    def clear(self):
+        with self._lock:
+            evicted = [(key, item[0]) for key, item in self._entries.items()]
+            self._entries.clear()
+            self._total = 0
+        self._notify(evicted)
+
+    def _evict_oldest(self):
+        key, item = self._entries.popitem(last=False)
+        self._total -= item[1]
+        return key, item[0]
+
+    def _notify(self, evicted):
+        if self._on_evict is not None:
+            for key, value in evicted:
+                self._on_evict(key, value)
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,392 @@
+"""
+Out-of-core analysis for CSV files larger than the worker's memory.
+
+The upload is parsed in chunks of STREAMING_CHUNK_ROWS rows and every
+statistic is kept as a partial aggregate that is merged chunk by chunk:
+value counts, null counts and distinct values (a HyperLogLog past
+STREAMING_DISTINCT_MAX), Pearson moments, normal equations for the trend
+line, GroupStats and the contingency table.
+Plot points come from a bounded random sample, so peak memory is about
+one chunk plus the size of the result.
+"""
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from scipy.stats import chi2_contingency
+
+from .downsample import sample_line
+from .fast_models import StreamingFit
+from .grouping import GroupStats
+from .ingest import sniff_csv
+from .profiles import coerce_numeric
+from .sketches import ColumnSketch, HyperLogLog, TopK
+
+
+class TypeChange(Exception):
+    """A column parsed as numeric so far turned out to hold text."""
+
+    def __init__(self, columns):
+        super().__init__(columns)
+        self.columns = columns
+
+
+def iter_chunks(file_obj, usecols, text_columns, chunk_rows):
+    """
+    DataFrames of `chunk_rows` rows. `text_columns` are read as strings;
+    any other column must stay numeric in every chunk, else TypeChange.
+    """
+    sep, header, _ = sniff_csv(file_obj)
+    for c in usecols:
+        if c not in header:
+            raise BadRequest(f'Column "{c}" not found. Available: {header}')
+
+    reader = pd.read_csv(
+        file_obj, sep=sep, usecols=usecols, chunksize=chunk_rows,
+        dtype={c: str for c in text_columns}
+    )
+    with reader:
+        for chunk in reader:
+            for c in usecols:
+                if c not in text_columns:
+                    chunk[c] = coerce_numeric(chunk[c])
+            changed = {
+                c for c in usecols
+                if c not in text_columns and not pd.api.types.is_numeric_dtype(chunk[c])
+            }
+            if changed:
+                raise TypeChange(changed)
+            yield chunk
+
+
+class ColumnSummary:
+    """
+    Null count and distinct values of one column (the column_stats entry).
+    Distinct values are kept exactly up to STREAMING_DISTINCT_MAX; past
+    that they go into a HyperLogLog, so continuous columns do not grow a
+    set as big as the file, and the count is flagged approximate.
+    """
+
+    def __init__(self, max_distinct=None, precision=None):
+        self.max_distinct = max_distinct or settings.STREAMING_DISTINCT_MAX
+        self.precision = precision or settings.STREAMING_DISTINCT_PRECISION
+        self.null_count = 0
+        self.distinct = set()
+        self.sketch = None
+
+    def update(self, series, numeric):
+        values = series.dropna().to_numpy()
+        self.null_count += len(series) - len(values)
+        if self.sketch is None:
+            self.distinct.update(pd.unique(values).tolist())
+            if len(self.distinct) <= self.max_distinct:
+                return
+            self.sketch = HyperLogLog(self.precision)
+            self.sketch.update(np.array(list(self.distinct), dtype=values.dtype))
+            self.distinct = None
+        self.sketch.update(values)
+
+    def stats(self, numeric):
+        stats = {
+            'type': 'numeric' if numeric else 'categorical',
+            'unique_values': len(self.distinct) if self.sketch is None else self.sketch.count(),
+            'null_count': int(self.null_count)
+        }
+        if self.sketch is not None:
+            stats['approximate'] = True
+        return stats
+
+
+class ValueCounts:
+    """Merged value_counts() of one column."""
+
+    def __init__(self):
+        self.counts = pd.Series(dtype=np.int64)
+
+    def update(self, series):
+        self.counts = self.counts.add(series.value_counts(), fill_value=0)
+
+    def pie(self):
+        counts = self.counts.astype(np.int64).sort_values(ascending=False, kind='stable')
+        return {'labels': counts.index.to_numpy(), 'values': counts.to_numpy()}
+
+
+class PearsonStats:
+    """Count, means and co-moments of (x, y), merged pairwise."""
+
+    def __init__(self, n=0, mean_x=0.0, mean_y=0.0, m2x=0.0, m2y=0.0, cxy=0.0):
+        self.n, self.mean_x, self.mean_y = n, mean_x, mean_y
+        self.m2x, self.m2y, self.cxy = m2x, m2y, cxy
+
+    @classmethod
+    def from_arrays(cls, x, y):
+        if not len(x):
+            return cls()
+        dx, dy = x - x.mean(), y - y.mean()
+        return cls(len(x), x.mean(), y.mean(), dx @ dx, dy @ dy, dx @ dy)
+
+    def merge(self, other):
+        n = self.n + other.n
+        if not n:
+            return PearsonStats()
+        dx, dy = other.mean_x - self.mean_x, other.mean_y - self.mean_y
+        w = self.n * other.n / n
+        return PearsonStats(
+            n,
+            self.mean_x + dx * other.n / n,
+            self.mean_y + dy * other.n / n,
+            self.m2x + other.m2x + dx * dx * w,
+            self.m2y + other.m2y + dy * dy * w,
+            self.cxy + other.cxy + dx * dy * w,
+        )
+
+    def correlation(self):
+        if self.n < 2 or self.m2x <= 0 or self.m2y <= 0:
+            return None
+        return float(self.cxy / np.sqrt(self.m2x * self.m2y))
+
+
+class Contingency:
+    """Merged crosstab of two text columns."""
+
+    def __init__(self):
+        self.counts = None
+
+    def update(self, a, b):
+        part = pd.DataFrame({'a': a, 'b': b}).value_counts()
+        self.counts = part if self.counts is None else self.counts.add(part, fill_value=0)
+
+    def table(self):
+        if self.counts is None or not len(self.counts):
+            return pd.DataFrame()
+        return self.counts.astype(np.int64).unstack(fill_value=0)
+
+
+class RowSample:
+    """
+    Bounded random sample of plotted rows across chunks: each row gets a
+    random priority and the max_points lowest are kept. With `strata`,
+    the lowest-priority row of every stratum is always kept while there
+    are fewer strata than max_points, so rare categories stay visible.
+    """
+
+    def __init__(self, max_points, seed=0):
+        self.max_points = max_points
+        self.rng = np.random.default_rng(seed)
+        self.priority = np.empty(0)
+        self.columns = None
+        self.strata = None
+        self.seen = 0
+
+    def update(self, columns, strata=None):
+        n = len(columns[0])
+        self.seen += n
+        columns = [np.asarray(c) for c in columns]
+        if self.columns is None:
+            self.columns = columns
+            self.strata = None if strata is None else np.asarray(strata)
+            self.priority = self.rng.random(n)
+        else:
+            self.columns = [np.concatenate([old, new]) for old, new in zip(self.columns, columns)]
+            if strata is not None:
+                self.strata = np.concatenate([self.strata, np.asarray(strata)])
+            self.priority = np.concatenate([self.priority, self.rng.random(n)])
+
+        if len(self.priority) > self.max_points:
+            keep = self._select()
+            self.priority = self.priority[keep]
+            self.columns = [c[keep] for c in self.columns]
+            if self.strata is not None:
+                self.strata = self.strata[keep]
+
+    def _select(self):
+        k, priority = self.max_points, self.priority
+        if self.strata is None:
+            return np.sort(np.argpartition(priority, k)[:k])
+
+        codes = pd.factorize(self.strata)[0]
+        order = np.lexsort((priority, codes))
+        first = order[np.r_[True, codes[order][1:] != codes[order][:-1]]]
+        if len(first) >= k:
+            chosen = first[np.argsort(priority[first])[:k]]
+        else:
+            rest = np.setdiff1d(np.arange(len(priority)), first)
+            rest = rest[np.argsort(priority[rest])[:k - len(first)]]
+            chosen = np.concatenate([first, rest])
+        return np.sort(chosen)
+
+    def sampling(self):
+        """Sampling info for the payload, None when nothing was dropped."""
+        if self.seen <= self.max_points:
+            return None
+        return {'total_points': self.seen, 'returned_points': len(self.priority), 'method': 'reservoir'}
+
+
+class StreamState:
+    """Partial aggregates for one analyze_stream pass."""
+
+    def __init__(self, output_type, col1, col2, text_columns, max_points, sketch=None):
+        self.output_type = output_type
+        self.col1, self.col2 = col1, col2
+        self.numeric = {c: c not in text_columns for c in (col1, col2)}
+        self.rows = 0
+        self.sketch = sketch
+        self.summaries = {
+            c: ColumnSummary() if sketch is None else ColumnSketch(sketch)
+            for c in dict.fromkeys([col1, col2]) if c
+        }
+        self.sample = RowSample(max_points)
+
+        if output_type == 'pie':
+            self.rel_type = None
+            self.counts = ValueCounts() if sketch is None else TopK(sketch.top_k)
+            return
+
+        n1, n2 = self.numeric[col1], self.numeric[col2]
+        self.rel_type = (
+            "numeric-numeric" if n1 and n2 else
+            "numeric-categorical" if n1 else
+            "categorical-numeric" if n2 else
+            "categorical-categorical"
+        )
+        if self.rel_type == "numeric-numeric":
+            self.pearson = PearsonStats()
+            self.trend = StreamingFit()
+        elif self.rel_type == "categorical-categorical":
+            self.contingency = Contingency()
+        else:
+            self.groups = None
+
+    def update(self, chunk):
+        self.rows += len(chunk)
+        for c, summary in self.summaries.items():
+            summary.update(chunk[c], self.numeric[c])
+
+        if self.output_type == 'pie':
+            self.counts.update(chunk[self.col1])
+            return
+
+        s1, s2 = chunk[self.col1], chunk[self.col2]
+        if self.rel_type == "numeric-numeric":
+            mask = (s1.notna() & s2.notna()).to_numpy()
+            x, y = s1.to_numpy(np.float64)[mask], s2.to_numpy(np.float64)[mask]
+            self.pearson = self.pearson.merge(PearsonStats.from_arrays(x, y))
+            self.trend.update(x, y)
+            self.sample.update([x, y])
+
+        elif self.rel_type == "categorical-categorical":
+            a, b = s1.astype(str), s2.astype(str)
+            self.contingency.update(a, b)
+            self.sample.update([a, b], strata=a + '\x00' + b)
+
+        else:
+            cats, values = (s2, s1) if self.rel_type == "numeric-categorical" else (s1, s2)
+            cats = cats.astype(str)
+            mask = values.notna().to_numpy()
+            part = GroupStats.from_series(cats.to_numpy()[mask], values.to_numpy(np.float64)[mask])
+            self.groups = part if self.groups is None else self.groups.merge(part)
+            self.sample.update([cats, values.to_numpy(np.float64)], strata=cats)
+
+    def column_stats(self):
+        return {c: s.stats(self.numeric[c]) for c, s in self.summaries.items()}
+
+    def result(self):
+        col1, col2 = self.col1, self.col2
+        if self.output_type == 'pie':
+            return {
+                'status': 'success',
+                'data_source_type': 'csv',
+                'output_type': 'pie',
+                'plot_data': self.counts.pie() if self.sketch is None else self.counts.pie(self.sketch.pie_slices),
+                'column_names': [col1],
+                'column_stats': self.column_stats(),
+                'approximate': self.sketch and self.sketch.describe()
+            }
+
+        correlation = None
+        stats_res = None
+        model_perf = None
+
+        if self.rel_type == "numeric-numeric":
+            if not self.pearson.n:
+                raise BadRequest(f'No rows with both "{col1}" and "{col2}" present')
+            correlation = self.pearson.correlation()
+            features = [col1]
+            if abs(correlation or 0) < 0.3:
+                features.append('x2')
+
+            xs, ys = self.sample.columns
+            line = sample_line(xs, len(xs))
+            fit = self.trend.fit(xs[line], features)
+            # exact MAE needs a second pass; estimate it on the sampled rows
+            mae = float(np.abs(ys[line] - fit.predicted).mean())
+            plot_data = {
+                'x': xs,
+                'y': ys,
+                'predicted_x': xs[line],
+                'predicted': fit.predicted,
+                'confidence_interval': {'upper': fit.upper, 'lower': fit.lower}
+            }
+            model_perf = dict(fit.metrics, mae=mae, model_tier='fast')
+
+        elif self.rel_type == "categorical-categorical":
+            tab = self.contingency.table()
+            if tab.size:
+                chi2, p, dof, _ = chi2_contingency(tab)
+                stats_res = {'chi_square': {'statistic': chi2, 'p_value': p, 'degrees_of_freedom': dof}}
+            x, y = self.sample.columns if self.sample.columns else ([], [])
+            plot_data = {'x': x, 'y': y}
+
+        else:
+            groups = self.groups or GroupStats([], [], [], [])
+            correlation, stats_res = groups.tests()
+            cats, values = self.sample.columns if self.sample.columns else ([], [])
+            plot_data = {'x': cats, 'y': values, 'group_means': groups.means_dict()}
+
+        return {
+            'status': 'success',
+            'data_source_type': 'csv',
+            'output_type': self.output_type,
+            'relationship_type': self.rel_type,
+            'correlation': correlation,
+            'plot_data': plot_data,
+            'column_names': [col1, col2],
+            'column_stats': self.column_stats(),
+            'statistical_tests': stats_res,
+            'model_performance': model_perf,
+            'sampling': self.sample.sampling(),
+            'approximate': self.sketch and self.sketch.describe()
+        }
+
+
+def analyze_stream(file_obj, output_type, col1, col2, report=None, model_tier='balanced', max_points=None,
+                   sketch=None):
+    """
+    analyze_frame for a CSV upload read chunk by chunk. The trend line is
+    always the closed-form fit (AutoML needs the whole frame) and the plot
+    data is a sample of at most `max_points` rows (STREAMING_MAX_POINTS by
+    default). With `sketch`, distinct counts and pie counts come from
+    fixed-size sketches, so memory no longer grows with cardinality.
+    The payload has the same shape as analyze_frame's.
+    """
+    report = report or (lambda stage, progress: None)
+    if model_tier == 'automl':
+        raise BadRequest('model_tier "automl" is not available in streaming mode')
+    max_points = max_points or settings.STREAMING_MAX_POINTS
+    usecols = [col1] if output_type == 'pie' else list(dict.fromkeys([col1, col2]))
+
+    text_columns = set()
+    while True:
+        file_obj.seek(0)
+        state = StreamState(output_type, col1, col2, text_columns, max_points, sketch)
+        try:
+            for i, chunk in enumerate(iter_chunks(file_obj, usecols, text_columns,
+                                                  settings.STREAMING_CHUNK_ROWS)):
+                state.update(chunk)
+                report(f'processed {state.rows} rows', min(0.1 + 0.02 * (i + 1), 0.8))
+            break
+        except TypeChange as e:
+            text_columns = text_columns | e.columns
+
+    report('computing statistics', 0.9)
+    return state.result()
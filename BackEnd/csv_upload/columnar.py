@@ -0,0 +1,139 @@
+"""
+On-disk columnar copy of parsed datasets.
+
+Every column is stored as its own .npy file so a request can memory-map
+just the columns it needs instead of loading the whole frame:
+
+    <root>/<dataset_id>/manifest.json
+    <root>/<dataset_id>/col_<i>.npy               numeric / datetime values
+    <root>/<dataset_id>/col_<i>.npy + .json       category codes + categories
+
+Text columns are dictionary-encoded (int32 codes, -1 for nulls) so they
+can be mapped too; they come back as pandas Categoricals.
+"""
+import json
+import logging
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+
+MANIFEST = 'manifest.json'
+
+
+def is_plain_numpy(dtype):
+    return isinstance(dtype, np.dtype) and dtype.kind in 'biufM'
+
+
+class ColumnStore:
+
+    def __init__(self, root, max_bytes=None):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, dataset_id, filename=''):
+        return os.path.join(self.root, dataset_id, filename)
+
+    def manifest(self, dataset_id):
+        """Stored manifest for `dataset_id`, or None if it is not on disk."""
+        try:
+            with open(self.path(dataset_id, MANIFEST)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, dataset_id, df, file_type, name=''):
+        """
+        Persist `df` column by column. Written to a scratch directory first
+        and renamed into place, so readers never see a partial dataset.
+        Returns False when the frame holds values that cannot be encoded.
+        """
+        if self.manifest(dataset_id) is not None:
+            return True
+
+        tmp_dir = os.path.join(self.root, f'.tmp-{dataset_id}-{os.getpid()}')
+        os.makedirs(tmp_dir, exist_ok=True)
+        try:
+            columns = []
+            for i, (col, series) in enumerate(df.items()):
+                filename = f'col_{i}.npy'
+                if is_plain_numpy(series.dtype):
+                    np.save(os.path.join(tmp_dir, filename), series.to_numpy())
+                    kind = 'numpy'
+                else:
+                    codes, categories = pd.factorize(series, use_na_sentinel=True)
+                    np.save(os.path.join(tmp_dir, filename), codes.astype(np.int32))
+                    with open(os.path.join(tmp_dir, filename + '.json'), 'w') as f:
+                        json.dump(categories.tolist(), f, default=str)
+                    kind = 'category'
+                columns.append({'name': col, 'file': filename, 'kind': kind})
+
+            with open(os.path.join(tmp_dir, MANIFEST), 'w') as f:
+                json.dump({
+                    'dataset_id': dataset_id,
+                    'file_type': file_type,
+                    'name': name,
+                    'rows': len(df),
+                    'columns': columns,
+                }, f)
+
+            try:
+                os.replace(tmp_dir, self.path(dataset_id))
+            except OSError:
+                # another worker stored the same dataset first
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"Dataset {dataset_id} not cached on disk: {e}")
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            return False
+
+        self.prune()
+        return True
+
+    def read(self, dataset_id, columns=None):
+        """
+        Memory-map the requested columns of a stored dataset.
+        Numeric columns are zero-copy views over the mapped files.
+        """
+        manifest = self.manifest(dataset_id)
+        if manifest is None:
+            return None
+        os.utime(self.path(dataset_id, MANIFEST))  # recency for prune()
+
+        stored = {c['name']: c for c in manifest['columns']}
+        wanted = list(stored) if columns is None else columns
+        data = {}
+        for col in wanted:
+            entry = stored[col]
+            values = np.load(self.path(dataset_id, entry['file']), mmap_mode='r')
+            if entry['kind'] == 'category':
+                with open(self.path(dataset_id, entry['file'] + '.json')) as f:
+                    categories = json.load(f)
+                values = pd.Categorical.from_codes(values, categories=categories)
+            data[col] = pd.Series(values, name=col, copy=False)
+        return pd.DataFrame(data, copy=False)
+
+    def prune(self):
+        """Drop the least recently read datasets until under max_bytes."""
+        if not self.max_bytes:
+            return
+        entries = []
+        for dataset_id in os.listdir(self.root):
+            manifest_path = self.path(dataset_id, MANIFEST)
+            if dataset_id.startswith('.') or not os.path.exists(manifest_path):
+                continue
+            size = sum(
+                os.path.getsize(os.path.join(self.path(dataset_id), f))
+                for f in os.listdir(self.path(dataset_id))
+            )
+            entries.append((os.path.getmtime(manifest_path), size, dataset_id))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, dataset_id in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.path(dataset_id), ignore_errors=True)
+            total -= size
+
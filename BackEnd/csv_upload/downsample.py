@@ -0,0 +1,126 @@
+"""
+Point reduction for plot data, applied after the statistics have been
+computed on every row so only what gets drawn is thinned out.
+
+All functions return sorted row indices into the original arrays, so the
+selected points keep their original order.
+"""
+import numpy as np
+
+
+def decimate(n, max_points):
+    """Evenly spaced indices, always keeping the first and last row."""
+    if n <= max_points:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, max_points).round().astype(np.int64))
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets for a series sorted by x: keeps the
+    points that preserve the visual shape (peaks, dips) of the line.
+    """
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return decimate(n, max_points)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+
+    prev = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        # average of the next bucket (or the last point) as the third vertex
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+
+        area = np.abs(
+            (x[prev] - avg_x) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y - y[prev])
+        )
+        prev = start + int(area.argmax())
+        selected[i + 1] = prev
+    return selected
+
+
+def apportion(weights, total):
+    """Split `total` into integer shares proportional to `weights` (largest remainder)."""
+    share = weights * (total / weights.sum())
+    quota = np.floor(share).astype(np.int64)
+    leftover = int(total - quota.sum())
+    if leftover > 0:
+        quota[np.argsort(quota - share)[:leftover]] += 1
+    return quota
+
+
+def stratified(strata, max_points, seed=0):
+    """
+    Sample rows so each stratum keeps a share proportional to its size,
+    but every non-empty stratum (rare categories, sparse regions of a
+    scatter) keeps at least one point.
+    """
+    strata = np.asarray(strata)
+    n = len(strata)
+    if n <= max_points:
+        return np.arange(n)
+
+    _, codes, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    k = len(counts)
+    if k < max_points:
+        # one point per stratum, the rest of the budget shared by size
+        quota = 1 + apportion(counts - 1, max_points - k)
+    else:
+        quota = apportion(counts, max_points)
+
+    # rank rows inside their stratum in random order, keep rank < quota
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(n), codes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rank = np.empty(n, dtype=np.int64)
+    rank[order] = np.arange(n) - starts[codes[order]]
+    return np.flatnonzero(rank < quota[codes])
+
+
+def density_sample(x, y, max_points, bins=64, seed=0):
+    """
+    Scatter-plot sampling on a bins x bins grid: dense regions are thinned
+    proportionally while isolated points and outliers survive.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) <= max_points:
+        return np.arange(len(x))
+
+    def cell(values):
+        lo, hi = values.min(), values.max()
+        if hi <= lo:
+            return np.zeros(len(values), dtype=np.int64)
+        return np.minimum(((values - lo) / (hi - lo) * bins).astype(np.int64), bins - 1)
+
+    return stratified(cell(x) * bins + cell(y), max_points, seed)
+
+
+def is_sorted(values):
+    values = np.asarray(values)
+    return len(values) < 2 or bool(np.all(values[1:] >= values[:-1]))
+
+
+def sample_scatter(x, y, max_points):
+    """
+    Indices for a scatter of (x, y): LTTB when x is already ordered
+    (time series and the like), density-preserving sampling otherwise.
+    Returns (indices, method name).
+    """
+    if is_sorted(x):
+        return lttb(x, y, max_points), 'lttb'
+    return density_sample(x, y, max_points), 'density'
+
+
+def sample_line(x, max_points):
+    """Indices of a fitted line decimated along increasing x."""
+    order = np.argsort(x, kind='stable')
+    return order[decimate(len(order), max_points)]
@@ -0,0 +1,133 @@
+"""
+Closed-form regression models for the numeric-numeric relationship.
+
+Linear and quadratic least-squares fits are solved directly with NumPy,
+with analytic 95% prediction intervals, so a trend line and band come
+back in milliseconds without training anything in H2O.
+"""
+from collections import namedtuple
+
+import numpy as np
+from scipy.stats import t as student_t
+
+
+ModelFit = namedtuple('ModelFit', ['predicted', 'upper', 'lower', 'metrics', 'adj_r2'])
+
+MODEL_NAMES = {1: 'OLS linear regression', 2: 'OLS quadratic regression'}
+
+
+def fit_polynomial(x, y, degree, level=0.95):
+    """
+    Least-squares fit of y on 1, x, ..., x**degree.
+    x is standardised first to keep the normal equations well conditioned.
+    """
+    n = len(x)
+    p = degree + 1
+    scale = x.std() or 1.0
+    z = (x - x.mean()) / scale
+    X = np.vander(z, p, increasing=True)
+
+    coef, _, _, _ = np.linalg.lstsq(X, y, rcond=None)
+    predicted = X @ coef
+    residuals = y - predicted
+
+    sse = float(residuals @ residuals)
+    sst = float(((y - y.mean()) ** 2).sum())
+    r2 = 1.0 - sse / sst if sst > 0 else 1.0
+    dof = max(n - p, 1)
+    adj_r2 = 1.0 - (1.0 - r2) * (n - 1) / dof if n > p else r2
+
+    # prediction interval: t * sqrt(s^2 * (1 + x0' (X'X)^-1 x0)) per row
+    s2 = sse / dof
+    leverage = np.einsum('ij,jk,ik->i', X, np.linalg.pinv(X.T @ X), X)
+    half_width = student_t.ppf(0.5 + level / 2, dof) * np.sqrt(s2 * (1.0 + leverage))
+
+    metrics = {
+        'model_type': MODEL_NAMES.get(degree, f'OLS polynomial regression (degree {degree})'),
+        'r2': r2,
+        'rmse': float(np.sqrt(sse / n)),
+        'mae': float(np.abs(residuals).mean()),
+    }
+    return ModelFit(predicted, predicted + half_width, predicted - half_width, metrics, adj_r2)
+
+
+def fit_fast(x, y, features):
+    """
+    Best closed-form fit for y ~ x: the linear model, plus the quadratic
+    one when the `x2` feature is in play, chosen by adjusted R^2.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    fits = [fit_polynomial(x, y, 1)]
+    if 'x2' in features and len(x) > 3:
+        fits.append(fit_polynomial(x, y, 2))
+    return max(fits, key=lambda fit: fit.adj_r2)
+
+
+class StreamingFit:
+    """
+    The fit_fast models accumulated chunk by chunk through the normal
+    equations (X'X, X'y, y'y), for data that is never in memory at once.
+    x and y are centred and scaled with the first chunk's statistics.
+    The quadratic design contains the linear one, so both are solved
+    from the same sums.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.xtx = np.zeros((3, 3))
+        self.xty = np.zeros(3)
+        self.yty = 0.0
+        self.y_sum = 0.0
+
+    def _design(self, x, degree=2):
+        return np.vander((np.asarray(x, dtype=np.float64) - self.x_shift) / self.x_scale,
+                         degree + 1, increasing=True)
+
+    def update(self, x, y):
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if not len(x):
+            return
+        if not self.n:
+            self.x_shift, self.x_scale = x.mean(), x.std() or 1.0
+            self.y_shift = y.mean()
+        X = self._design(x)
+        y = y - self.y_shift
+        self.n += len(x)
+        self.xtx += X.T @ X
+        self.xty += X.T @ y
+        self.yty += float(y @ y)
+        self.y_sum += float(y.sum())
+
+    def fit_polynomial(self, x_eval, degree, level=0.95):
+        """Fit of the given degree, predicted (with intervals) at `x_eval`."""
+        n, p = self.n, degree + 1
+        xtx, xty = self.xtx[:p, :p], self.xty[:p]
+        inv = np.linalg.pinv(xtx)
+        coef = inv @ xty
+
+        sse = max(self.yty - 2 * coef @ xty + coef @ xtx @ coef, 0.0)
+        sst = self.yty - self.y_sum ** 2 / n
+        r2 = 1.0 - sse / sst if sst > 0 else 1.0
+        dof = max(n - p, 1)
+        adj_r2 = 1.0 - (1.0 - r2) * (n - 1) / dof if n > p else r2
+
+        X = self._design(x_eval, degree)
+        predicted = X @ coef + self.y_shift
+        leverage = np.einsum('ij,jk,ik->i', X, inv, X)
+        half_width = student_t.ppf(0.5 + level / 2, dof) * np.sqrt(sse / dof * (1.0 + leverage))
+
+        metrics = {
+            'model_type': MODEL_NAMES.get(degree, f'OLS polynomial regression (degree {degree})'),
+            'r2': r2,
+            'rmse': float(np.sqrt(sse / n)),
+        }
+        return ModelFit(predicted, predicted + half_width, predicted - half_width, metrics, adj_r2)
+
+    def fit(self, x_eval, features):
+        """Best fit as in fit_fast, evaluated at `x_eval`."""
+        fits = [self.fit_polynomial(x_eval, 1)]
+        if 'x2' in features and self.n > 3:
+            fits.append(self.fit_polynomial(x_eval, 2))
+        return max(fits, key=lambda fit: fit.adj_r2)
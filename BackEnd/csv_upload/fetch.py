@@ -0,0 +1,185 @@
+"""
+Fetching JSON data sources given as a URL.
+
+Requests go through one pooled requests.Session (keep-alive, retries on
+gateway errors) with timeouts. Bodies are streamed to a local cache with
+a byte cap and served from a file, never held as one string; the cached
+copy is revalidated with If-None-Match / If-Modified-Since, so charts
+that point at the same feed only download it again when it changed.
+Responses declaring a type that cannot hold JSON (an HTML error page, an
+image) are refused before the body is read.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+import requests
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+DOWNLOAD_CHUNK = 64 * 1024
+MAX_REDIRECTS = 5
+# raw-file hosts often serve JSON as text/plain or octet-stream
+JSON_CONTENT_TYPES = (
+    'application/json', 'application/x-ndjson', 'application/ndjson', 'application/jsonl',
+    'application/x-jsonlines', 'text/json', 'text/plain', 'application/octet-stream',
+)
+
+
+def is_json_content_type(header):
+    """True for a missing Content-Type or one that may hold JSON."""
+    if not header:
+        return True
+    media_type = header.split(';', 1)[0].strip().lower()
+    return media_type in JSON_CONTENT_TYPES or media_type.endswith('+json')
+
+
+def pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=(502, 503, 504),
+                          allowed_methods=('GET',)),
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.max_redirects = MAX_REDIRECTS
+    return session
+
+
+class JsonFetcher:
+    """
+    `session` is any requests.Session-like object, so tests can pass a
+    stub or point the fetcher at a local HTTP server.
+    """
+
+    def __init__(self, cache_root, max_bytes, cache_max_bytes, timeout, session=None):
+        self.cache_root = cache_root
+        self.max_bytes = max_bytes
+        self.cache_max_bytes = cache_max_bytes
+        self.timeout = timeout
+        self.session = session or pooled_session(settings.JSON_FETCH_POOL_SIZE)
+
+    def paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_root, f'{key}.body'), os.path.join(self.cache_root, f'{key}.meta')
+
+    def cached_meta(self, url):
+        body_path, meta_path = self.paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get('url') == url and os.path.getsize(body_path) == meta.get('size'):
+                return meta
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def fetch(self, url):
+        """
+        Binary file object with the response body for `url`, from the
+        cache when the server answers 304. Raises BadRequest when the URL
+        cannot be fetched or the body is over max_bytes.
+        """
+        body_path, meta_path = self.paths(url)
+        meta = self.cached_meta(url)
+        headers = {}
+        if meta and meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+
+        try:
+            with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as resp:
+                if resp.status_code == 304 and meta:
+                    os.utime(meta_path)  # recently used, for prune()
+                    return open(body_path, 'rb')
+                resp.raise_for_status()
+                content_type = resp.headers.get('Content-Type')
+                if not is_json_content_type(content_type):
+                    raise BadRequest(f'JSON URL returned {content_type}, not JSON')
+                size = self._download(resp, body_path)
+                meta = {
+                    'url': url,
+                    'size': size,
+                    'etag': resp.headers.get('ETag'),
+                    'last_modified': resp.headers.get('Last-Modified'),
+                    'fetched_at': time.time(),
+                }
+        except requests.RequestException as e:
+            raise BadRequest(f'Could not fetch JSON URL: {e}')
+
+        self._write_meta(meta_path, meta)
+        self.prune(keep=meta_path)
+        return open(body_path, 'rb')
+
+    def _download(self, resp, body_path):
+        """Stream the body into place; returns its size in bytes."""
+        length = resp.headers.get('Content-Length')
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise BadRequest(f'JSON URL response is larger than {self.max_bytes} bytes')
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_root, prefix='.tmp-')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in resp.iter_content(DOWNLOAD_CHUNK):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise BadRequest(f'JSON URL response is larger than {self.max_bytes} bytes')
+                    out.write(chunk)
+            os.replace(tmp_path, body_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return size
+
+    def _write_meta(self, meta_path, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_root, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def prune(self, keep=None):
+        """
+        Drop the least recently used responses until under cache_max_bytes,
+        never the one whose meta file is `keep`.
+        """
+        entries = []
+        for name in os.listdir(self.cache_root):
+            meta_path = os.path.join(self.cache_root, name)
+            if not name.endswith('.meta'):
+                continue
+            body_path = meta_path[:-len('.meta')] + '.body'
+            try:
+                entries.append((os.path.getmtime(meta_path), os.path.getsize(body_path), meta_path, body_path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _, _ in entries)
+        for _, size, meta_path, body_path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            if meta_path == keep:
+                continue
+            for path in (meta_path, body_path):
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logging.warning(f"Could not remove cached response {path}: {e}")
+            total -= size
+
+
+json_fetcher = JsonFetcher(
+    settings.JSON_FETCH_CACHE_ROOT,
+    settings.JSON_FETCH_MAX_BYTES,
+    settings.JSON_FETCH_CACHE_MAX_BYTES,
+    (settings.JSON_FETCH_CONNECT_TIMEOUT, settings.JSON_FETCH_READ_TIMEOUT),
+)
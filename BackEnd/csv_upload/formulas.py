@@ -0,0 +1,220 @@
+"""
+Server-side formulas over the columns of a stored dataset.
+
+Formulas use the calculator syntax of the formula page (math.js style:
++ - * / % ^, comparisons, and/or/not, function calls). They are parsed
+with the ast module, and only the node types, operators and functions
+listed here are accepted; nothing is ever passed to eval(). A parsed
+formula is compiled once into a tree of closures and kept in a cache
+keyed by its text.
+
+Evaluation is vectorized: a column name stands for the whole column as a
+float64 array (values that are not numbers become NaN), so `price * qty`
+is one NumPy operation, and aggregates such as mean(price) reduce an
+array to a scalar, ignoring NaN. Columns whose names are not identifiers
+are written col("Unit price"). Results too large for a float (10^400)
+are an error rather than infinity; division by zero still gives inf/NaN.
+"""
+import ast
+import io
+import tokenize
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import BadRequest
+
+from .cache import LRUCache
+
+
+MAX_FORMULA_CHARS = 1000
+
+Formula = namedtuple('Formula', ['text', 'evaluate', 'names'])
+
+
+def flat(args):
+    return np.concatenate([np.ravel(np.asarray(a, dtype=np.float64)) for a in args])
+
+
+def aggregate(fn):
+    """math.js-style aggregate: f(column), f(a, b, ...) over all values given."""
+    def reduce(*args):
+        if not args:
+            raise BadRequest('Aggregate functions need at least one argument')
+        values = flat(args)
+        values = values[~np.isnan(values)]
+        return fn(values) if len(values) else np.nan
+    return reduce
+
+
+def mode(values):
+    """Most frequent value, or the sorted list of values tied for it."""
+    uniques, counts = np.unique(values, return_counts=True)
+    modes = uniques[counts == counts.max()]
+    return modes[0] if len(modes) == 1 else modes
+
+
+def log(x, base=None):
+    return np.log(x) if base is None else np.log(x) / np.log(base)
+
+
+FUNCTIONS = {
+    # elementwise
+    'abs': np.abs, 'sqrt': np.sqrt, 'cbrt': np.cbrt, 'exp': np.exp,
+    'log': log, 'log10': np.log10, 'log2': np.log2,
+    'floor': np.floor, 'ceil': np.ceil, 'round': np.round, 'sign': np.sign,
+    'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+    'asin': np.arcsin, 'acos': np.arccos, 'atan': np.arctan,
+    'isnan': np.isnan,
+    # aggregates
+    'sum': aggregate(np.sum), 'mean': aggregate(np.mean), 'median': aggregate(np.median),
+    'min': aggregate(np.min), 'max': aggregate(np.max),
+    'std': aggregate(lambda v: np.std(v, ddof=1) if len(v) > 1 else np.nan),
+    'var': aggregate(lambda v: np.var(v, ddof=1) if len(v) > 1 else np.nan),
+    'count': aggregate(len), 'mode': aggregate(mode),
+}
+
+CONSTANTS = {'pi': np.pi, 'e': np.e}
+
+# statistics the formula page saves as variables
+VARIABLE_TYPES = ('sum', 'mean', 'median', 'mode')
+
+BINARY = {
+    ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.true_divide,
+    ast.Mod: np.mod, ast.Pow: np.power,
+}
+UNARY = {ast.USub: np.negative, ast.UAdd: np.positive, ast.Not: np.logical_not}
+COMPARE = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+BOOLEAN = {ast.And: np.logical_and, ast.Or: np.logical_or}
+
+
+def compile_node(node, names):
+    """Closure `scope -> value` for an AST node; referenced names are added to `names`."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) \
+            and not isinstance(node.value, bool):
+        value = float(node.value)
+        return lambda scope: value
+
+    if isinstance(node, ast.Name):
+        name = node.id
+        names.add(name)
+        return lambda scope: scope[name]
+
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY:
+        op = BINARY[type(node.op)]
+        left, right = compile_node(node.left, names), compile_node(node.right, names)
+        return lambda scope: op(left(scope), right(scope))
+
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY:
+        op = UNARY[type(node.op)]
+        operand = compile_node(node.operand, names)
+        return lambda scope: op(operand(scope))
+
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARE for op in node.ops):
+        # a < b < c is (a < b) and (b < c)
+        operands = [compile_node(n, names) for n in [node.left] + node.comparators]
+        ops = [COMPARE[type(op)] for op in node.ops]
+
+        def compare(scope):
+            values = [operand(scope) for operand in operands]
+            result = ops[0](values[0], values[1])
+            for i, op in enumerate(ops[1:], 1):
+                result = np.logical_and(result, op(values[i], values[i + 1]))
+            return result
+        return compare
+
+    if isinstance(node, ast.BoolOp) and type(node.op) in BOOLEAN:
+        op = BOOLEAN[type(node.op)]
+        operands = [compile_node(n, names) for n in node.values]
+
+        def combine(scope):
+            result = operands[0](scope)
+            for operand in operands[1:]:
+                result = op(result, operand(scope))
+            return result
+        return combine
+
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        fname = node.func.id
+        if fname == 'col':
+            if len(node.args) != 1 or not isinstance(node.args[0], ast.Constant) \
+                    or not isinstance(node.args[0].value, str):
+                raise BadRequest('col() takes one quoted column name')
+            name = node.args[0].value
+            names.add(name)
+            return lambda scope: scope[name]
+        if fname not in FUNCTIONS:
+            raise BadRequest(f'Unknown function: {fname}')
+        fn = FUNCTIONS[fname]
+        args = [compile_node(n, names) for n in node.args]
+        return lambda scope: fn(*(arg(scope) for arg in args))
+
+    raise BadRequest(f'Unsupported expression: {ast.unparse(node)}')
+
+
+def math_js_powers(text):
+    """
+    `text` with ^ written as **, which like math.js binds tighter than * and
+    groups from the right (2*3^2 is 18, 2^3^2 is 512); Python's ^ would not.
+    Only operator tokens are replaced, not a ^ inside col("a^b").
+    """
+    tokens = tokenize.generate_tokens(io.StringIO(text).readline)
+    return tokenize.untokenize(
+        (tokenize.OP, '**') if tok.type == tokenize.OP and tok.string == '^' else (tok.type, tok.string)
+        for tok in tokens
+    )
+
+
+def parse(text):
+    """Formula for `text`; raises BadRequest for invalid or disallowed syntax."""
+    if len(text) > MAX_FORMULA_CHARS:
+        raise BadRequest(f'Formula is longer than {MAX_FORMULA_CHARS} characters')
+    try:
+        tree = ast.parse(math_js_powers(text.strip()), mode='eval')
+    except tokenize.TokenError:
+        raise BadRequest(f'Invalid formula "{text}": incomplete expression')
+    except (SyntaxError, RecursionError, MemoryError) as e:
+        raise BadRequest(f'Invalid formula "{text}": {getattr(e, "msg", "too deeply nested")}')
+    names = set()
+    try:
+        evaluate = compile_node(tree.body, names)
+    except RecursionError:
+        raise BadRequest(f'Formula "{text}" is nested too deeply')
+    return Formula(text, evaluate, frozenset(names))
+
+
+_compiled = LRUCache(settings.FORMULA_CACHE_SIZE)
+
+
+def compile_formula(text):
+    """Parsed and compiled formula, from the cache when seen before."""
+    formula = _compiled.get(text)
+    if formula is None:
+        formula = parse(text)
+        _compiled.put(text, formula)
+    return formula
+
+
+def numeric_column(series):
+    """Column as float64, values that are not numbers as NaN."""
+    if not pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        series = pd.to_numeric(series.astype(object), errors='coerce')
+    return series.to_numpy(np.float64, na_value=np.nan)
+
+
+def evaluate(formula, scope):
+    """Value of `formula` with names looked up in `scope`."""
+    missing = sorted(name for name in formula.names if name not in scope)
+    if missing:
+        raise BadRequest(f'Undefined variables: {", ".join(missing)}')
+    with np.errstate(all='ignore', over='raise'):
+        try:
+            return formula.evaluate(scope)
+        except FloatingPointError:
+            raise BadRequest(f'Could not evaluate "{formula.text}": result too large')
+        except (TypeError, ValueError, RecursionError) as e:
+            raise BadRequest(f'Could not evaluate "{formula.text}": {e}')
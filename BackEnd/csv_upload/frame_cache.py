@@ -0,0 +1,98 @@
+"""
+H2OFrames kept resident in the cluster between requests.
+
+Training data for a (dataset, column set) is uploaded once (through
+transfer.to_h2o) and reused by later trainings and predictions, skipping
+the pandas -> H2O transfer.
+Frames are evicted least-recently-used under H2O_FRAME_CACHE_MAX_BYTES
+and dropped from the cluster with h2o.remove; a frame still in use by a
+training is only removed once that training releases it.
+"""
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+import h2o
+from django.conf import settings
+
+from .cache import LRUCache
+from .h2o_cluster import cluster
+from .metrics import stage
+from .transfer import to_h2o
+
+
+class FrameCache:
+
+    def __init__(self, max_bytes):
+        self._cache = LRUCache(max_bytes, sizeof=lambda entry: entry[1], on_evict=self._evicted)
+        self._lock = threading.Lock()
+        self._upload_lock = threading.Lock()
+        self._in_use = Counter()
+        self._doomed = set()
+
+    @contextmanager
+    def frame(self, dataset_id, columns, build):
+        """
+        The resident H2OFrame for `columns` of dataset `dataset_id`.
+        `build()` returns the pandas DataFrame to upload on a miss. Without
+        a dataset_id the frame is uploaded for this use only.
+        """
+        if dataset_id is None:
+            with stage('h2o_upload'):
+                hf = to_h2o(build())
+            try:
+                yield hf
+            finally:
+                remove(hf.frame_id)
+            return
+
+        key = (cluster.generation, dataset_id, tuple(columns))
+        with self._upload_lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                with stage('h2o_upload'):
+                    data = build()
+                    entry = (to_h2o(data), int(data.memory_usage(index=False).sum()))
+                self._cache.put(key, entry)
+            hf = entry[0]
+            with self._lock:
+                self._in_use[hf.frame_id] += 1
+        try:
+            yield hf
+        finally:
+            self._release(hf.frame_id)
+
+    def _release(self, frame_id):
+        with self._lock:
+            self._in_use[frame_id] -= 1
+            if self._in_use[frame_id] > 0:
+                return
+            del self._in_use[frame_id]
+            if frame_id not in self._doomed:
+                return
+            self._doomed.discard(frame_id)
+        remove(frame_id)
+
+    def _evicted(self, key, entry):
+        frame_id = entry[0].frame_id
+        with self._lock:
+            if self._in_use[frame_id]:
+                self._doomed.add(frame_id)
+                return
+        if key[0] == cluster.generation:
+            remove(frame_id)
+
+    def __len__(self):
+        return len(self._cache)
+
+
+def remove(frame_id):
+    try:
+        h2o.remove(frame_id)
+    except Exception as e:
+        # the cluster may already be gone; its frames went with it
+        logging.warning(f"Could not remove H2O frame {frame_id}: {e}")
+
+
+frame_cache = FrameCache(settings.H2O_FRAME_CACHE_MAX_BYTES)
@@ -0,0 +1,141 @@
+"""
+Vectorised per-group statistics for the numeric/categorical branches.
+
+Groups are factorized once and counts, sums and sums of squares are
+accumulated with np.bincount in a single pass; ANOVA and group means
+are derived from those. Values are shifted by their mean before
+squaring, and groups are kept as (count, mean, M2) so partial results
+from separate chunks merge exactly (Chan et al. parallel variance).
+"""
+import numpy as np
+import pandas as pd
+from scipy.stats import f as f_dist
+
+
+class GroupStats:
+
+    def __init__(self, labels, counts, means, m2):
+        self.labels = np.asarray(labels, dtype=object)
+        self.counts = np.asarray(counts, dtype=np.int64)
+        self.means = np.asarray(means, dtype=np.float64)
+        self.m2 = np.asarray(m2, dtype=np.float64)
+
+    @classmethod
+    def from_codes(cls, codes, labels, values):
+        """`codes` index into `labels`; `values` must be free of NaN."""
+        values = np.asarray(values, dtype=np.float64)
+        k = len(labels)
+        shift = values.mean() if len(values) else 0.0
+        shifted = values - shift
+
+        counts = np.bincount(codes, minlength=k)
+        sums = np.bincount(codes, weights=shifted, minlength=k)
+        sumsq = np.bincount(codes, weights=shifted * shifted, minlength=k)
+
+        safe = np.maximum(counts, 1)
+        means = sums / safe
+        m2 = np.maximum(sumsq - sums * means, 0.0)
+        return cls(labels, counts, means + shift, m2)
+
+    @classmethod
+    def from_series(cls, cats, values):
+        """Group `values` by `cats` (both already restricted to valid rows)."""
+        codes, labels = pd.factorize(cats)
+        return cls.from_codes(codes, labels, values)
+
+    def merge(self, other):
+        """Combined statistics of two partial results."""
+        index = {label: i for i, label in enumerate(self.labels)}
+        new = [label for label in other.labels if label not in index]
+        labels = np.concatenate([self.labels, np.asarray(new, dtype=object)])
+        index.update((label, len(self.labels) + i) for i, label in enumerate(new))
+        k = len(labels)
+
+        pos = np.fromiter((index[label] for label in other.labels), dtype=np.int64, count=len(other.labels))
+        na = np.zeros(k)
+        na[:len(self.labels)] = self.counts
+        nb = np.zeros(k)
+        nb[pos] = other.counts
+        ma = np.zeros(k)
+        ma[:len(self.labels)] = self.means
+        mb = np.zeros(k)
+        mb[pos] = other.means
+        m2 = np.zeros(k)
+        m2[:len(self.labels)] = self.m2
+        m2[pos] += other.m2
+
+        n = na + nb
+        safe = np.maximum(n, 1)
+        delta = mb - ma
+        means = ma + delta * nb / safe
+        m2 += delta * delta * na * nb / safe
+        return GroupStats(labels, n, means, m2)
+
+    @property
+    def total(self):
+        return int(self.counts.sum())
+
+    def present(self):
+        return self.counts > 0
+
+    def means_dict(self):
+        """Group label -> mean, sorted by label like groupby().mean()."""
+        keep = self.present()
+        pairs = zip(self.labels[keep].tolist(), self.means[keep].tolist())
+        return dict(sorted(pairs, key=lambda kv: str(kv[0])))
+
+    def point_biserial(self):
+        """
+        Point-biserial r for exactly two groups, coding the first-seen
+        group as 0 (same as pointbiserialr on pd.factorize codes).
+        """
+        keep = self.present()
+        if keep.sum() != 2:
+            return float('nan')
+        (n0, n1), (m0, m1) = self.counts[keep], self.means[keep]
+        n = n0 + n1
+        diff = m1 - m0
+        m2_total = self.m2[keep].sum() + diff * diff * n0 * n1 / n
+        if m2_total <= 0:
+            return float('nan')
+        return float(diff * np.sqrt(n0 * n1) / np.sqrt(n * m2_total))
+
+    def anova(self):
+        """
+        One-way ANOVA across the groups: (F, p-value, effect size).
+        Effect size follows the existing sqrt(F / (F + N - k)) definition.
+        """
+        keep = self.present()
+        counts, means, m2 = self.counts[keep], self.means[keep], self.m2[keep]
+        k, n = len(counts), int(counts.sum())
+        if k < 2 or n <= k:
+            return float('nan'), float('nan'), float('nan')
+
+        grand = (counts * means).sum() / n
+        ss_between = float((counts * (means - grand) ** 2).sum())
+        ss_within = float(m2.sum())
+        df_between, df_within = k - 1, n - k
+
+        if ss_within == 0:
+            f = float('inf') if ss_between > 0 else float('nan')
+        else:
+            f = (ss_between / df_between) / (ss_within / df_within)
+        p = float(f_dist.sf(f, df_between, df_within)) if np.isfinite(f) else (0.0 if f > 0 else float('nan'))
+        effect = float(np.sqrt(f / (f + df_within))) if np.isfinite(f) else (1.0 if f > 0 else float('nan'))
+        return f, p, effect
+
+    def tests(self):
+        """
+        (correlation, statistical_tests) for the payload: point-biserial r
+        for two groups, one-way ANOVA for more.
+        """
+        correlation = None
+        stats_res = None
+        if self.total > 1:
+            uc = int(self.present().sum())
+            if uc == 2:
+                correlation = self.point_biserial()
+            elif uc > 2:
+                f, p, effect = self.anova()
+                stats_res = {'anova': {'f_statistic': f, 'p_value': p, 'effect_size': effect}}
+        return correlation, stats_res
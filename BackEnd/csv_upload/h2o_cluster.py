@@ -0,0 +1,208 @@
+"""
+Lifecycle of the H2O cluster used for AutoML.
+
+All gunicorn workers on a host share one H2O JVM listening on H2O_PORT:
+a worker that finds nothing there takes a file lock and boots it, the
+others wait on the lock and then connect. The JVM is launched detached,
+in its own session and without h2o.init's exit hook, so it outlives the
+worker that happened to start it (and the frames and models it holds
+survive worker recycling). Health is cached for
+H2O_HEALTH_TTL seconds so requests do not make a REST round trip each,
+and failed starts are cached for as long so a host without Java fails
+fast. `prewarm()` (called from CsvUploadConfig.ready) boots the cluster
+at worker start and keeps a monitor thread that restarts it in the
+background if it dies.
+
+The detached launch relies on private helpers of H2OLocalServer (present
+in the pinned h2o 3.46); with an h2o that lacks them, the cluster is
+started with h2o.init instead and lives only as long as its worker.
+"""
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import h2o
+from django.conf import settings
+from filelock import FileLock, Timeout
+from h2o.backend.server import H2OLocalServer
+from h2o.exceptions import H2OConnectionError, H2OStartupError
+
+
+class H2OCluster:
+
+    def __init__(self, ip, port, name, max_mem_size, nthreads, health_ttl, start_timeout):
+        self.ip = ip
+        self.port = port
+        self.name = name
+        self.max_mem_size = max_mem_size
+        self.nthreads = nthreads
+        self.health_ttl = health_ttl
+        self.start_timeout = start_timeout
+        self.lock_path = os.path.join(tempfile.gettempdir(), f'datalysis-h2o-{port}.lock')
+        self.ice_root = os.path.join(tempfile.gettempdir(), f'datalysis-h2o-{port}')
+        self._lock = threading.Lock()
+        self._healthy_until = 0.0
+        self._failed_until = 0.0
+        self._last_error = None
+        self._monitor = None
+        # bumped on every (re)connect; frames and models from an older
+        # generation may be gone with the cluster that held them
+        self.generation = 0
+
+    def is_running(self):
+        """One REST round trip to the cluster; False when unreachable."""
+        try:
+            return h2o.connection() is not None and h2o.cluster().is_running()
+        except Exception:
+            return False
+
+    def ensure(self):
+        """
+        Make sure this process is connected to a running cluster, starting
+        one if needed. Raises H2OStartupError if it cannot be started.
+        """
+        if time.monotonic() < self._healthy_until:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now < self._healthy_until:
+                return
+            if now < self._failed_until:
+                raise H2OStartupError(self._last_error)
+            if self.is_running():
+                self._healthy_until = now + self.health_ttl
+                return
+            self._start()
+
+    def _start(self):
+        """Connect to the host's cluster, booting it under the file lock if absent."""
+        try:
+            with FileLock(self.lock_path, timeout=self.start_timeout):
+                if not self._connect():
+                    if can_launch_detached():
+                        self._wait_for(self._launch())
+                    else:
+                        self._init()
+        except Timeout:
+            self._fail(f'timed out waiting for another worker to start H2O on port {self.port}')
+        except H2OStartupError as e:
+            self._fail(str(e))
+        except Exception as e:
+            # connection errors from a half-started or foreign process on the port
+            self._fail(f'could not connect to H2O on port {self.port}: {e}')
+
+        self.generation += 1
+        self._healthy_until = time.monotonic() + self.health_ttl
+        self._last_error = None
+
+    def _connect(self):
+        try:
+            h2o.connect(ip=self.ip, port=self.port, verbose=False)
+            return True
+        except H2OConnectionError:
+            return False
+
+    def _launch(self):
+        """
+        Start h2o.jar as a process of its own session, found the way
+        h2o.init finds Java and the jar. Its output goes to files under
+        ice_root.
+        """
+        java = H2OLocalServer._find_java()
+        jar = next((p for p in H2OLocalServer._jar_paths() if os.path.exists(p)), None)
+        if jar is None:
+            raise H2OStartupError('h2o.jar not found')
+        cmd = [java]
+        if self.max_mem_size:
+            cmd.append(f'-Xmx{self.max_mem_size}')
+        cmd += ['-jar', jar, '-ip', self.ip, '-port', str(self.port), '-name', self.name,
+                '-ice_root', self.ice_root]
+        if self.nthreads > 0:
+            cmd += ['-nthreads', str(self.nthreads)]
+
+        os.makedirs(self.ice_root, exist_ok=True)
+        logging.info(f"Starting H2O on port {self.port}")
+        with open(os.path.join(self.ice_root, 'stdout.log'), 'ab') as out, \
+                open(os.path.join(self.ice_root, 'stderr.log'), 'ab') as err:
+            return subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=out, stderr=err,
+                                    start_new_session=True)
+
+    def _init(self):
+        """Start the cluster through h2o.init, tied to this worker's lifetime."""
+        logging.warning("This h2o version has no H2OLocalServer._find_java/_jar_paths; "
+                        "starting H2O with h2o.init, it will stop with this worker")
+        h2o.init(ip=self.ip, port=self.port, name=self.name, max_mem_size=self.max_mem_size,
+                 nthreads=self.nthreads, ice_root=self.ice_root,
+                 verbose=False)
+
+    def _wait_for(self, process):
+        """Connect once the launched JVM answers; H2OStartupError if it exits or times out."""
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise H2OStartupError(
+                    f'H2O exited with status {process.returncode}, '
+                    f'see {os.path.join(self.ice_root, "stderr.log")}'
+                )
+            if self._connect():
+                return
+            time.sleep(0.5)
+        raise H2OStartupError(f'H2O did not answer within {self.start_timeout}s')
+
+    def _fail(self, message):
+        logging.error(f"H2O failed to start: {message}")
+        self._last_error = message
+        self._failed_until = time.monotonic() + self.health_ttl
+        self._healthy_until = 0.0
+        raise H2OStartupError(message)
+
+    def status(self):
+        return {
+            'ip': self.ip,
+            'port': self.port,
+            'healthy': time.monotonic() < self._healthy_until,
+            'last_error': self._last_error,
+        }
+
+    def prewarm(self):
+        """Start the cluster and its monitor thread without blocking the caller."""
+        if self._monitor is not None:
+            return
+        self._monitor = threading.Thread(target=self._watch, name='h2o-monitor', daemon=True)
+        self._monitor.start()
+
+    def _watch(self):
+        while True:
+            try:
+                self._healthy_until = 0.0  # force a real check
+                self.ensure()
+            except H2OStartupError:
+                pass  # logged in _fail; retried on the next round
+            except Exception:
+                logging.exception("H2O health check failed")
+            time.sleep(self.health_ttl)
+
+
+def can_launch_detached():
+    """Whether this h2o still has the private helpers _launch uses to find Java and h2o.jar."""
+    return hasattr(H2OLocalServer, '_find_java') and hasattr(H2OLocalServer, '_jar_paths')
+
+
+def serving():
+    """True in a web server process rather than a manage.py command."""
+    return 'gunicorn' in os.path.basename(sys.argv[0]) or sys.argv[1:2] == ['runserver']
+
+
+cluster = H2OCluster(
+    ip=settings.H2O_IP,
+    port=settings.H2O_PORT,
+    name=settings.H2O_CLUSTER_NAME,
+    max_mem_size=settings.H2O_MAX_MEM_SIZE,
+    nthreads=settings.H2O_NTHREADS,
+    health_ttl=settings.H2O_HEALTH_TTL,
+    start_timeout=settings.H2O_START_TIMEOUT,
+)
@@ -0,0 +1,147 @@
+"""
+Background jobs without an external broker.
+
+Work runs on a local executor (threads or processes); job state lives in
+small JSON files under a shared directory so any worker process on the
+host can answer a status poll, not only the one that accepted the job.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from functools import partial
+
+from django.core.exceptions import BadRequest
+
+from .serializers import dumps
+
+
+JOB_ID_RE = re.compile(r'[0-9a-f]{32}')
+
+
+def write_json_atomic(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(dumps(data))
+    os.replace(tmp_path, path)
+
+
+class ProgressReporter:
+    """
+    Callable handed to job functions as `report(stage, progress)`.
+    Picklable, so it also works inside a process pool.
+    """
+
+    def __init__(self, root, job_id):
+        self.root = root
+        self.job_id = job_id
+
+    def __call__(self, stage, progress=None):
+        path = os.path.join(self.root, f'{self.job_id}.json')
+        with open(path) as f:
+            state = json.load(f)
+        state.update(status='running', stage=stage)
+        if progress is not None:
+            state['progress'] = round(progress, 3)
+        write_json_atomic(path, state)
+
+
+def run_job(report, fn, args):
+    report('started', 0.0)
+    return fn(report, *args)
+
+
+class JobQueue:
+    """
+    Runs `fn(report, *args)` in the background and tracks its state.
+    JSON-serialisable results are stored with the state; bytes results
+    (e.g. a rendered PDF) are written next to it and served by path.
+    """
+
+    def __init__(self, executor_factory, root, ttl):
+        self.root = root
+        self.ttl = ttl
+        self._executor_factory = executor_factory
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        # created on first use so importing this module spawns nothing
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._executor_factory()
+            return self._executor
+
+    def state_path(self, job_id):
+        return os.path.join(self.root, f'{job_id}.json')
+
+    def result_path(self, job_id):
+        return os.path.join(self.root, f'{job_id}.bin')
+
+    def submit(self, fn, *args, meta=None):
+        """`meta` holds extra fields kept in the job state, e.g. a filename."""
+        self.prune()
+        job_id = uuid.uuid4().hex
+        write_json_atomic(self.state_path(job_id), {
+            **(meta or {}),
+            'job_id': job_id,
+            'status': 'queued',
+            'stage': 'queued',
+            'progress': 0.0,
+            'submitted_at': time.time(),
+        })
+        future = self.executor.submit(run_job, ProgressReporter(self.root, job_id), fn, args)
+        future.add_done_callback(partial(self._finish, job_id))
+        return job_id
+
+    def _finish(self, job_id, future):
+        path = self.state_path(job_id)
+        with open(path) as f:
+            state = json.load(f)
+        state.update(finished_at=time.time(), progress=1.0)
+
+        error = future.exception()
+        if error is not None:
+            if not isinstance(error, BadRequest):
+                logging.error(f"Job {job_id} failed: {error!r}")
+            state.update(
+                status='failed',
+                stage='failed',
+                error=str(error),
+                status_code=400 if isinstance(error, BadRequest) else 500
+            )
+        else:
+            result = future.result()
+            state.update(status='done', stage='done')
+            if isinstance(result, bytes):
+                with open(self.result_path(job_id), 'wb') as f:
+                    f.write(result)
+                state['result_file'] = True
+            else:
+                state['result'] = result
+        write_json_atomic(path, state)
+
+    def status(self, job_id):
+        """Job state as a dict, or None for unknown/expired ids."""
+        if not JOB_ID_RE.fullmatch(job_id):
+            return None
+        try:
+            with open(self.state_path(job_id)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def prune(self):
+        """Remove job files not touched for longer than the TTL."""
+        cutoff = time.time() - self.ttl
+        for filename in os.listdir(self.root):
+            path = os.path.join(self.root, filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,244 @@
+"""
+JSON ingestion into DataFrames.
+
+The layout is detected from the start of the data:
+- NDJSON / JSON Lines (one value per line) is decoded line by line;
+- a top-level array of records is decoded in one go with orjson when it
+  is under JSON_STREAM_MIN_BYTES, otherwise one item at a time from the
+  file;
+- an object of column lists ({"col": [...]}) or pandas' split layout
+  ({"columns": [...], "data": [[...]]}) is built column by column.
+Rows become a frame a batch at a time, so the raw text, a list of every
+row dict and the frame are never all held at once.
+"""
+import codecs
+import io
+import itertools
+import json
+import os
+
+import pandas as pd
+from django.conf import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CHUNK_CHARS = 1 << 20
+BATCH_ROWS = 10000
+WHITESPACE = ' \t\n\r'
+BOM = codecs.BOM_UTF8
+# the first line must hold a whole value within this many bytes to count as NDJSON
+NDJSON_PROBE_BYTES = 1 << 20
+
+
+def loads(data):
+    """json.loads, through orjson when it is installed."""
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # e.g. integers beyond 64 bits, which json accepts
+    return json.loads(data)
+
+
+class JsonStream:
+    """Text of a JSON file read in chunks, with a cursor for raw_decode."""
+
+    def __init__(self, file_obj, chunk_size=CHUNK_CHARS):
+        self.file_obj = file_obj
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        """Append the next chunk; False once the file is exhausted."""
+        if self.eof:
+            return False
+        data = self.file_obj.read(self.chunk_size)
+        if isinstance(data, bytes):
+            data = self.decoder.decode(data, final=not data)
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Next non-whitespace character ('' at the end)."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f'Malformed JSON: expected one of {chars!r}, got {char!r}')
+        self.pos += 1
+        return char
+
+    def value(self, decoder=json.JSONDecoder()):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(self.buf, self.pos)
+                # a number at the end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill()
+
+
+def iter_array(stream):
+    """Items of the top-level JSON array in `stream`, one at a time."""
+    stream.expect('[')
+    if stream.peek() == ']':
+        stream.pos += 1
+        return
+    while True:
+        yield stream.value()
+        if stream.expect(',]') == ']':
+            return
+
+
+def records_to_frame(items):
+    """
+    DataFrame from an iterable of records, same as pd.DataFrame(list(items))
+    but built BATCH_ROWS records at a time, so only one batch of row dicts
+    is alive at once.
+    """
+    frames = []
+    columns = {}
+    items = iter(items)
+    while True:
+        batch = list(itertools.islice(items, BATCH_ROWS))
+        if not batch:
+            break
+        frame = pd.DataFrame(batch)
+        columns.update(dict.fromkeys(frame.columns))
+        frames.append(frame)
+
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    # an all-null column in one batch must not turn the whole column into objects
+    frames = [frame.dropna(axis=1, how='all') for frame in frames]
+    return pd.concat(frames, ignore_index=True).reindex(columns=list(columns))
+
+
+def iter_ndjson(file_obj):
+    """Values of a line-delimited JSON file, one per non-blank line."""
+    for number, line in enumerate(file_obj, 1):
+        if number == 1:
+            line = line.lstrip(BOM)
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield loads(line)
+        except ValueError as e:
+            raise ValueError(f'Malformed JSON on line {number}: {e}')
+
+
+def is_ndjson(file_obj):
+    """
+    The file holds a complete JSON value on its first line and another
+    one on a later line. Rewinds the file.
+    """
+    try:
+        first = file_obj.readline(NDJSON_PROBE_BYTES).lstrip(BOM).strip()
+        if not first:
+            return False
+        try:
+            loads(first)
+        except ValueError:
+            return False  # e.g. a pretty-printed document opening with "[" or "{"
+        while True:
+            line = file_obj.readline(NDJSON_PROBE_BYTES)
+            if not line:
+                return False
+            line = line.strip()
+            if line:
+                return line[:1] in (b'{', b'[')
+    finally:
+        file_obj.seek(0)
+
+
+def columns_to_frame(doc):
+    """
+    DataFrame from {"col": [...], ...}. Each list is dropped as soon as
+    its column is built, so the decoded lists and the frame overlap by
+    one column at most.
+    """
+    lengths = {len(values) for values in doc.values()}
+    if len(lengths) > 1:
+        raise ValueError('Malformed JSON: column arrays have different lengths')
+    columns = {}
+    for name in list(doc):
+        columns[name] = pd.Series(doc.pop(name))
+    return pd.DataFrame(columns, copy=False)
+
+
+def document_to_frame(doc):
+    """DataFrame from a decoded JSON document, by its orientation."""
+    if isinstance(doc, list):
+        return records_to_frame(doc)
+    if isinstance(doc, dict) and doc:
+        if {'columns', 'data'} <= set(doc) and isinstance(doc['data'], list):
+            return pd.DataFrame(doc['data'], columns=doc['columns'], index=doc.get('index'))
+        if all(isinstance(values, list) for values in doc.values()):
+            return columns_to_frame(doc)
+    return pd.DataFrame(doc)
+
+
+def source_size(file_obj):
+    """Size in bytes of an upload, a file or a BytesIO; None if unknown."""
+    size = getattr(file_obj, 'size', None)
+    if size is not None:
+        return size
+    if isinstance(file_obj, io.BytesIO):
+        return file_obj.getbuffer().nbytes
+    try:
+        return os.fstat(file_obj.fileno()).st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+def read_json(source):
+    """
+    DataFrame from JSON (any layout above) in a binary file-like object,
+    bytes or a string.
+    """
+    if isinstance(source, str):
+        source = source.encode()
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+
+    if is_ndjson(source):
+        return records_to_frame(iter_ndjson(source))
+
+    stream = JsonStream(source)
+    first = stream.peek()
+    size = source_size(source)
+    if first == '[' and (orjson is None or size is None or size > settings.JSON_STREAM_MIN_BYTES):
+        frame = records_to_frame(iter_array(stream))
+        if stream.peek():
+            raise ValueError('Malformed JSON: extra data after the top-level array')
+        return frame
+
+    del stream
+    source.seek(0)
+    return document_to_frame(loads(source.read().lstrip(BOM)))
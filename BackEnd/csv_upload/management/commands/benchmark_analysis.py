@@ -0,0 +1,281 @@
+import datetime
+import gc
+import inspect
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils.datastructures import MultiValueDict
+
+from csv_upload import synthetic
+from csv_upload.metrics import collect, stage
+from csv_upload.views import analyze_data
+
+
+# analyze_data branch -> (output_type, target_column1, target_column2)
+BRANCHES = {
+    'pie': ('pie', 'cat_0', ''),
+    'numeric-numeric': ('relationship', 'num_0', 'num_1'),
+    'numeric-categorical': ('relationship', 'num_0', 'cat_0'),
+    'categorical-numeric': ('relationship', 'cat_0', 'num_1'),
+    'categorical-categorical': ('relationship', 'cat_0', 'cat_1'),
+}
+
+DEFAULT_SIZES = '10000,1000000,10000000'
+
+
+def parse_list(text, convert, name):
+    try:
+        return [convert(item) for item in text.split(',') if item.strip()]
+    except ValueError:
+        raise CommandError(f'--{name} must be a comma-separated list')
+
+
+def git_revision():
+    """(commit, dirty) of the checkout, or (None, None) outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                cwd=settings.BASE_DIR, capture_output=True, text=True, check=True)
+        return commit, bool(status.stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def option_differences(baseline, dataset, fields):
+    """Settings that differ between `baseline` and this run, as 'name: old -> new' strings."""
+    differences = []
+    for group, current in (('dataset', dataset), ('fields', fields)):
+        before = baseline.get(group, {})
+        for name in sorted(set(before) | set(current)):
+            if before.get(name) != current.get(name):
+                differences.append(f'{name}: {before.get(name)} -> {current.get(name)}')
+    return differences
+
+
+def mb(nbytes):
+    return f'{nbytes / 2**20:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = (
+        'Time analyze_data per stage (and its peak traced memory) for each relationship type '
+        'on synthetic CSVs of several sizes, and save the results as a JSON baseline. '
+        'Memory is what tracemalloc sees: Python and NumPy allocations, not the pyarrow pool.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES, help='row counts, comma-separated')
+        parser.add_argument('--branches', default=','.join(BRANCHES), help='comma-separated')
+        parser.add_argument('--numeric', type=int, default=2, help='numeric columns (at least 2)')
+        parser.add_argument('--categorical', type=int, default=2, help='category columns (at least 2)')
+        parser.add_argument('--cardinality', type=int, default=20)
+        parser.add_argument('--null-ratio', type=float, default=0.0)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3, help='timed runs; the best is kept')
+        parser.add_argument('--model-tier', default='fast')
+        parser.add_argument('--max-points', type=int)
+        parser.add_argument('--approximate', action='store_true')
+        parser.add_argument('--streaming', action='store_true')
+        parser.add_argument('--no-memory', action='store_true',
+                            help='skip the extra traced run that measures memory')
+        parser.add_argument('--output', help='baseline file (default benchmarks/analysis-<commit>.json)')
+        parser.add_argument('--compare', help='earlier baseline to compare against '
+                                                 '(run with the same dataset and analysis options)')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='relative slowdown or memory growth reported as a regression')
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        sizes = parse_list(options['sizes'], int, 'sizes')
+        branches = parse_list(options['branches'], str.strip, 'branches')
+        unknown = [b for b in branches if b not in BRANCHES]
+        if unknown:
+            raise CommandError(f'Unknown branches {unknown}; choose from {list(BRANCHES)}')
+        if options['numeric'] < 2 or options['categorical'] < 2:
+            raise CommandError('--numeric and --categorical must both be at least 2')
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Could not read {options["compare"]}: {e}')
+
+        dataset = {
+            'numeric': options['numeric'], 'categorical': options['categorical'],
+            'cardinality': options['cardinality'], 'null_ratio': options['null_ratio'],
+            'seed': options['seed'],
+        }
+        fields = {'model_tier': options['model_tier']}
+        if options['max_points']:
+            fields['max_points'] = str(options['max_points'])
+        if options['approximate']:
+            fields['approximate'] = 'true'
+        if options['streaming']:
+            fields['streaming'] = 'true'
+        if baseline is not None:
+            # a streaming or approximate run against a plain baseline would show false regressions
+            differences = option_differences(baseline, dataset, fields)
+            if differences:
+                raise CommandError(f'{options["compare"]} was run with other options '
+                                   f'({"; ".join(differences)}); rerun it with the same ones')
+            if baseline.get('repeat') != options['repeat']:
+                self.stderr.write(f'Warning: the baseline kept the best of {baseline.get("repeat")} '
+                                  f'runs, this run the best of {options["repeat"]}')
+
+        commit, dirty = git_revision()
+        results = []
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in sizes:
+                path = os.path.join(tmp, f'synthetic-{rows}.csv')
+                size = synthetic.write_csv(path, rows, **dataset)
+                self.stdout.write(f'{rows:,} rows ({mb(size)} CSV), best of {options["repeat"]}')
+                for branch in branches:
+                    result = self.run_case(path, size, branch, fields, options)
+                    result.update(rows=rows, file_bytes=size)
+                    results.append(result)
+                    self.stdout.write(self.format_result(result))
+                os.remove(path)
+
+        report = {
+            'benchmark': 'analyze_data',
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+            'commit': commit,
+            'dirty': dirty,
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpu_count': os.cpu_count(),
+                'numpy': np.__version__,
+                'pandas': pd.__version__,
+                'csv_ingest_engine': settings.CSV_INGEST_ENGINE,
+            },
+            'sizes': sizes,
+            'branches': branches,
+            'dataset': dataset,
+            'fields': fields,
+            'repeat': options['repeat'],
+            'results': results,
+        }
+        output = options['output'] or os.path.join(
+            settings.BASE_DIR, 'benchmarks', f'analysis-{(commit or "nogit")[:12]}.json'
+        )
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        self.stdout.write(f'Saved {output}')
+
+        if baseline is not None:
+            regressions = self.compare(baseline, report, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} regression(s) over {options["threshold"]:.0%}')
+
+    def run_once(self, path, size, branch, fields, trace_memory=False):
+        """One analyze_data request; returns (Timings, seconds, peak traced bytes or None)."""
+        output_type, col1, col2 = BRANCHES[branch]
+        request = RequestFactory().post('/api/csv/upload-csv/', {
+            'output_type': output_type, 'target_column1': col1, 'target_column2': col2, **fields,
+        })
+        request.POST  # parse the form fields before attaching the file
+        view = inspect.unwrap(analyze_data)  # our collect() instead of the view's own
+        gc.collect()
+
+        with open(path, 'rb') as f:
+            request._files = MultiValueDict({
+                'file': [UploadedFile(f, name='synthetic.csv', content_type='text/csv', size=size)]
+            })
+            peak = None
+            if trace_memory:
+                base = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+            with collect('benchmark_analysis', trace_memory) as timings:
+                response = view(request)
+                if response.streaming:
+                    with stage('json_encode'):
+                        for _ in response.streaming_content:
+                            pass
+                seconds = timings.elapsed()
+            if trace_memory:
+                timings.note_peak()
+                peak = timings.traced_peak - base
+
+        if response.status_code != 200:
+            content = b'' if response.streaming else response.content
+            raise CommandError(f'{branch}: analyze_data returned {response.status_code} {content[:500]!r}')
+        return timings, seconds, peak
+
+    def run_case(self, path, size, branch, fields, options):
+        seconds, stages = float('inf'), {}
+        for _ in range(options['repeat']):
+            timings, total, _ = self.run_once(path, size, branch, fields)
+            seconds = min(seconds, total)
+            for name, value in timings.stages.items():
+                stages[name] = min(stages.get(name, value), value)
+        result = {
+            'branch': branch,
+            'columns': [c for c in BRANCHES[branch][1:] if c],
+            'seconds': seconds,
+            'stages': stages,
+        }
+
+        if not options['no_memory']:
+            # separate run: tracing allocations slows the timed code down
+            tracemalloc.start()
+            try:
+                timings, _, peak = self.run_once(path, size, branch, fields, trace_memory=True)
+            finally:
+                tracemalloc.stop()
+            result['peak_bytes'] = peak
+            result['stage_peak_bytes'] = timings.memory
+        return result
+
+    def format_result(self, result):
+        line = f'  {result["branch"]:<24}{result["seconds"]:>9.3f}s'
+        if 'peak_bytes' in result:
+            line += f'  peak {mb(result["peak_bytes"]):>10}'
+        stages = ', '.join(f'{name} {seconds:.3f}s' for name, seconds in result['stages'].items())
+        return f'{line}  ({stages})'
+
+    def compare(self, baseline, report, threshold):
+        """Print the change of each case against `baseline`; returns the number of regressions."""
+        before = {(r['rows'], r['branch']): r for r in baseline.get('results', [])}
+        self.stdout.write(f'Compared with {baseline.get("commit") or "unknown commit"} '
+                          f'({baseline.get("created", "?")}):')
+        regressions = 0
+        for result in report['results']:
+            old = before.get((result['rows'], result['branch']))
+            if old is None:
+                self.stdout.write(f'  {result["rows"]:>12,} {result["branch"]:<24}not in the baseline')
+                continue
+            changes = [('time', old['seconds'], result['seconds'])]
+            changes += [
+                (name, old['stages'][name], seconds)
+                for name, seconds in result['stages'].items() if old['stages'].get(name)
+            ]
+            if old.get('peak_bytes') and 'peak_bytes' in result:
+                changes.append(('peak memory', old['peak_bytes'], result['peak_bytes']))
+
+            parts = []
+            for name, old_value, new_value in changes:
+                ratio = new_value / old_value
+                flag = ''
+                if ratio > 1 + threshold and name in ('time', 'peak memory'):
+                    flag = ' REGRESSION'
+                    regressions += 1
+                parts.append(f'{name} {ratio - 1:+.1%}{flag}')
+            self.stdout.write(f'  {result["rows"]:>12,} {result["branch"]:<24}' + ', '.join(parts))
+        return regressions
@@ -0,0 +1,55 @@
+import time
+
+import h2o
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from h2o.exceptions import H2OStartupError
+
+from csv_upload.h2o_cluster import cluster
+from csv_upload.transfer import UPLOADS, DOWNLOADS, available_uploads, available_downloads
+
+
+class Command(BaseCommand):
+    help = 'Time pandas -> H2O and H2O -> pandas transfers (rows/sec per method).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1_000_000)
+        parser.add_argument('--columns', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        try:
+            cluster.ensure()
+        except H2OStartupError as e:
+            raise CommandError(f'Could not start H2O: {e}')
+
+        rows, repeat = options['rows'], options['repeat']
+        rng = np.random.default_rng(0)
+        df = pd.DataFrame({f'c{i}': rng.normal(size=rows) for i in range(options['columns'])})
+        self.stdout.write(f'{rows} rows x {df.shape[1]} float columns, best of {repeat}')
+
+        frame = None
+        for name in available_uploads():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                hf = UPLOADS[name](df)
+                best = min(best, time.perf_counter() - start)
+                if frame is None:
+                    frame = hf
+                else:
+                    h2o.remove(hf)
+            self.stdout.write(f'  pandas -> H2O  {name:<13}{rows / best:>14,.0f} rows/s')
+
+        for name in available_downloads():
+            best = float('inf')
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = DOWNLOADS[name](frame)
+                best = min(best, time.perf_counter() - start)
+            if len(out) != rows:
+                raise CommandError(f'{name} download returned {len(out)} rows, expected {rows}')
+            self.stdout.write(f'  H2O -> pandas  {name:<13}{rows / best:>14,.0f} rows/s')
+
+        h2o.remove(frame)
@@ -0,0 +1,226 @@
+"""
+Per-stage timing of the analysis and report views.
+
+    with stage('parse'):
+        ...
+
+times one stage of the current request (H2O startup, parsing, type
+coercion, training, statistics, JSON encoding...). Views wrapped with
+@instrumented('name') collect the stages of each request, return them in
+a Server-Timing header (shown in the browser's network panel) and add
+them to latency histograms per view, stage and relationship type, which
+metrics_view serves in the Prometheus text format. Outside an
+instrumented request, stage() costs one context variable lookup.
+
+Histograms live in the memory of each worker process; with several
+workers, scrape each one (or run a single worker) to see all requests.
+"""
+import bisect
+import contextvars
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.http import HttpResponse, JsonResponse
+
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+HELP = {
+    'datalysis_request_seconds': 'Time spent in an instrumented view.',
+    'datalysis_stage_seconds': 'Time spent in one stage of an instrumented view.',
+}
+
+
+class Histogram:
+    """Counts per upper bucket bound, plus sum and count (Prometheus style)."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}  # (name, sorted label items) -> Histogram
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(value)
+
+    def render(self):
+        """All histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for i, ((name, labels), histogram) in enumerate(items):
+                if i == 0 or items[i - 1][0][0] != name:
+                    lines.append(f'# HELP {name} {HELP.get(name, name)}')
+                    lines.append(f'# TYPE {name} histogram')
+                cumulative = 0
+                bounds = [str(b) for b in self.buckets] + ['+Inf']
+                for bound, count in zip(bounds, histogram.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{format_labels(labels + (("le", bound),))} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {histogram.sum!r}')
+                lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for key, value in labels
+    )
+    return '{' + ','.join(f'{key}="{value}"' for key, value in escaped) + '}'
+
+
+metrics = Metrics()
+
+
+class Timings:
+    """
+    Stage durations of one request (or background job). With
+    trace_memory (tracemalloc running), also the peak bytes allocated
+    within each stage, and the highest traced total seen (stages reset
+    tracemalloc's peak).
+    """
+
+    def __init__(self, view, trace_memory=False):
+        self.view = view
+        self.stages = defaultdict(float)  # stage -> seconds, repeated stages added up
+        self.memory = {}  # stage -> peak bytes above the start of the stage
+        self.trace_memory = trace_memory
+        self.traced_peak = 0
+        self.labels = {}
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()  # batch specs time their stages in parallel
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] += seconds
+
+    def add_peak(self, name, nbytes, traced_peak):
+        with self._lock:
+            self.memory[name] = max(self.memory.get(name, 0), nbytes)
+            self.traced_peak = max(self.traced_peak, traced_peak)
+
+    def note_peak(self):
+        """Fold tracemalloc's peak into traced_peak before it is reset."""
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            self.traced_peak = max(self.traced_peak, peak)
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def header(self):
+        """Server-Timing value, e.g. 'parse;dur=12.3, statistics;dur=4.0, total;dur=20.1'."""
+        parts = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.stages.items()]
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+        return ', '.join(parts)
+
+    def record(self):
+        rel_type = self.labels.get('rel_type', '')
+        for name, seconds in self.stages.items():
+            metrics.observe('datalysis_stage_seconds',
+                            {'view': self.view, 'stage': name, 'rel_type': rel_type}, seconds)
+        metrics.observe('datalysis_request_seconds',
+                        {'view': self.view, 'rel_type': rel_type}, self.elapsed())
+
+
+_current = contextvars.ContextVar('timings', default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block as stage `name` of the current request."""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    if timings.trace_memory:
+        timings.note_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+        if timings.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            timings.add_peak(name, peak - base, peak)
+
+
+def label(**labels):
+    """Label the current request's histograms (first value set wins), e.g. rel_type."""
+    timings = _current.get()
+    if timings is not None:
+        for key, value in labels.items():
+            timings.labels.setdefault(key, value)
+
+
+@contextmanager
+def collect(view, trace_memory=False):
+    """Collect the stages timed inside the block and add them to the histograms."""
+    timings = Timings(view, trace_memory)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+        timings.record()
+
+
+def bind(fn):
+    """`fn` for another thread (e.g. a pool worker), timing into the current request."""
+    timings = _current.get()
+
+    @wraps(fn)
+    def run(*args, **kwargs):
+        token = _current.set(timings)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _current.reset(token)
+    return run
+
+
+def instrumented(view_name):
+    """View decorator: stage timings in a Server-Timing header and in the histograms."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            with collect(view_name) as timings:
+                response = view(request, *args, **kwargs)
+                response['Server-Timing'] = timings.header()
+            return response
+        return wrapper
+    return decorator
+
+
+def metrics_view(request):
+    """Latency histograms of this worker process, Prometheus text format."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method allowed'}, status=405)
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+from django.conf import settings
+
+from .cache import LRUCache
+
+
+# AutoML settings for the numeric-numeric relationship model
+AUTOML_CONFIG = {
+    'max_models': 3,
+    'seed': 42,
+    'max_runtime_secs': 30,
+    'stopping_metric': 'RMSE',
+    'stopping_tolerance': 0.01,
+}
+
+# Plain Python/NumPy values: the AutoML models themselves are removed from
+# the cluster once they have predicted, so nothing is held in the JVM.
+TrainedModel = namedtuple('TrainedModel', ['predictions', 'metrics'])
+
+
+def model_key(dataset_id, col1, col2, features, config=AUTOML_CONFIG):
+    return (dataset_id, col1, col2, tuple(features), tuple(sorted(config.items())))
+
+
+def trained_nbytes(trained):
+    return trained.predictions.nbytes + 1024
+
+
+class ModelCache:
+    """
+    AutoML results for a (dataset, column pair, feature set, config),
+    so re-opening a chart or regenerating a report does not retrain.
+    """
+
+    def __init__(self, max_bytes, ttl):
+        self._cache = LRUCache(max_bytes, sizeof=trained_nbytes, ttl=ttl)
+
+    def get(self, key):
+        if key[0] is None:
+            return None
+        return self._cache.get(key)
+
+    def put(self, key, trained):
+        if key[0] is not None:
+            self._cache.put(key, trained)
+
+
+model_cache = ModelCache(settings.MODEL_CACHE_MAX_BYTES, settings.MODEL_CACHE_TTL)
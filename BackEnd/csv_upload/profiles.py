@@ -0,0 +1,74 @@
+import threading
+
+import pandas as pd
+
+from .sketches import ColumnSketch
+
+
+def coerce_numeric(series):
+    """
+    The column as numbers when every value parses as one, otherwise the
+    column unchanged (what `pd.to_numeric(errors='ignore')` used to do).
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series
+    try:
+        return pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return series
+
+
+class ColumnProfiles:
+    """
+    Per-frame memo of the per-column work analyze_frame does: numeric
+    coercion, type, null mask, string form and summary stats. A batch of
+    analyses over the same frame computes each of these once per column.
+    """
+
+    def __init__(self, df):
+        self.df = df
+        self._memo = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind, col, compute):
+        key = (kind, col)
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        value = compute()
+        with self._lock:
+            return self._memo.setdefault(key, value)
+
+    def values(self, col):
+        """Column after numeric coercion."""
+        return self._get('values', col, lambda: coerce_numeric(self.df[col]))
+
+    def is_numeric(self, col):
+        return pd.api.types.is_numeric_dtype(self.values(col))
+
+    def notna(self, col):
+        return self._get('notna', col, lambda: self.values(col).notna())
+
+    def as_str(self, col):
+        return self._get('as_str', col, lambda: self.values(col).astype(str))
+
+    def stats(self, col, sketch=None):
+        """
+        The column_stats entry for `col`; estimated from sketches sized
+        by the SketchConfig `sketch` when given.
+        """
+        if sketch is not None:
+            def estimate():
+                summary = ColumnSketch(sketch)
+                summary.update(self.values(col), self.is_numeric(col))
+                return summary.stats(self.is_numeric(col))
+            return self._get(('sketch', sketch), col, estimate)
+
+        def compute():
+            values = self.values(col)
+            return {
+                'type': 'numeric' if self.is_numeric(col) else 'categorical',
+                'unique_values': int(values.nunique()),
+                'null_count': int(len(values) - self.notna(col).sum())
+            }
+        return self._get('stats', col, compute)
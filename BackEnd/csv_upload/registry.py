@@ -0,0 +1,108 @@
+import hashlib
+import re
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.exceptions import BadRequest
+
+from .cache import LRUCache
+from .columnar import ColumnStore
+
+
+Dataset = namedtuple('Dataset', ['dataset_id', 'df', 'file_type', 'name'])
+
+DATASET_ID_RE = re.compile(r'[0-9a-f]{64}')
+
+
+def content_hash(data_source):
+    """
+    SHA-256 of an uploaded file, raw bytes or a JSON string.
+    File-like objects are rewound so they can be parsed afterwards.
+    """
+    digest = hashlib.sha256()
+    if hasattr(data_source, 'chunks'):
+        for chunk in data_source.chunks():
+            digest.update(chunk)
+        data_source.seek(0)
+    elif hasattr(data_source, 'read'):
+        for chunk in iter(lambda: data_source.read(1 << 20), b''):
+            digest.update(chunk)
+        data_source.seek(0)
+    else:
+        if isinstance(data_source, str):
+            data_source = data_source.encode('utf-8')
+        digest.update(data_source)
+    return digest.hexdigest()
+
+
+def frame_nbytes(dataset):
+    return int(dataset.df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetRegistry:
+    """
+    Parsed datasets kept under their content hash, so a file is uploaded
+    and parsed once and every chart afterwards only sends its
+    `dataset_id`. Recently used frames stay in memory (least recently
+    used dropped once the byte budget is exceeded); every dataset is also
+    written to a columnar store on disk, shared by all workers, from
+    which single columns can be memory-mapped.
+    """
+
+    def __init__(self, max_bytes, store):
+        self._cache = LRUCache(max_bytes, sizeof=frame_nbytes)
+        self.store = store
+
+    def put(self, dataset_id, df, file_type, name=''):
+        dataset = Dataset(dataset_id, df, file_type, name)
+        self._cache.put(dataset_id, dataset)
+        self.store.write(dataset_id, df, file_type, name)
+        return dataset
+
+    def describe(self, dataset_id):
+        """
+        (file_type, name, rows, column names) of a known dataset, or None.
+        """
+        dataset = self._cache.get(dataset_id)
+        if dataset is not None:
+            return dataset.file_type, dataset.name, len(dataset.df), list(dataset.df.columns)
+        manifest = self.store.manifest(dataset_id)
+        if manifest is None:
+            return None
+        return (manifest['file_type'], manifest['name'], manifest['rows'],
+                [c['name'] for c in manifest['columns']])
+
+    def load(self, dataset_id, columns=None):
+        """
+        Dataset restricted to `columns` (all columns when None).
+        Served from memory when possible, otherwise only the requested
+        columns are memory-mapped from the column store.
+        Returns None for unknown ids.
+        """
+        if not DATASET_ID_RE.fullmatch(dataset_id):
+            return None
+
+        info = self.describe(dataset_id)
+        if info is None:
+            return None
+        file_type, name, _, available = info
+        if columns is not None:
+            columns = list(dict.fromkeys(columns))
+            for c in columns:
+                if c not in available:
+                    raise BadRequest(f'Column "{c}" not found. Available: {available}')
+
+        dataset = self._cache.get(dataset_id)
+        if dataset is not None:
+            df = dataset.df if columns is None else dataset.df[columns]
+        else:
+            df = self.store.read(dataset_id, columns)
+            if df is None:
+                return None
+        return Dataset(dataset_id, df, file_type, name)
+
+
+registry = DatasetRegistry(
+    settings.DATASET_REGISTRY_MAX_BYTES,
+    ColumnStore(settings.DATASET_CACHE_ROOT, settings.DATASET_CACHE_MAX_BYTES),
+)
@@ -0,0 +1,179 @@
+"""
+JSON encoding for analysis payloads.
+
+Payloads may hold NumPy arrays and pandas Series directly, so large
+columns are never turned into lists of Python floats first. NaN and
+infinities are always written as null. orjson is used when installed;
+otherwise arrays are formatted in bulk by a small hand-rolled encoder.
+Big payloads are streamed in chunks with StreamingHttpResponse.
+"""
+import datetime
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+
+from .metrics import stage
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+CHUNK_ITEMS = 65536
+
+
+def clean_object_array(arr):
+    """Object array as a list with NaN/None/NaT as None."""
+    arr = np.asarray(arr, dtype=object)
+    return [None if missing else to_native(v) for v, missing in zip(arr.tolist(), pd.isna(arr))]
+
+
+def to_native(value):
+    """Plain Python stand-in for values the encoders do not handle."""
+    if value is pd.NaT:
+        return None
+    if isinstance(value, pd.Series):
+        return value.to_numpy()
+    if isinstance(value, np.ndarray):
+        return clean_object_array(value)
+    if isinstance(value, np.datetime64):
+        return None if np.isnat(value) else str(value)
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (pd.Timestamp, datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+def orjson_native(dtype):
+    """
+    Whether orjson's own NumPy output for `dtype` matches encode_array's:
+    it writes datetime64 (NaT included) as full timestamps and float32 at
+    float32 precision, so those go through the fallback encoder.
+    """
+    kind = getattr(dtype, 'kind', 'O')
+    return kind not in 'mM' and not (kind == 'f' and dtype.itemsize != 8)
+
+
+def orjson_safe(value):
+    """True when no array or NumPy scalar in the payload needs the fallback encoder."""
+    if isinstance(value, dict):
+        return all(orjson_safe(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return all(orjson_safe(v) for v in value)
+    if isinstance(value, (np.ndarray, np.generic, pd.Series)):
+        return orjson_native(value.dtype)
+    return True
+
+
+def orjson_default(value):
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        # strided slices and ndarray subclasses such as np.memmap
+        arr = np.ascontiguousarray(value)
+        if arr is not value:
+            return arr
+    native = to_native(value)
+    if native is value:
+        if isinstance(value, (set, frozenset)):
+            return list(value)
+        return str(value)
+    return native
+
+
+def encode_array(arr):
+    """One 1-D array as JSON bytes (with brackets)."""
+    if orjson is not None and arr.dtype != object and orjson_native(arr.dtype):
+        try:
+            return orjson.dumps(np.ascontiguousarray(arr), option=orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            pass  # dtype orjson does not support natively
+
+    if arr.dtype.kind == 'f':
+        # repr() of a float is valid JSON apart from the non-finite values
+        text = ','.join(map(repr, arr.astype(np.float64).tolist()))
+        text = text.replace('nan', 'null').replace('-inf', 'null').replace('inf', 'null')
+        return f'[{text}]'.encode()
+    if arr.dtype.kind in 'biu':
+        return json.dumps(arr.tolist(), separators=(',', ':')).encode()
+    if arr.dtype.kind == 'M':
+        text = np.datetime_as_string(arr).tolist()
+        return json.dumps([None if t == 'NaT' else t for t in text], separators=(',', ':')).encode()
+    return json.dumps(clean_object_array(arr), default=str, separators=(',', ':')).encode()
+
+
+def iter_encode(value):
+    """Yield the JSON encoding of `value` piece by piece."""
+    if isinstance(value, pd.Series):
+        value = value.to_numpy()
+
+    if isinstance(value, dict):
+        yield b'{'
+        for i, (key, item) in enumerate(value.items()):
+            key = to_native(key)
+            yield (b',' if i else b'') + json.dumps(key if isinstance(key, str) else str(key)).encode() + b':'
+            yield from iter_encode(item)
+        yield b'}'
+
+    elif isinstance(value, np.ndarray):
+        value = value.ravel()
+        yield b'['
+        for start in range(0, len(value), CHUNK_ITEMS):
+            yield (b',' if start else b'') + encode_array(value[start:start + CHUNK_ITEMS])[1:-1]
+        yield b']'
+
+    elif isinstance(value, (list, tuple)):
+        yield b'['
+        for i, item in enumerate(value):
+            if i:
+                yield b','
+            yield from iter_encode(item)
+        yield b']'
+
+    else:
+        yield json.dumps(to_native(value), default=str).encode()
+
+
+def dumps(payload):
+    """Whole payload as JSON bytes."""
+    if orjson is not None and orjson_safe(payload):
+        try:
+            return orjson.dumps(
+                payload,
+                default=orjson_default,
+                option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            pass  # e.g. a dtype orjson does not support
+    return b''.join(iter_encode(payload))
+
+
+def count_items(value):
+    """Rough number of scalars in a payload, to decide on streaming."""
+    if isinstance(value, dict):
+        return sum(count_items(v) for v in value.values())
+    if isinstance(value, (np.ndarray, pd.Series)):
+        return value.size
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return 1
+
+
+def json_response(payload, status=200):
+    """
+    HttpResponse for an analysis payload, streamed when it holds more
+    than STREAMING_JSON_MIN_ITEMS values.
+    """
+    if count_items(payload) >= settings.STREAMING_JSON_MIN_ITEMS:
+        return StreamingHttpResponse(
+            iter_encode(payload), status=status, content_type='application/json'
+        )
+    with stage('json_encode'):
+        body = dumps(payload)
+    return HttpResponse(body, status=status, content_type='application/json')
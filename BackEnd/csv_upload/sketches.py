@@ -0,0 +1,235 @@
+"""
+Mergeable sketches for approximate=true analyses.
+
+Distinct counts use HyperLogLog, pie charts a Misra-Gries heavy-hitters
+summary with an "Other" bucket, and numeric columns a KLL-style
+quantile sketch. Each one has a fixed memory footprint set by
+SketchConfig, updates from whole NumPy arrays at a time and merges with
+another sketch of the same configuration, so in-memory frames and
+streamed chunks are summarised the same way.
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+
+OTHER_LABEL = 'Other'
+BLOCK_ROWS = 1 << 20
+QUANTILES = {'min': 0.0, 'q1': 0.25, 'median': 0.5, 'q3': 0.75, 'max': 1.0}
+
+
+class SketchConfig(namedtuple('SketchConfig', ['hll_precision', 'top_k', 'quantile_k', 'pie_slices'])):
+    """Sizes of the sketches used for one analysis."""
+
+    @classmethod
+    def from_error(cls, error, pie_slices):
+        """
+        Sketch sizes for a target relative error: HLL standard error
+        1.04 / sqrt(2**p), heavy-hitter counts within error * N, and
+        quantile ranks within about error * N.
+        """
+        precision = min(max(math.ceil(math.log2((1.04 / error) ** 2)), 4), 18)
+        capacity = max(math.ceil(1 / error), pie_slices)
+        return cls(precision, capacity, max(math.ceil(2 / error), 16), pie_slices)
+
+    def describe(self):
+        return {
+            'distinct_relative_error': 1.04 / math.sqrt(1 << self.hll_precision),
+            'heavy_hitter_counters': self.top_k,
+            'quantile_k': self.quantile_k,
+        }
+
+
+def hash_values(values):
+    """64-bit hashes; numbers are hashed as float64 so 1 and 1.0 agree."""
+    values = np.asarray(values)
+    if values.dtype.kind in 'biuf':
+        values = values.astype(np.float64)
+    return pd.util.hash_array(values)
+
+
+def bit_length(values):
+    """Number of significant bits of each uint64."""
+    values = values.copy()
+    length = np.zeros(len(values), dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        big = values >= (np.uint64(1) << np.uint64(shift))
+        length[big] += shift
+        values[big] >>= np.uint64(shift)
+    return length + (values > 0)
+
+
+class HyperLogLog:
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def update(self, values):
+        if not len(values):
+            return
+        h = hash_values(values)
+        p = np.uint64(self.precision)
+        idx = (h >> (np.uint64(64) - p)).astype(np.intp)
+        rest = h & ((np.uint64(1) << (np.uint64(64) - p)) - np.uint64(1))
+        # position of the leftmost 1-bit in the remaining 64 - p bits
+        rank = (64 - self.precision) - bit_length(rest).astype(np.int64) + 1
+        np.maximum.at(self.registers, idx, rank.astype(np.uint8))
+
+    def merge(self, other):
+        merged = HyperLogLog(self.precision)
+        merged.registers = np.maximum(self.registers, other.registers)
+        return merged
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int64)).sum()
+        zeros = int((self.registers == 0).sum())
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small sets
+        return int(round(estimate))
+
+
+class TopK:
+    """
+    Misra-Gries heavy hitters with `capacity` counters. Every reported
+    count is at most `max_error` below the true one.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype=np.int64)
+        self.total = 0
+        self.max_error = 0
+
+    def update(self, values):
+        values = pd.Series(values)
+        for start in range(0, len(values), BLOCK_ROWS):
+            block = values.iloc[start:start + BLOCK_ROWS].value_counts()
+            self.total += int(block.sum())
+            self._absorb(block)
+
+    def merge(self, other):
+        merged = TopK(self.capacity)
+        merged.counts, merged.total = self.counts, self.total + other.total
+        merged.max_error = self.max_error + other.max_error
+        merged._absorb(other.counts)
+        return merged
+
+    def _absorb(self, counts):
+        counts = self.counts.add(counts, fill_value=0) if len(self.counts) else counts
+        if len(counts) > self.capacity:
+            cut = int(counts.nlargest(self.capacity + 1).iloc[-1])
+            counts = counts[counts > cut] - cut
+            self.max_error += cut
+        self.counts = counts.astype(np.int64)
+
+    def pie(self, slices):
+        """Pie labels/values: the `slices` largest values plus an Other bucket."""
+        top = self.counts.sort_values(ascending=False, kind='stable').iloc[:slices]
+        labels = top.index.to_numpy(dtype=object)
+        values = top.to_numpy()
+        other = self.total - int(values.sum())
+        if other > 0:
+            labels = np.append(labels, OTHER_LABEL)
+            values = np.append(values, other)
+        return {'labels': labels, 'values': values, 'max_count_error': self.max_error}
+
+
+class QuantileSketch:
+    """
+    KLL-style compactor stack: level h holds items of weight 2**h and is
+    halved (every other sorted item, random offset) into level h + 1 once
+    it holds more than k items.
+    """
+
+    def __init__(self, k=200, seed=0):
+        self.k = k
+        self.levels = [np.empty(0)]
+        self.rng = np.random.default_rng(seed)
+        self.min, self.max = np.inf, -np.inf
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if len(values):
+            self.min, self.max = min(self.min, values.min()), max(self.max, values.max())
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compact()
+
+    def merge(self, other):
+        merged = QuantileSketch(self.k)
+        merged.min, merged.max = min(self.min, other.min), max(self.max, other.max)
+        depth = max(len(self.levels), len(other.levels))
+        merged.levels = [
+            np.concatenate([
+                self.levels[h] if h < len(self.levels) else np.empty(0),
+                other.levels[h] if h < len(other.levels) else np.empty(0),
+            ])
+            for h in range(depth)
+        ]
+        merged._compact()
+        return merged
+
+    def _compact(self):
+        h = 0
+        while h < len(self.levels):
+            level = self.levels[h]
+            if len(level) > self.k:
+                level = np.sort(level)
+                keep = level[-1:] if len(level) % 2 else level[:0]
+                body = level[:len(level) - len(keep)]
+                promoted = body[self.rng.integers(2)::2]
+                if h + 1 == len(self.levels):
+                    self.levels.append(np.empty(0))
+                self.levels[h + 1] = np.concatenate([self.levels[h + 1], promoted])
+                self.levels[h] = keep
+            h += 1
+
+    @property
+    def count(self):
+        return int(sum(len(level) << h for h, level in enumerate(self.levels)))
+
+    def quantiles(self, qs):
+        """Approximate values at the given quantiles; 0 and 1 are exact."""
+        items = np.concatenate(self.levels)
+        if not len(items):
+            return [None] * len(qs)
+        weights = np.concatenate([np.full(len(level), 1 << h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='stable')
+        items, cum = items[order], np.cumsum(weights[order])
+        qs = np.asarray(qs, dtype=np.float64)
+        values = items[np.searchsorted(cum, qs * (cum[-1] - 1), side='right')]
+        values = np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, values))
+        return np.clip(values, self.min, self.max).tolist()
+
+
+class ColumnSketch:
+    """Approximate column_stats entry: HLL distinct count, exact nulls, quantiles."""
+
+    def __init__(self, config):
+        self.config = config
+        self.null_count = 0
+        self.distinct = HyperLogLog(config.hll_precision)
+        self.quantiles = QuantileSketch(config.quantile_k)
+
+    def update(self, series, numeric):
+        values = series.dropna().to_numpy()
+        self.null_count += len(series) - len(values)
+        self.distinct.update(values)
+        if numeric:
+            self.quantiles.update(values)
+
+    def stats(self, numeric):
+        stats = {
+            'type': 'numeric' if numeric else 'categorical',
+            'unique_values': self.distinct.count(),
+            'null_count': int(self.null_count),
+            'approximate': True
+        }
+        if numeric:
+            stats['quantiles'] = dict(zip(QUANTILES, self.quantiles.quantiles(list(QUANTILES.values()))))
+        return stats
@@ -0,0 +1,62 @@
+"""
+Reproducible synthetic datasets for benchmarking the analysis views.
+
+Columns are num_0, num_1, ... (floats) and cat_0, cat_1, ... (labels
+drawn from `cardinality` values with Zipf-like frequencies, as real
+category columns tend to be skewed). num_1 is correlated with num_0 and
+the mean of num_0 shifts with cat_0, so the regression and group tests
+have something to find. Each column gets about `null_ratio` missing
+values. Rows are generated in chunks from one seeded generator: the same
+arguments always give the same data.
+"""
+import numpy as np
+import pandas as pd
+
+
+CHUNK_ROWS = 1_000_000
+
+
+def category_labels(column, cardinality):
+    return [f'c{column}_{k}' for k in range(cardinality)]
+
+
+def iter_frames(rows, numeric=2, categorical=2, cardinality=20, null_ratio=0.0, seed=0,
+                chunk_rows=CHUNK_ROWS):
+    """Yield the dataset as DataFrames of up to chunk_rows rows."""
+    rng = np.random.default_rng(seed)
+    weights = 1 / np.arange(1, cardinality + 1)
+    weights /= weights.sum()
+    labels = [category_labels(j, cardinality) for j in range(categorical)]
+
+    for start in range(0, rows, chunk_rows):
+        n = min(chunk_rows, rows - start)
+        codes = [rng.choice(cardinality, size=n, p=weights) for _ in range(categorical)]
+        values = [rng.normal(size=n) for _ in range(numeric)]
+        if numeric and categorical:
+            values[0] += codes[0] * (2.0 / cardinality)
+        if numeric > 1:
+            values[1] = 0.8 * values[0] + 0.6 * values[1]
+
+        columns = {}
+        for i, column in enumerate(values):
+            if null_ratio:
+                column[rng.random(n) < null_ratio] = np.nan
+            columns[f'num_{i}'] = column
+        for j, column in enumerate(codes):
+            if null_ratio:
+                column[rng.random(n) < null_ratio] = -1
+            columns[f'cat_{j}'] = pd.Categorical.from_codes(column, labels[j])
+        yield pd.DataFrame(columns)
+
+
+def make_frame(rows, **kwargs):
+    """The whole dataset as one DataFrame (see iter_frames for the arguments)."""
+    return pd.concat(iter_frames(rows, **kwargs), ignore_index=True)
+
+
+def write_csv(path, rows, **kwargs):
+    """Write the dataset to `path` chunk by chunk; returns the file size in bytes."""
+    with open(path, 'w', newline='') as f:
+        for i, chunk in enumerate(iter_frames(rows, **kwargs)):
+            chunk.to_csv(f, index=False, header=(i == 0))
+        return f.tell()
@@ -1,3 +1,1069 @@
-from django.test import TestCase
+import codecs
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.core.exceptions import BadRequest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import Client, SimpleTestCase, override_settings
+from scipy.stats import f_oneway, linregress, pointbiserialr, t as student_t
+
+from .columnar import ColumnStore
+from .fetch import JsonFetcher, pooled_session
+from .downsample import density_sample, lttb, sample_line, sample_scatter, stratified
+from .fast_models import StreamingFit, fit_fast, fit_polynomial
+from .formulas import compile_formula, evaluate, parse
+from .grouping import GroupStats
+from .jobs import JobQueue
+from .metrics import Metrics, collect, stage
+from .json_ingest import JsonStream, is_ndjson, iter_array, read_json
+from .registry import DatasetRegistry, content_hash
+from .serializers import CHUNK_ITEMS, dumps, iter_encode, json_response
+from .sketches import HyperLogLog, QuantileSketch, SketchConfig, TopK
+
+
+SAMPLE_CSV = (
+    'num,other,cat,flag\n'
+    + ''.join(f'{i * 0.5},{(i * 7) % 11 + 0.25},{"abc"[i % 3]},{"yn"[i % 2]}\n' for i in range(60))
+).encode()
+
+
+def payload(response):
+    """JSON body of a plain or streamed response."""
+    if response.streaming:
+        return json.loads(b''.join(response.streaming_content))
+    return response.json()
+
+
+def upload(name='data.csv', content=SAMPLE_CSV):
+    return SimpleUploadedFile(name, content, content_type='text/csv')
+
+
+class TempRegistryMixin:
+    """Points the views at a dataset registry in a scratch directory."""
+
+    def setUp(self):
+        super().setUp()
+        self.dataset_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dataset_root)
+        self.registry = DatasetRegistry(10**8, ColumnStore(self.dataset_root))
+        patcher = mock.patch('csv_upload.views.registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+FEED = json.dumps({'a': [1, 2, 3], 'b': ['x', 'y', 'z']}).encode()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the JSON feeds analyze_data fetches."""
+
+    hits = {}
+
+    def log_message(self, *args):
+        pass
+
+    def send_body(self, body, content_type='application/json', headers=None, length=True):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        if length:
+            self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client gave up (timeout and size cap tests)
+
+    def redirect(self, location):
+        self.send_response(302)
+        self.send_header('Location', location)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        FeedHandler.hits[self.path] = FeedHandler.hits.get(self.path, 0) + 1
+        if self.path == '/feed.json':
+            if self.headers.get('If-None-Match') == '"v1"':
+                self.send_response(304)
+                self.end_headers()
+            else:
+                self.send_body(FEED, headers={'ETag': '"v1"'})
+        elif self.path == '/big.json':
+            self.send_body(b'[' + b'1,' * 1000 + b'1]')
+        elif self.path == '/big-unsized.json':
+            # no Content-Length: the cap has to hold while streaming
+            self.send_body(b'[' + b'1,' * 1000 + b'1]', length=False)
+        elif self.path == '/slow.json':
+            time.sleep(1)
+            self.send_body(FEED)
+        elif self.path == '/page':
+            self.send_body(b'<html>Not found</html>', content_type='text/html; charset=utf-8')
+        elif self.path == '/raw.json':
+            self.send_body(FEED, content_type='text/plain; charset=utf-8')
+        elif self.path == '/moved':
+            self.redirect('/feed.json')
+        elif self.path == '/loop':
+            self.redirect('/loop')
+        else:
+            self.send_error(404)
+
+
+class DatasetRegistryTests(TempRegistryMixin, SimpleTestCase):
+
+    pairs = [('pie', 'cat', ''), ('relationship', 'num', 'other'), ('relationship', 'num', 'cat'),
+             ('relationship', 'cat', 'other'), ('relationship', 'cat', 'flag')]
+
+    def upload_dataset(self):
+        response = Client().post('/api/csv/datasets/', {'file': upload()})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def analyze(self, output_type, col1, col2, **source):
+        response = Client().post('/api/csv/upload-csv/', dict(
+            source, output_type=output_type, target_column1=col1, target_column2=col2,
+            model_tier='fast'
+        ))
+        return response.status_code, payload(response)
+
+    def test_content_hash(self):
+        expected = content_hash(SAMPLE_CSV)
+        f = io.BytesIO(SAMPLE_CSV)
+        self.assertEqual(content_hash(f), expected)
+        self.assertEqual(f.read(), SAMPLE_CSV)  # rewound for parsing
+        self.assertEqual(content_hash(upload()), expected)
+        self.assertEqual(content_hash('{"a": 1}'), content_hash(b'{"a": 1}'))
+        self.assertNotEqual(content_hash(SAMPLE_CSV + b'1,2,a,y\n'), expected)
+
+    def test_reupload_returns_same_id(self):
+        first = self.upload_dataset()
+        self.assertEqual(first['dataset_id'], content_hash(SAMPLE_CSV))
+        self.assertEqual((first['created'], first['rows']), (True, 60))
+        self.assertEqual(first['column_names'], ['num', 'other', 'cat', 'flag'])
+        second = self.upload_dataset()
+        self.assertEqual(second['dataset_id'], first['dataset_id'])
+        self.assertFalse(second['created'])
+
+    def test_analysis_by_id_matches_upload(self):
+        dataset_id = self.upload_dataset()['dataset_id']
+        for pair in self.pairs:
+            with self.subTest(pair=pair):
+                expected = self.analyze(*pair, file=upload())
+                self.assertEqual(expected[0], 200)
+                self.assertEqual(self.analyze(*pair, dataset_id=dataset_id), expected)
+
+    def test_analysis_from_column_store(self):
+        dataset_id = self.upload_dataset()['dataset_id']
+        self.registry._cache.clear()  # as in a worker that did not parse it
+        for pair in self.pairs:
+            with self.subTest(pair=pair):
+                self.assertEqual(self.analyze(*pair, dataset_id=dataset_id),
+                                 self.analyze(*pair, file=upload()))
+
+    def test_unknown_or_malformed_id(self):
+        for dataset_id in ['f' * 64, 'not-a-dataset', '../' + 'a' * 61]:
+            with self.subTest(dataset_id=dataset_id):
+                status, body = self.analyze('pie', 'cat', '', dataset_id=dataset_id)
+                self.assertEqual(status, 404)
+                self.assertIn('Upload the dataset again', body['error'])
+
+    def test_unknown_column(self):
+        dataset_id = self.upload_dataset()['dataset_id']
+        status, body = self.analyze('pie', 'missing', '', dataset_id=dataset_id)
+        self.assertEqual(status, 400)
+        self.assertIn("['num', 'other', 'cat', 'flag']", body['error'])
+
+
+class BatchTests(TempRegistryMixin, SimpleTestCase):
+
+    specs = [
+        {'output_type': 'pie', 'target_column1': 'cat'},
+        {'target_column1': 'num', 'target_column2': 'other', 'model_tier': 'fast'},
+        {'target_column1': 'num', 'target_column2': 'cat', 'max_points': '20'},
+        {'target_column1': 'cat', 'target_column2': 'other'},
+        {'target_column1': 'cat', 'target_column2': 'flag', 'approximate': 'true'},
+    ]
+
+    def batch(self, specs, **source):
+        response = Client().post('/api/csv/batch/', dict(source, specs=json.dumps(specs)))
+        return response.status_code, payload(response)
+
+    def single(self, spec, **source):
+        response = Client().post('/api/csv/upload-csv/', dict(source, **spec))
+        self.assertEqual(response.status_code, 200)
+        return payload(response)
+
+    def test_matches_single_analyses(self):
+        dataset_id = Client().post('/api/csv/datasets/', {'file': upload()}).json()['dataset_id']
+        # a fresh upload per request: the view closes the file it was given
+        for source in (lambda: {'file': upload()}, lambda: {'dataset_id': dataset_id}):
+            with self.subTest(source=list(source())):
+                status, body = self.batch(self.specs, **source())
+                self.assertEqual(status, 200)
+                self.assertEqual(len(body['results']), len(self.specs))
+                for spec, result in zip(self.specs, body['results']):
+                    self.assertEqual(result, self.single(spec, **source()))
+
+    def test_unknown_column_lists_full_header(self):
+        json_rows = json.dumps([{'num': 1.5, 'other': 2, 'cat': 'a', 'flag': 'y'}] * 3)
+        for source in ({'file': upload()}, {'json_data': json_rows}):
+            with self.subTest(source=list(source)):
+                status, body = self.batch([self.specs[0], {'target_column1': 'num', 'target_column2': 'missing'}],
+                                          **source)
+                self.assertEqual(status, 200)
+                self.assertEqual(body['results'][0]['status'], 'success')
+                error = body['results'][1]
+                self.assertEqual((error['status'], error['status_code']), ('error', 400))
+                self.assertIn('"missing" not found', error['error'])
+                self.assertIn("['num', 'other', 'cat', 'flag']", error['error'])
+
+    def test_invalid_specs(self):
+        for specs in ([], {'target_column1': 'a'}, ['a'], [self.specs[0]] * 1000):
+            with self.subTest(specs=str(specs)[:40]):
+                self.assertEqual(self.batch(specs, file=upload())[0], 400)
+
+
+class ColumnStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.store = ColumnStore(self.root)
+
+    def test_round_trip(self):
+        df = pd.DataFrame({
+            'int': np.arange(6, dtype=np.int64),
+            'float': [0.5, np.nan, -1.25, np.inf, 3.0, np.nan],
+            'flag': [True, False, True, True, False, False],
+            'when': pd.to_datetime(['2024-01-01', None, '2024-03-01', '2024-04-01', None, '2024-06-30']),
+            'text': ['b', 'a', None, 'b', np.nan, 'c'],
+            'mixed': [1, 'x', 2.5, None, 'x', 1],
+        })
+        self.assertTrue(self.store.write('d1', df, 'csv', 'data.csv'))
+
+        # text comes back dictionary-encoded, categories in order of appearance
+        expected = df.assign(
+            text=pd.Categorical(df['text'], categories=['b', 'a', 'c']),
+            mixed=pd.Categorical(df['mixed'], categories=[1, 'x', 2.5]),
+        )
+        loaded = self.store.read('d1')
+        self.assertIsInstance(loaded['float'].values, np.memmap)
+        # copy() swaps the memory maps for plain arrays, which assert_frame_equal expects
+        pd.testing.assert_frame_equal(loaded.copy(), expected)
+        pd.testing.assert_frame_equal(self.store.read('d1', ['text', 'float']).copy(),
+                                      expected[['text', 'float']])
+
+        manifest = self.store.manifest('d1')
+        self.assertEqual((manifest['file_type'], manifest['name'], manifest['rows']), ('csv', 'data.csv', 6))
+        self.assertEqual([c['kind'] for c in manifest['columns']],
+                         ['numpy'] * 4 + ['category'] * 2)
+        self.assertEqual([n for n in os.listdir(self.root) if n.startswith('.tmp-')], [])
+
+    def test_unknown_dataset(self):
+        self.assertIsNone(self.store.manifest('missing'))
+        self.assertIsNone(self.store.read('missing'))
+
+    def test_prune_evicts_least_recently_read(self):
+        df = pd.DataFrame({'x': np.arange(1000.0)})
+        self.store.write('old', df, 'csv')
+        size = sum(os.path.getsize(self.store.path('old', f)) for f in os.listdir(self.store.path('old')))
+        self.store.write('recent', df, 'csv')
+        os.utime(self.store.path('old', 'manifest.json'), (1, 1))
+        os.utime(self.store.path('recent', 'manifest.json'), (2, 2))
+
+        self.store.max_bytes = int(2.5 * size)
+        self.store.write('new', df, 'csv')
+        self.assertEqual(sorted(os.listdir(self.root)), ['new', 'recent'])
+
+        # reading refreshes a dataset, so the other one goes next
+        os.utime(self.store.path('new', 'manifest.json'), (3, 3))
+        self.store.read('recent')
+        self.store.write('newer', df, 'csv')
+        self.assertEqual(sorted(os.listdir(self.root)), ['newer', 'recent'])
+
+
+def streaming_csv(rows=5000, seed=5):
+    rng = np.random.default_rng(seed)
+    cat = rng.choice(['a', 'b', 'c', 'd'], size=rows, p=[0.4, 0.3, 0.2, 0.1])
+    num = rng.normal(size=rows) + (cat == 'b')
+    df = pd.DataFrame({
+        'num': num,
+        'other': 2 * num + rng.normal(size=rows),
+        'cat': cat,
+        'grp': rng.choice(['x', 'y', 'z'], size=rows),
+        # numeric for the first chunks, text near the end of the file
+        'late': np.round(rng.normal(size=rows), 1).astype(object),
+    })
+    df.loc[rng.random(rows) < 0.05, 'num'] = np.nan
+    df.loc[rng.random(rows) < 0.05, 'cat'] = None
+    df.loc[rows - 10, 'late'] = 'unknown'
+    return df.to_csv(index=False).encode()
+
+
+@override_settings(STREAMING_CHUNK_ROWS=1000)
+class StreamingParityTests(SimpleTestCase):
+    """analyze_data with streaming=true against the in-memory analysis of the same CSV."""
+
+    data = streaming_csv()
+    pairs = [('relationship', 'num', 'other'), ('relationship', 'num', 'cat'),
+             ('relationship', 'cat', 'other'), ('relationship', 'cat', 'grp'),
+             ('relationship', 'late', 'num'), ('pie', 'cat', '')]
+
+    def analyze(self, output_type, col1, col2, **fields):
+        response = Client().post('/api/csv/upload-csv/', dict(
+            fields, file=upload(content=self.data), output_type=output_type,
+            target_column1=col1, target_column2=col2, model_tier='fast'
+        ))
+        self.assertEqual(response.status_code, 200)
+        return payload(response)
+
+    def assertClose(self, streamed, expected, path='payload'):
+        if isinstance(expected, dict):
+            self.assertEqual(sorted(streamed), sorted(expected), path)
+            for key in expected:
+                self.assertClose(streamed[key], expected[key], f'{path}.{key}')
+        elif isinstance(expected, list):
+            self.assertEqual(len(streamed), len(expected), path)
+            for i, (a, b) in enumerate(zip(streamed, expected)):
+                self.assertClose(a, b, f'{path}[{i}]')
+        elif isinstance(expected, float):
+            self.assertAlmostEqual(streamed, expected, places=8, msg=path)
+        else:
+            self.assertEqual(streamed, expected, path)
+
+    def test_statistics_match_in_memory_analysis(self):
+        for pair in self.pairs:
+            with self.subTest(pair=pair):
+                expected = self.analyze(*pair)
+                streamed = self.analyze(*pair, streaming='true')
+                for key in ('output_type', 'relationship_type', 'correlation', 'column_stats',
+                            'statistical_tests'):
+                    self.assertClose(streamed.get(key), expected.get(key), key)
+                if pair[0] == 'pie':
+                    self.assertEqual(dict(zip(*streamed['plot_data'].values())),
+                                     dict(zip(*expected['plot_data'].values())))
+                elif 'group_means' in expected['plot_data']:
+                    self.assertClose(streamed['plot_data']['group_means'],
+                                     expected['plot_data']['group_means'], 'group_means')
+
+    def test_column_turning_to_text(self):
+        streamed = self.analyze('relationship', 'late', 'num', streaming='true')
+        self.assertEqual(streamed['relationship_type'], 'categorical-numeric')
+        self.assertEqual(streamed['column_stats']['late']['type'], 'categorical')
+        self.assertIn('unknown', streamed['plot_data']['group_means'])
+
+    def test_trend_line_matches(self):
+        expected = self.analyze('relationship', 'num', 'other')
+        streamed = self.analyze('relationship', 'num', 'other', streaming='true')
+        self.assertIsNone(streamed['sampling'])  # every row fits in the sample
+        self.assertClose(streamed['model_performance'], expected['model_performance'])
+
+
+class JobQueueTests(SimpleTestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.pool = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.pool.shutdown)
+        self.jobs = JobQueue(lambda: self.pool, self.root, ttl=60)
+
+    def wait(self, job_id):
+        for _ in range(200):
+            state = self.jobs.status(job_id)
+            if state['status'] in ('done', 'failed'):
+                return state
+            time.sleep(0.01)
+        self.fail(f'job {job_id} did not finish')
+
+    def test_status_transitions(self):
+        started, release = threading.Event(), threading.Event()
+
+        def work(report, value):
+            report('halfway', 0.5)
+            started.set()
+            release.wait(5)
+            return {'value': value}
+
+        first = self.jobs.submit(work, 1, meta={'filename': 'x.csv'})
+        second = self.jobs.submit(work, 2)  # waits for the single worker
+        self.assertTrue(started.wait(5))
+        state = self.jobs.status(first)
+        self.assertEqual((state['status'], state['stage'], state['progress']), ('running', 'halfway', 0.5))
+        self.assertEqual(state['filename'], 'x.csv')
+        self.assertEqual(self.jobs.status(second)['status'], 'queued')
+
+        release.set()
+        for job_id, value in ((first, 1), (second, 2)):
+            state = self.wait(job_id)
+            self.assertEqual((state['status'], state['progress']), ('done', 1.0))
+            self.assertEqual(state['result'], {'value': value})
+            self.assertGreaterEqual(state['finished_at'], state['submitted_at'])
+
+    def test_failures(self):
+        def bad_input(report):
+            raise BadRequest('Column "x" not found')
+
+        def crash(report):
+            raise RuntimeError('boom')
+
+        state = self.wait(self.jobs.submit(bad_input))
+        self.assertEqual((state['status'], state['status_code']), ('failed', 400))
+        self.assertEqual(state['error'], 'Column "x" not found')
+        with self.assertLogs(level='ERROR'):
+            state = self.wait(self.jobs.submit(crash))
+        self.assertEqual((state['status'], state['status_code'], state['error']), ('failed', 500, 'boom'))
+
+    def test_bytes_result_written_to_file(self):
+        job_id = self.jobs.submit(lambda report: b'%PDF-1.4 report')
+        state = self.wait(job_id)
+        self.assertTrue(state['result_file'])
+        self.assertNotIn('result', state)
+        with open(self.jobs.result_path(job_id), 'rb') as f:
+            self.assertEqual(f.read(), b'%PDF-1.4 report')
+
+    def test_expired_jobs_pruned(self):
+        old = self.jobs.submit(lambda report: b'old')
+        self.wait(old)
+        for path in (self.jobs.state_path(old), self.jobs.result_path(old)):
+            os.utime(path, (time.time() - 120,) * 2)
+        recent = self.jobs.submit(lambda report: 'recent')  # submitting prunes
+        self.assertIsNone(self.jobs.status(old))
+        self.assertFalse(os.path.exists(self.jobs.result_path(old)))
+        self.assertEqual(self.wait(recent)['result'], 'recent')
+
+    def test_unknown_and_malformed_ids(self):
+        self.assertIsNone(self.jobs.status('0' * 32))
+        self.assertIsNone(self.jobs.status('../' + '0' * 29))
+
+
+class FastModelTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(6)
+        # an offset x, so a fit in raw powers of x would be badly conditioned
+        self.x = 1000 + rng.uniform(-5, 5, size=2000)
+        self.y = 0.3 * (self.x - 1000) ** 2 - 2 * self.x + rng.normal(scale=2, size=2000)
+
+    def half_width(self, degree):
+        """95% prediction interval half-widths from numpy.polyfit's (X'X)^-1."""
+        coef, cov = np.polyfit(self.x, self.y, degree, cov='unscaled')
+        X = np.vander(self.x, degree + 1)
+        dof = len(self.x) - degree - 1
+        s2 = ((self.y - X @ coef) ** 2).sum() / dof
+        leverage = np.einsum('ij,jk,ik->i', X, cov, X)
+        return student_t.ppf(0.975, dof) * np.sqrt(s2 * (1 + leverage))
+
+    def test_linear_matches_polyfit_and_linregress(self):
+        fit = fit_polynomial(self.x, self.y, 1)
+        np.testing.assert_allclose(fit.predicted, np.polyval(np.polyfit(self.x, self.y, 1), self.x), rtol=1e-9)
+        self.assertAlmostEqual(fit.metrics['r2'], linregress(self.x, self.y).rvalue ** 2, places=10)
+        np.testing.assert_allclose(fit.upper - fit.predicted, self.half_width(1), rtol=1e-6)
+        np.testing.assert_allclose(fit.predicted - fit.lower, self.half_width(1), rtol=1e-6)
+
+    def test_quadratic_matches_polyfit(self):
+        fit = fit_polynomial(self.x, self.y, 2)
+        np.testing.assert_allclose(fit.predicted, np.polyval(np.polyfit(self.x, self.y, 2), self.x), rtol=1e-9)
+        np.testing.assert_allclose(fit.upper - fit.predicted, self.half_width(2), rtol=1e-6)
+        residuals = self.y - fit.predicted
+        self.assertAlmostEqual(fit.metrics['rmse'], np.sqrt((residuals ** 2).mean()))
+        self.assertAlmostEqual(fit.metrics['mae'], np.abs(residuals).mean())
+
+    def test_fit_fast_model_choice(self):
+        self.assertEqual(fit_fast(self.x, self.y, ['x']).metrics['model_type'], 'OLS linear regression')
+        self.assertEqual(fit_fast(self.x, self.y, ['x', 'x2']).metrics['model_type'], 'OLS quadratic regression')
+        line = 3 * self.x + np.random.default_rng(7).normal(size=len(self.x))
+        self.assertEqual(fit_fast(self.x, line, ['x', 'x2']).metrics['model_type'], 'OLS linear regression')
+
+    def test_streaming_fit_matches_single_fit(self):
+        x_eval = np.linspace(995, 1005, 50)
+        for degree in (1, 2):
+            expected = fit_polynomial(self.x, self.y, degree)
+            for chunk_rows in (2000, 700, 1):
+                with self.subTest(degree=degree, chunk_rows=chunk_rows):
+                    streaming = StreamingFit()
+                    for start in range(0, len(self.x), chunk_rows):
+                        streaming.update(self.x[start:start + chunk_rows], self.y[start:start + chunk_rows])
+                    streaming.update([], [])  # empty chunks are skipped
+                    fit = streaming.fit_polynomial(self.x, degree)
+                    np.testing.assert_allclose(fit.predicted, expected.predicted, rtol=1e-9)
+                    np.testing.assert_allclose(fit.upper, expected.upper, rtol=1e-9)
+                    np.testing.assert_allclose(fit.lower, expected.lower, rtol=1e-9)
+                    self.assertAlmostEqual(fit.metrics['r2'], expected.metrics['r2'], places=9)
+                    self.assertAlmostEqual(fit.metrics['rmse'], expected.metrics['rmse'], places=9)
+                    self.assertAlmostEqual(fit.adj_r2, expected.adj_r2, places=9)
+                    # and at points other than the training rows
+                    np.testing.assert_allclose(
+                        streaming.fit_polynomial(x_eval, degree).predicted,
+                        np.polyval(np.polyfit(self.x, self.y, degree), x_eval), rtol=1e-9
+                    )
+
+        self.assertEqual(streaming.fit(x_eval, ['x', 'x2']).metrics['model_type'], 'OLS quadratic regression')
+
+
+class DownsampleTests(SimpleTestCase):
+
+    def assertIndices(self, idx, n, max_points):
+        self.assertLessEqual(len(idx), max_points)
+        self.assertTrue(np.all(np.diff(idx) > 0))  # sorted, no repeats
+        self.assertTrue(len(idx) == 0 or (idx[0] >= 0 and idx[-1] < n))
+
+    def test_lttb(self):
+        x = np.arange(10_000.0)
+        y = np.sin(x / 300) + (x == 5000) * 50  # one spike
+        for max_points in (3, 10, 100, 1000):
+            with self.subTest(max_points=max_points):
+                idx = lttb(x, y, max_points)
+                self.assertIndices(idx, len(x), max_points)
+                self.assertEqual(len(idx), max_points)
+                self.assertEqual((idx[0], idx[-1]), (0, len(x) - 1))
+                if max_points >= 10:
+                    self.assertIn(5000, idx)
+        np.testing.assert_array_equal(lttb(x[:50], y[:50], 100), np.arange(50))
+
+    def test_stratified(self):
+        rng = np.random.default_rng(7)
+        strata = np.concatenate([np.zeros(50_000, int), np.ones(20_000, int), np.arange(2, 300)])
+        strata = strata[rng.permutation(len(strata))]
+        for max_points in (500, 2000):
+            with self.subTest(max_points=max_points):
+                idx = stratified(strata, max_points)
+                self.assertIndices(idx, len(strata), max_points)
+                self.assertEqual(len(idx), max_points)
+                # every stratum keeps a row, the big ones roughly their share
+                self.assertEqual(set(strata[idx]), set(strata))
+                counts = np.bincount(strata[idx])
+                self.assertGreater(counts[0], counts[1] * 2)
+        # more strata than points: rows are shared by size, so the largest survives
+        idx = stratified(strata, 100)
+        self.assertIndices(idx, len(strata), 100)
+        self.assertIn(0, strata[idx])
+        np.testing.assert_array_equal(stratified(strata[:80], 100), np.arange(80))
+
+    def test_density_sample_keeps_outliers(self):
+        rng = np.random.default_rng(8)
+        x = np.concatenate([rng.normal(size=50_000), [40.0, -40.0]])
+        y = np.concatenate([rng.normal(size=50_000), [40.0, 40.0]])
+        idx = density_sample(x, y, 1000)
+        self.assertIndices(idx, len(x), 1000)
+        self.assertIn(len(x) - 1, idx)
+        self.assertIn(len(x) - 2, idx)
+        self.assertEqual(len(density_sample(np.ones(5000), np.ones(5000), 100)), 100)
+
+    def test_sample_scatter_and_line(self):
+        rng = np.random.default_rng(9)
+        x = np.sort(rng.normal(size=5000))
+        self.assertEqual(sample_scatter(x, rng.normal(size=5000), 200)[1], 'lttb')
+        idx, method = sample_scatter(rng.permutation(x), x, 200)
+        self.assertEqual(method, 'density')
+        self.assertIndices(idx, 5000, 200)
+
+        shuffled = rng.permutation(x)
+        line = sample_line(shuffled, 200)
+        self.assertLessEqual(len(line), 200)
+        self.assertTrue(np.all(np.diff(shuffled[line]) >= 0))  # ordered along x
+        self.assertEqual((shuffled[line][0], shuffled[line][-1]), (x[0], x[-1]))
+
+
+def strict_loads(data):
+    """json.loads that rejects NaN/Infinity, which browsers cannot parse."""
+    def reject(name):
+        raise ValueError(f'{name} is not JSON')
+    return json.loads(data, parse_constant=reject)
+
+
+class SerializerTests(SimpleTestCase):
+
+    def finite_payload(self):
+        rng = np.random.default_rng(10)
+        return {
+            'floats': rng.normal(size=1000),
+            'float32': np.array([0.1, 2.5], dtype=np.float32),
+            'ints': np.arange(5, dtype=np.int64),
+            'uint8': np.array([1, 255], dtype=np.uint8),
+            'bools': np.array([True, False]),
+            'strided': np.arange(10.0)[::3],
+            'labels': np.array(['a', 'b', 'é'], dtype=object),
+            'series': pd.Series([1.5, 2.5]),
+            'scalars': [np.float64(1.25), np.int64(3), np.float32(0.5), np.bool_(True), 'text', None],
+            'nested': {'group_means': {'a': np.float64(1.0), 'b': np.float64(-2.0)}, 'n': np.int32(7)},
+            'dates': np.array(['2024-01-01', '2024-02-29'], dtype='datetime64[D]'),
+        }
+
+    def legacy_json(self, payload):
+        """What analyze_frame's .tolist() lists gave through JsonResponse."""
+        def plain(value):
+            if isinstance(value, dict):
+                return {k: plain(v) for k, v in value.items()}
+            if isinstance(value, list):
+                return [plain(v) for v in value]
+            if isinstance(value, (np.ndarray, pd.Series)):
+                return value.tolist()
+            if isinstance(value, np.generic):
+                return value.item()
+            return value
+        return json.loads(json.dumps(plain(payload), cls=DjangoJSONEncoder))
+
+    def test_matches_legacy_encoding(self):
+        payload = self.finite_payload()
+        self.assertEqual(strict_loads(dumps(payload)), self.legacy_json(payload))
+
+    def test_non_finite_values_become_null(self):
+        payload = {
+            'floats': np.array([1.5, np.nan, np.inf, -np.inf, -0.0]),
+            'float32': np.array([np.nan, np.inf], dtype=np.float32),
+            'objects': np.array(['a', None, np.nan, 1, 2.5], dtype=object),
+            'dates': np.array(['2024-01-01', 'NaT'], dtype='datetime64[D]'),
+            'scalars': [np.float64(np.nan), float('inf'), np.float32(-np.inf), pd.NaT],
+            'correlation': np.nan,
+        }
+        self.assertEqual(strict_loads(dumps(payload)), {
+            'floats': [1.5, None, None, None, -0.0],
+            'float32': [None, None],
+            'objects': ['a', None, None, 1, 2.5],
+            'dates': ['2024-01-01', None],
+            'scalars': [None, None, None, None],
+            'correlation': None,
+        })
+
+    def test_streamed_encoding_is_identical(self):
+        payload = dict(self.finite_payload(), big=np.arange(2 * CHUNK_ITEMS + 5, dtype=np.float64) / 3,
+                       gaps=np.where(np.arange(CHUNK_ITEMS + 1) % 7, 1.0, np.nan))
+        encoded = dumps(payload)
+        self.assertEqual(strict_loads(b''.join(iter_encode(payload))), strict_loads(encoded))
+
+        plain = json_response(payload)
+        with override_settings(STREAMING_JSON_MIN_ITEMS=10):
+            streamed = json_response(payload)
+        self.assertFalse(plain.streaming)
+        self.assertTrue(streamed.streaming)
+        self.assertEqual(strict_loads(b''.join(streamed.streaming_content)), strict_loads(plain.content))
+        self.assertEqual(strict_loads(plain.content)['big'][-1], (2 * CHUNK_ITEMS + 4) / 3)
+
+
+class FallbackSerializerTests(SerializerTests):
+    """The same checks with the hand-rolled encoder used when orjson is missing."""
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('csv_upload.serializers.orjson', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class JsonIngestTests(SimpleTestCase):
+
+    records = [
+        {'id': i, 'value': i * 0.25 if i % 4 else None, 'name': f'n{i % 3}', 'flag': bool(i % 2)}
+        for i in range(40)
+    ]
+
+    def layouts(self):
+        expected = pd.DataFrame(self.records)
+        columns = {c: expected[c].tolist() for c in expected}
+        columns['value'] = [None if pd.isna(v) else v for v in columns['value']]
+        return expected, {
+            'records': json.dumps(self.records),
+            'pretty records': json.dumps(self.records, indent=2),
+            'ndjson': '\n'.join(json.dumps(r) for r in self.records) + '\n\n',
+            'columns': json.dumps(columns),
+            'split': json.dumps({'columns': list(columns), 'data': [list(r.values()) for r in self.records]}),
+        }
+
+    def read(self, source, streamed):
+        """read_json with arrays decoded item by item (streamed) or in one go."""
+        with override_settings(JSON_STREAM_MIN_BYTES=0 if streamed else 10**9):
+            return read_json(source)
+
+    def test_layouts_load_the_same_frame(self):
+        expected, layouts = self.layouts()
+        for name, text in layouts.items():
+            for streamed in (False, True):
+                with self.subTest(layout=name, streamed=streamed):
+                    for source in (text, text.encode(), io.BytesIO(codecs.BOM_UTF8 + text.encode())):
+                        pd.testing.assert_frame_equal(self.read(source, streamed), expected)
+
+    def test_layouts_without_orjson(self):
+        with mock.patch('csv_upload.json_ingest.orjson', None):
+            self.test_layouts_load_the_same_frame()
+
+    def test_detection(self):
+        _, layouts = self.layouts()
+        self.assertTrue(is_ndjson(io.BytesIO(layouts['ndjson'].encode())))
+        for name in ('records', 'pretty records', 'columns', 'split'):
+            with self.subTest(layout=name):
+                f = io.BytesIO(layouts[name].encode())
+                self.assertFalse(is_ndjson(f))
+                self.assertEqual(f.tell(), 0)  # rewound for the real read
+        self.assertTrue(is_ndjson(io.BytesIO(b'[1, 2]\n[3, 4]\n')))
+
+    def test_array_split_across_chunks(self):
+        text = json.dumps([{'x': 1234567.125, 's': 'é' * 5}, {'x': -2e-9, 's': ''}, [1, 2]])
+        items = list(iter_array(JsonStream(io.BytesIO(text.encode()), chunk_size=3)))
+        self.assertEqual(items, json.loads(text))
+
+    def test_batches_keep_dtypes(self):
+        records = [{'a': i, 'b': None if i < 5 else i / 2} for i in range(12)]
+        with mock.patch('csv_upload.json_ingest.BATCH_ROWS', 5):
+            frame = self.read(json.dumps(records).encode(), streamed=True)
+        pd.testing.assert_frame_equal(frame, pd.DataFrame(records))
+        self.assertEqual(frame['b'].dtype, np.float64)  # first batch all null
+
+    def test_malformed(self):
+        for text, message in [
+            ('{"a": 1}\n{"a": 2\n', 'line 2'),
+            ('[{"a": 1}] [1]', 'extra data'),
+            ('{"a": [1, 2], "b": [1]}', 'different lengths'),
+            ('[{"a": 1},', ''),
+        ]:
+            with self.subTest(text=text), self.assertRaisesMessage(ValueError, message):
+                self.read(text.encode(), streamed=True)
+
+
+class MetricsTests(SimpleTestCase):
+
+    def test_server_timing_header(self):
+        response = Client().post('/api/csv/upload-csv/', {
+            'file': upload(), 'target_column1': 'num', 'target_column2': 'cat',
+        })
+        self.assertEqual(response.status_code, 200)
+        timing = dict(part.split(';dur=') for part in response['Server-Timing'].split(', '))
+        for name in ('hash', 'parse', 'statistics', 'column_stats', 'json_encode', 'total'):
+            self.assertIn(name, timing)
+        self.assertGreaterEqual(float(timing['total']), float(timing['parse']))
+
+    def test_metrics_view_exposes_stage_histograms(self):
+        Client().post('/api/csv/upload-csv/', {'file': upload(), 'output_type': 'pie', 'target_column1': 'cat'})
+        response = Client().get('/api/csv/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        text = response.content.decode()
+        self.assertIn('# TYPE datalysis_stage_seconds histogram', text)
+        self.assertRegex(text, r'datalysis_stage_seconds_count\{rel_type="pie",stage="statistics",'
+                               r'view="analyze_data"\} [1-9]')
+        self.assertRegex(text, r'datalysis_request_seconds_bucket\{rel_type="pie",view="analyze_data",'
+                               r'le="\+Inf"\} [1-9]')
+
+    def test_metrics_view_is_get_only(self):
+        for method in ('post', 'put', 'delete'):
+            with self.subTest(method=method):
+                self.assertEqual(getattr(Client(), method)('/api/csv/metrics/').status_code, 405)
+
+    def test_histogram_rendering(self):
+        registry = Metrics(buckets=(0.1, 1))
+        for value in (0.05, 0.5, 0.5, 5):
+            registry.observe('datalysis_stage_seconds', {'stage': 'parse', 'view': 'a"b'}, value)
+        lines = registry.render().splitlines()
+        self.assertIn('datalysis_stage_seconds_bucket{stage="parse",view="a\\"b",le="0.1"} 1', lines)
+        self.assertIn('datalysis_stage_seconds_bucket{stage="parse",view="a\\"b",le="1"} 3', lines)
+        self.assertIn('datalysis_stage_seconds_bucket{stage="parse",view="a\\"b",le="+Inf"} 4', lines)
+        self.assertIn('datalysis_stage_seconds_count{stage="parse",view="a\\"b"} 4', lines)
+
+    def test_stages_add_up(self):
+        with collect('test_view') as timings:
+            for _ in range(3):
+                with stage('work'):
+                    time.sleep(0.01)
+        self.assertGreaterEqual(timings.stages['work'], 0.03)
+        with stage('outside'):  # no request being collected: a no-op
+            pass
+
+
+class JsonFetcherTests(SimpleTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FeedHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        FeedHandler.hits.clear()
+        self.cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_root)
+        self.fetcher = JsonFetcher(self.cache_root, max_bytes=1000, cache_max_bytes=10_000,
+                                   timeout=(1, 0.2), session=pooled_session(2))
+
+    def fetch(self, path):
+        with self.fetcher.fetch(self.base + path) as f:
+            return f.read()
+
+    def cached_files(self):
+        return sorted(os.listdir(self.cache_root))
+
+    def test_revalidates_cached_copy(self):
+        self.assertEqual(self.fetch('/feed.json'), FEED)
+        self.assertEqual(self.fetch('/feed.json'), FEED)  # served from the cache on 304
+        self.assertEqual(FeedHandler.hits['/feed.json'], 2)
+
+    def test_size_cap_from_content_length(self):
+        with self.assertRaisesMessage(BadRequest, 'larger than 1000 bytes'):
+            self.fetch('/big.json')
+
+    def test_size_cap_while_streaming(self):
+        with self.assertRaisesMessage(BadRequest, 'larger than 1000 bytes'):
+            self.fetch('/big-unsized.json')
+        self.assertEqual([n for n in self.cached_files() if n.startswith('.tmp-')], [])
+
+    def test_timeout(self):
+        with self.assertRaisesMessage(BadRequest, 'Could not fetch JSON URL'):
+            self.fetch('/slow.json')
+
+    def test_rejects_non_json_content_type(self):
+        with self.assertRaisesMessage(BadRequest, 'text/html'):
+            self.fetch('/page')
+        self.assertEqual(self.cached_files(), [])
+
+    def test_accepts_json_served_as_text(self):
+        self.assertEqual(self.fetch('/raw.json'), FEED)
+
+    def test_follows_redirects(self):
+        self.assertEqual(self.fetch('/moved'), FEED)
+        self.assertEqual(FeedHandler.hits['/feed.json'], 1)
+
+    def test_redirect_loop(self):
+        with self.assertRaisesMessage(BadRequest, 'Could not fetch JSON URL'):
+            self.fetch('/loop')
+
+    def test_http_error(self):
+        with self.assertRaisesMessage(BadRequest, '404'):
+            self.fetch('/missing.json')
+
+
+class FormulaTests(SimpleTestCase):
+
+    scope = {
+        'price': np.array([2.0, 4.0, np.nan, 8.0]),
+        'qty': np.array([1.0, 2.0, 3.0, 4.0]),
+        'Unit price': np.array([1.5, 2.5, 3.5, 4.5]),
+        'pi': np.pi,
+    }
+
+    def value(self, text):
+        return evaluate(compile_formula(text), self.scope)
+
+    def test_rejects_disallowed_syntax(self):
+        for text in [
+            '__import__("os").system("id")',
+            '__import__("os")',
+            'price.__class__',
+            '().__class__.__bases__',
+            'price[0]',
+            'lambda: 1',
+            '(lambda x: x)(1)',
+            'open("/etc/passwd")',
+            'round(price, decimals=2)',
+            'price if qty else 0',
+            '(x := 1)',
+            '[1, 2]',
+            '"text"',
+            'f"{price}"',
+            'col(price)',
+            'price | qty',
+            'price & qty',
+        ]:
+            with self.subTest(text=text), self.assertRaises(BadRequest):
+                parse(text)
+
+    def test_rejects_overflowing_exponents(self):
+        for text in ['10**400', '10^400', '2**2**2**30', '2^2^2^30']:
+            with self.subTest(text=text), self.assertRaisesMessage(BadRequest, 'too large'):
+                self.value(text)
+
+    def test_rejects_long_and_deep_formulas(self):
+        with self.assertRaises(BadRequest):
+            parse('1+' * 600 + '1')
+        with self.assertRaises(BadRequest):
+            parse('(' * 300 + '1' + ')' * 300)
+        with self.assertRaisesMessage(BadRequest, 'incomplete'):
+            parse('(1 + 2')
+
+    def test_undefined_names(self):
+        with self.assertRaisesMessage(BadRequest, 'Undefined variables: cost'):
+            self.value('price * cost')
+
+    def test_elementwise(self):
+        np.testing.assert_array_equal(self.value('price * qty'), [2.0, 8.0, np.nan, 32.0])
+        np.testing.assert_array_equal(self.value('qty ^ 2'), [1.0, 4.0, 9.0, 16.0])
+        self.assertEqual(self.value('2 * 3 ^ 2'), 18.0)  # math.js precedence
+        self.assertEqual(self.value('2 ^ 3 ^ 2'), 512.0)  # and right grouping
+        self.assertEqual(self.value('-2 ^ 2'), -4.0)
+        np.testing.assert_array_equal(self.value('col("Unit price") * 2'), [3.0, 5.0, 7.0, 9.0])
+        np.testing.assert_array_equal(self.value('1 < qty < 4'), [False, True, True, False])
+        np.testing.assert_array_equal(self.value('qty > 1 and not qty > 3'), [False, True, True, False])
+
+    def test_aggregates_ignore_nan(self):
+        self.assertAlmostEqual(self.value('mean(price)'), 14 / 3)
+        self.assertEqual(self.value('sum(price) + count(price)'), 17.0)
+        self.assertEqual(self.value('median(qty)'), 2.5)
+        self.assertAlmostEqual(self.value('log(8, 2)'), 3.0)
+        self.assertAlmostEqual(self.value('round(pi * 100) / 100'), 3.14)
+
+    def test_division_by_zero_is_not_an_error(self):
+        self.assertEqual(self.value('1 / 0'), np.inf)
+
+
+class CalculateViewTests(SimpleTestCase):
+
+    dataset_id = 'a' * 64
+
+    def post(self, **fields):
+        with mock.patch('csv_upload.views.registry.describe',
+                        return_value=('csv', 'data.csv', 3, ['a', 'b'])):
+            return Client().post('/api/csv/calculate/', dict(fields, dataset_id=self.dataset_id))
+
+    def test_non_string_column(self):
+        response = self.post(variables=json.dumps([{'name': 'v', 'type': 'sum', 'column': ['a']}]))
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not found', response.json()['error'])
+
+    def test_malformed_formula_items(self):
+        for formulas in ([1], [['a']], [{'formula': 1}], [{'name': 'not valid', 'formula': 'a'}]):
+            with self.subTest(formulas=formulas):
+                self.assertEqual(self.post(formulas=json.dumps(formulas)).status_code, 400)
+
+    def test_disallowed_formula(self):
+        response = self.post(formulas=json.dumps(['__import__("os")']))
+        self.assertEqual(response.status_code, 400)
+
+
+class GroupStatsTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.cats = rng.choice(['a', 'b', 'c', 'd'], size=5000, p=[0.4, 0.3, 0.2, 0.1])
+        # an offset that would break naive sums of squares; group means are
+        # kept as absolute values, so agreement is to about ulp(1e6) / spread
+        self.values = 1e6 + rng.normal(size=5000) + (self.cats == 'b') * 0.5
+
+    def scipy_anova(self, cats, values):
+        return f_oneway(*(values[cats == label] for label in pd.unique(cats)))
+
+    def test_anova_matches_scipy(self):
+        f, p, effect = GroupStats.from_series(self.cats, self.values).anova()
+        expected = self.scipy_anova(self.cats, self.values)
+        np.testing.assert_allclose([f, p], [expected.statistic, expected.pvalue], rtol=1e-8)
+        self.assertAlmostEqual(effect, np.sqrt(f / (f + len(self.values) - 4)))
+
+    def test_point_biserial_matches_scipy(self):
+        two = np.isin(self.cats, ['a', 'b'])
+        cats, values = self.cats[two], self.values[two]
+        r = GroupStats.from_series(cats, values).point_biserial()
+        np.testing.assert_allclose(r, pointbiserialr(pd.factorize(cats)[0], values)[0], rtol=1e-8)
+
+    def test_merged_chunks_match_single_pass(self):
+        # 'd' is missing from the first chunk and 'a' from the last
+        chunks = [(slice(0, 1000), 'd'), (slice(1000, 4000), None), (slice(4000, None), 'a')]
+        cats, values = [], []
+        for rows, missing in chunks:
+            keep = self.cats[rows] != missing
+            cats.append(self.cats[rows][keep])
+            values.append(self.values[rows][keep])
+        parts = [GroupStats.from_series(c, v) for c, v in zip(cats, values)]
+        merged = parts[0].merge(parts[1]).merge(parts[2])
+        whole = GroupStats.from_series(np.concatenate(cats), np.concatenate(values))
+
+        self.assertEqual(merged.means_dict().keys(), whole.means_dict().keys())
+        for label, mean in whole.means_dict().items():
+            self.assertAlmostEqual(merged.means_dict()[label], mean, places=6)
+        np.testing.assert_allclose(merged.anova(), whole.anova(), rtol=1e-8)
+
+    def test_means_match_groupby(self):
+        expected = pd.Series(self.values).groupby(self.cats).mean().to_dict()
+        for label, mean in GroupStats.from_series(self.cats, self.values).means_dict().items():
+            self.assertAlmostEqual(mean, expected[label], places=6)
+
+    def test_degenerate_groups(self):
+        one = GroupStats.from_series(np.array(['a'] * 3), np.array([1.0, 2.0, 3.0]))
+        self.assertEqual(one.tests(), (None, None))
+        f, p, _ = GroupStats.from_series(np.array(['a', 'a', 'b', 'b', 'c']),
+                                         np.array([1.0, 1.0, 2.0, 2.0, 3.0])).anova()
+        self.assertEqual((f, p), (float('inf'), 0.0))
+
+
+class SketchTests(SimpleTestCase):
+
+    config = SketchConfig.from_error(0.01, pie_slices=20)
+
+    def test_hyperloglog_within_error(self):
+        values = np.random.default_rng(1).integers(0, 10**9, size=300_000)
+        exact = len(np.unique(values))
+        hll = HyperLogLog(self.config.hll_precision)
+        hll.update(values)
+        stderr = 1.04 / np.sqrt(1 << self.config.hll_precision)
+        self.assertLess(abs(hll.count() / exact - 1), 3 * stderr)
+
+    def test_hyperloglog_small_sets_and_merge(self):
+        hll = HyperLogLog(14)
+        hll.update(np.arange(100))
+        hll.update(np.arange(100, dtype=np.float64))  # 1 and 1.0 are the same value
+        self.assertEqual(hll.count(), 100)
+
+        a, b, both = HyperLogLog(14), HyperLogLog(14), HyperLogLog(14)
+        a.update(np.arange(0, 60_000))
+        b.update(np.arange(40_000, 100_000))
+        both.update(np.arange(0, 100_000))
+        np.testing.assert_array_equal(a.merge(b).registers, both.registers)
+
+    def test_topk_counts_within_max_error(self):
+        values = np.random.default_rng(2).zipf(1.3, size=300_000) % 5000
+        exact = pd.Series(values).value_counts()
+        parts = []
+        for chunk in np.array_split(values, 5):
+            part = TopK(self.config.top_k)
+            part.update(chunk)
+            parts.append(part)
+        top = parts[0]
+        for part in parts[1:]:
+            top = top.merge(part)
+
+        self.assertEqual(top.total, len(values))
+        self.assertLessEqual(top.max_error, len(values) / (self.config.top_k + 1))
+        under = exact[top.counts.index] - top.counts
+        self.assertGreaterEqual(under.min(), 0)
+        self.assertLessEqual(under.max(), top.max_error)
+        # anything more frequent than the error bound is kept
+        for label in exact[exact > top.max_error].index:
+            self.assertIn(label, top.counts.index)
+
+    def test_topk_pie_other_bucket(self):
+        top = TopK(self.config.top_k)
+        top.update(np.random.default_rng(3).integers(0, 500, size=50_000))
+        pie = top.pie(self.config.pie_slices)
+        self.assertEqual(len(pie['labels']), self.config.pie_slices + 1)
+        self.assertEqual(pie['labels'][-1], 'Other')
+        self.assertEqual(int(pie['values'].sum()), 50_000)
+
+    def test_quantiles_within_rank_error(self):
+        values = np.random.default_rng(4).lognormal(size=200_000)
+        sketch = QuantileSketch(self.config.quantile_k)
+        for chunk in np.array_split(values, 7):
+            part = QuantileSketch(self.config.quantile_k)
+            part.update(chunk)
+            sketch = sketch.merge(part)
+
+        qs = [0.0, 0.01, 0.25, 0.5, 0.75, 0.99, 1.0]
+        estimates = sketch.quantiles(qs)
+        self.assertEqual(sketch.count, len(values))
+        self.assertEqual((estimates[0], estimates[-1]), (values.min(), values.max()))
+        ranks = np.searchsorted(np.sort(values), estimates[1:-1]) / len(values)
+        self.assertLess(np.abs(ranks - qs[1:-1]).max(), 0.01)
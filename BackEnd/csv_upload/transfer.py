@@ -0,0 +1,105 @@
+"""
+Moving data between pandas and the H2O cluster.
+
+H2OFrame(df) and as_data_frame() both go through CSV text. Here frames
+are uploaded as Parquet (typed, binary columns) and, when the cluster
+runs on this host, downloaded through a Parquet export that H2O writes
+in parallel, one file per chunk. Where that is not possible the
+multi-threaded as_data_frame (polars + pyarrow) and finally the plain
+CSV transfer are used. `manage.py benchmark_h2o_transfer` compares the
+methods in rows/sec.
+"""
+import logging
+import os
+import shutil
+import tempfile
+
+import h2o
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+try:
+    import pyarrow  # noqa: F401  (Parquet for pandas)
+except ImportError:
+    pyarrow = None
+
+
+LOCAL_HOSTS = ('127.0.0.1', 'localhost', '::1')
+
+
+def cluster_is_local():
+    """Files H2O exports land on this machine's filesystem."""
+    return settings.H2O_IP in LOCAL_HOSTS
+
+
+def upload_parquet(df):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'frame.parquet')
+        df.to_parquet(path, index=False)
+        return h2o.upload_file(path)
+
+
+def upload_csv(df):
+    return h2o.H2OFrame(df)
+
+
+def download_parquet(hf):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'parts')
+        h2o.export_file(hf, path, format='parquet', force=True)
+        return pd.read_parquet(path)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def download_multi_thread(hf):
+    return hf.as_data_frame(use_multi_thread=True)
+
+
+def download_csv(hf):
+    return hf.as_data_frame()
+
+
+# in order of preference; the benchmark command times each of them
+UPLOADS = {'parquet': upload_parquet, 'csv': upload_csv}
+DOWNLOADS = {'parquet': download_parquet, 'multi_thread': download_multi_thread, 'csv': download_csv}
+
+
+def available_uploads():
+    return [name for name in UPLOADS if name != 'parquet' or pyarrow is not None]
+
+
+def available_downloads():
+    names = []
+    if pyarrow is not None and cluster_is_local():
+        names.append('parquet')
+    return names + ['multi_thread', 'csv']
+
+
+def to_h2o(df):
+    """pandas DataFrame -> H2OFrame."""
+    for name in available_uploads():
+        try:
+            return UPLOADS[name](df)
+        except Exception as e:
+            if name == 'csv':
+                raise
+            logging.warning(f"H2O {name} upload failed, falling back: {e}")
+
+
+def to_pandas(hf):
+    """H2OFrame -> pandas DataFrame."""
+    for name in available_downloads():
+        try:
+            return DOWNLOADS[name](hf)
+        except Exception as e:
+            if name == 'csv':
+                raise
+            logging.warning(f"H2O {name} download failed, falling back: {e}")
+
+
+def column_to_numpy(hf, column):
+    """One numeric column of an H2OFrame (e.g. predictions) as float64."""
+    return to_pandas(hf[column])[column].to_numpy(np.float64)
@@ -1,7 +1,14 @@
 # csv_upload/urls.py
 from django.urls import path
 from . import views
+from .metrics import metrics_view
 
 urlpatterns = [
     path('upload-csv/', views.analyze_data, name='upload_csv'),
+    path('datasets/', views.upload_dataset, name='upload_dataset'),
+    path('calculate/', views.calculate, name='calculate'),
+    path('batch/', views.analyze_batch, name='analyze_batch'),
+    path('jobs/', views.submit_analysis_job, name='submit_analysis_job'),
+    path('jobs/<str:job_id>/', views.analysis_job_status, name='analysis_job_status'),
+    path('metrics/', metrics_view, name='metrics'),
 ]
\ No newline at end of file
@@ -1,6 +1,8 @@
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.core.files.storage import default_storage
+from django.core.exceptions import BadRequest
+from django.conf import settings
 
 import h2o
 from h2o.automl import H2OAutoML
@@ -8,30 +10,53 @@ from h2o.exceptions import H2OStartupError
 
 import pandas as pd
 import numpy as np
+import io
 import logging
 import json
-import requests
-from scipy.stats import pearsonr, pointbiserialr, f_oneway, chi2_contingency
-from collections import defaultdict
+import shutil
+import time
+import tempfile
+from scipy.stats import pearsonr, chi2_contingency
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse
 
+from .registry import registry, content_hash, DATASET_ID_RE
+from .h2o_cluster import cluster as h2o_cluster
+from .frame_cache import frame_cache
+from .transfer import to_pandas, column_to_numpy
+from .fetch import json_fetcher
+from .json_ingest import read_json
+from .ingest import read_csv_fast, sniff_csv
+from .model_cache import AUTOML_CONFIG, TrainedModel, model_cache, model_key
+from .jobs import JobQueue
+from .fast_models import ModelFit, fit_fast
+from .downsample import sample_scatter, sample_line, stratified
+from .serializers import json_response
+from .profiles import ColumnProfiles
+from .grouping import GroupStats
+from .chunked import analyze_stream
+from .sketches import SketchConfig, TopK
+from .metrics import bind, collect, instrumented, label, stage
+from .formulas import CONSTANTS, FUNCTIONS, VARIABLE_TYPES, compile_formula, evaluate, numeric_column
+
+
+MODEL_TIERS = ('fast', 'balanced', 'automl')
+MIN_PLOT_POINTS = 10
+
+analysis_jobs = JobQueue(
+    lambda: ThreadPoolExecutor(max_workers=settings.ANALYSIS_JOB_WORKERS),
+    settings.JOB_ROOT,
+    settings.JOB_RESULT_TTL,
+)
+
 
 def ensure_h2o():
     """
-    Initialize H2O only when needed.
+    Make sure the shared H2O cluster is up (see h2o_cluster).
     Raises H2OStartupError if Java/JRE is missing.
     """
-    try:
-        # If a cluster is already running, this returns True
-        if not h2o.cluster().is_running():
-            h2o.init()
-    except Exception:
-        # Try one more time, then bubble up startup errors
-        try:
-            h2o.init()
-        except H2OStartupError as e:
-            logging.error(f"H2O failed to start: {e}")
-            raise
+    with stage('h2o_startup'):
+        h2o_cluster.ensure()
 
 
 def is_valid_url(url):
@@ -42,30 +67,42 @@ def is_valid_url(url):
         return False
 
 
-def load_data(file_obj, file_type):
+def load_data(file_obj, file_type, usecols=None):
     """
     Load data from either a CSV upload or JSON (upload/string).
+    `usecols` limits a CSV parse to the columns actually needed.
     Returns a pandas.DataFrame.
     """
     try:
-        if file_type == 'csv':
-            # Save temp file to default storage
-            file_path = default_storage.save("temp.csv", file_obj)
-            h2o_frame = h2o.import_file(file_path)
-            df = h2o_frame.as_data_frame()
+        if file_type == 'csv' and settings.CSV_INGEST_ENGINE == 'native':
+            with stage('parse'):
+                return read_csv_fast(file_obj, usecols=usecols)
+
+        elif file_type == 'csv':
+            # Legacy path through the H2O parser
+            ensure_h2o()
+            with stage('file_save'):
+                file_path = default_storage.save("temp.csv", file_obj)
+            with stage('import_file'):
+                h2o_frame = h2o.import_file(file_path)
+            with stage('as_data_frame'):
+                df = to_pandas(h2o_frame)
+            h2o.remove(h2o_frame)
             default_storage.delete(file_path)
             return df
 
         elif file_type == 'json':
-            # Uploaded file-like or a raw JSON string
-            if hasattr(file_obj, 'read'):
-                json_data = json.load(file_obj)
-            else:
-                json_data = json.loads(file_obj)
-            return pd.DataFrame(json_data)
+            # Uploaded/fetched file-like or a raw JSON string, in any layout
+            try:
+                with stage('parse'):
+                    return read_json(file_obj)
+            except ValueError as e:
+                raise BadRequest(f'Invalid JSON data: {e}')
 
         return None
 
+    except BadRequest:
+        raise
     except Exception as e:
         logging.error(f"Error loading {file_type} data: {e}")
         raise
@@ -79,240 +116,785 @@ def process_pie_chart(df, target_column):
         raise ValueError(f"Column '{target_column}' not found")
 
     col = df[target_column]
-    counts = col.value_counts().to_dict()
+    counts = col.value_counts()
+    return {
+        'labels': counts.index.to_numpy(),
+        'values': counts.to_numpy()
+    }
+
+
+def get_data_source(request):
+    """
+    Work out where the data for this request comes from.
+    Returns (data_source, file_type); raises BadRequest for bad input.
+    """
+    if 'file' in request.FILES:
+        f = request.FILES['file']
+        if f.name.lower().endswith('.csv'):
+            return f, 'csv'
+        if f.name.lower().endswith(('.json', '.ndjson', '.jsonl')):
+            return f, 'json'
+        raise BadRequest('Unsupported file type. Use CSV or JSON.')
+
+    if 'json_url' in request.POST:
+        url = request.POST['json_url'].strip()
+        if not is_valid_url(url):
+            raise BadRequest('Invalid URL provided')
+        return json_fetcher.fetch(url), 'json'
+
+    if 'json_data' in request.POST:
+        return request.POST['json_data'], 'json'
+
+    raise BadRequest('No data source provided. Upload file, JSON URL, or JSON data.')
+
+
+def close_source(data_source):
+    """Close a fetched or uploaded file once the request is done with it."""
+    if hasattr(data_source, 'close'):
+        data_source.close()
+
+
+def check_columns(df, columns, available=None):
+    """`available` lists the source's columns when df holds only some of them."""
+    for c in columns:
+        if c not in df.columns:
+            raise BadRequest(f'Column "{c}" not found. Available: {available or list(df.columns)}')
+
+
+def train_automl(x, y, col1, col2, features, dataset_id=None):
+    """
+    Fit AutoML for col2 ~ features on the complete rows `x` and `y` (the
+    coerced numeric columns). The training frame stays resident in the
+    cluster for `dataset_id`.
+    """
+    # H2O is only needed once a model is trained
+    ensure_h2o()
+
+    def training_data():
+        data = pd.DataFrame({col1: x.to_numpy(np.float64), col2: y.to_numpy(np.float64)})
+        if 'x2' in features:
+            data = data.assign(x2=data[col1] ** 2)
+        return data
+
+    columns = list(dict.fromkeys([col1, col2] + list(features)))
+    with frame_cache.frame(dataset_id, columns, training_data) as hf:
+        aml = H2OAutoML(**AUTOML_CONFIG)
+        try:
+            with stage('automl_train'):
+                aml.train(x=features, y=col2, training_frame=hf)
+
+            with stage('predict'):
+                pred_frame = aml.leader.predict(hf)
+                preds = column_to_numpy(pred_frame, 'predict')
+                h2o.remove(pred_frame)
+            metrics = {
+                'model_type': str(aml.leader),
+                'r2': aml.leader.r2(),
+                'rmse': aml.leader.rmse(),
+                'mae': aml.leader.mae()
+            }
+        finally:
+            # only the predictions are cached; drop the project's models from the cluster
+            remove_automl(aml)
+    return TrainedModel(predictions=preds, metrics=metrics)
+
+
+def remove_automl(aml):
+    try:
+        h2o.remove(aml)
+    except Exception as e:
+        logging.warning(f"Could not remove AutoML project {aml.project_name}: {e}")
+
+
+def automl_fit(x, y, col1, col2, features, dataset_id, report):
+    """
+    AutoML leader predictions for col2 ~ features, reusing a cached model
+    for the same dataset and column pair. `x` and `y` hold the complete rows.
+    Returns a ModelFit with a +/-1.96 sd residual band.
+    """
+    key = model_key(dataset_id, col1, col2, features)
+    trained = model_cache.get(key)
+    if trained is None:
+        report('training model', 0.3)
+        trained = train_automl(x, y, col1, col2, features, dataset_id)
+        report('building plot data', 0.9)
+        model_cache.put(key, trained)
+
+    preds = trained.predictions
+    ci = 1.96 * np.std(y.to_numpy() - preds)
+    return ModelFit(preds, preds + ci, preds - ci, trained.metrics, None)
+
+
+def thin_rows(max_points, strata, *columns):
+    """
+    Stratified sample of the plotted rows so every category (or category
+    pair) stays visible. Returns the thinned columns plus sampling info.
+    """
+    if not max_points or len(strata) <= max_points:
+        return columns + (None,)
+    idx = stratified(pd.factorize(strata)[0], max_points)
+    sampling = {'total_points': len(strata), 'returned_points': len(idx), 'method': 'stratified'}
+    return tuple(c.iloc[idx] for c in columns) + (sampling,)
+
+
+def group_tests(cats, values):
+    """
+    Point-biserial correlation (two groups) or one-way ANOVA (more) plus
+    the group means, from one vectorised pass over the complete rows.
+    """
+    groups = GroupStats.from_series(cats.to_numpy(), values.to_numpy(np.float64))
+    correlation, stats_res = groups.tests()
+    return correlation, stats_res, groups.means_dict()
+
+
+def analyze_frame(df, file_type, output_type, col1, col2, dataset_id=None, report=None,
+                  model_tier='balanced', max_points=None, sketch=None, profiles=None):
+    """
+    Run the pie chart or relationship analysis for one column pair.
+    `dataset_id` (the content hash) lets trained models be reused;
+    `report(stage, progress)` is called as a background job advances.
+    `model_tier` picks the numeric-numeric model: 'fast' (closed-form
+    OLS), 'automl', or 'balanced' (OLS, AutoML only if the fit is poor).
+    `max_points` caps the number of plotted points; statistics still use
+    every row. `sketch` (a SketchConfig) switches column_stats and the
+    pie chart to bounded-memory estimates. `profiles` shares per-column
+    work between analyses of the same frame.
+    Returns the response payload as a dict.
+    """
+    report = report or (lambda stage, progress=None: None)
+    profiles = profiles or ColumnProfiles(df)
+
+    # Pie chart logic
+    if output_type == 'pie':
+        label(rel_type='pie')
+        check_columns(df, [col1])
+
+        with stage('statistics'):
+            if sketch is None:
+                pie = process_pie_chart(df, col1)
+            else:
+                top = TopK(sketch.top_k)
+                top.update(df[col1])
+                pie = top.pie(sketch.pie_slices)
+
+        with stage('column_stats'):
+            column_stats = {col1: profiles.stats(col1, sketch)}
+
+        return {
+            'status': 'success',
+            'data_source_type': file_type,
+            'output_type': 'pie',
+            'plot_data': pie,
+            'column_names': [col1],
+            'column_stats': column_stats,
+            'approximate': sketch and sketch.describe()
+        }
+
+    # Relationship analysis
+    check_columns(df, [col1, col2])
+
+    with stage('coercion'):
+        s1, s2 = profiles.values(col1), profiles.values(col2)
+        n1, n2 = profiles.is_numeric(col1), profiles.is_numeric(col2)
+
+    rel_type = (
+        "numeric-numeric" if n1 and n2 else
+        "numeric-categorical" if n1 else
+        "categorical-numeric" if n2 else
+        "categorical-categorical"
+    )
+    label(rel_type=rel_type)
+
+    plot_data = {'x': [], 'y': [], 'predicted': None, 'confidence_interval': None, 'group_means': None}
+    correlation = None
+    stats_res = None
+    model_perf = None
+    sampling = None
+
+    # -- Numeric vs Numeric
+    if rel_type == "numeric-numeric":
+        mask = profiles.notna(col1) & profiles.notna(col2)
+        if mask.sum() > 1:
+            with stage('statistics'):
+                correlation = pearsonr(s1[mask], s2[mask])[0]
+        if not mask.any():
+            raise BadRequest(f'No rows with both "{col1}" and "{col2}" present')
+
+        # feature engineering if low correlation
+        features = [col1]
+        if abs(correlation or 0) < 0.3:
+            features.append('x2')
+
+        fit = None
+        if model_tier != 'automl':
+            report('fitting trend line', 0.2)
+            with stage('model_fit'):
+                fit = fit_fast(s1[mask], s2[mask], features)
+            used_tier = 'fast'
+
+        if fit is None or (model_tier == 'balanced' and fit.metrics['r2'] < settings.FAST_MODEL_MIN_R2):
+            try:
+                fit = automl_fit(s1[mask], s2[mask], col1, col2, features, dataset_id, report)
+                used_tier = 'automl'
+            except H2OStartupError:
+                if model_tier == 'automl':
+                    raise
+                logging.warning("H2O unavailable, keeping the closed-form fit")
+
+        if max_points and mask.sum() > max_points:
+            # statistics above used every row; only the drawn points are thinned
+            with stage('downsample'):
+                xs, ys = s1[mask].to_numpy(np.float64), s2[mask].to_numpy(np.float64)
+                idx, method = sample_scatter(xs, ys, max_points)
+                line = sample_line(xs, max_points)
+            plot_data = {
+                'x': xs[idx],
+                'y': ys[idx],
+                'predicted_x': xs[line],
+                'predicted': fit.predicted[line],
+                'confidence_interval': {
+                    'upper': fit.upper[line],
+                    'lower': fit.lower[line]
+                }
+            }
+            sampling = {'total_points': int(mask.sum()), 'returned_points': len(idx), 'method': method}
+        else:
+            plot_data = {
+                'x': s1.to_numpy(),
+                'y': s2.to_numpy(),
+                'predicted': fit.predicted,
+                'confidence_interval': {
+                    'upper': fit.upper,
+                    'lower': fit.lower
+                }
+            }
+
+        model_perf = dict(fit.metrics, model_tier=used_tier)
+
+    # -- Numeric vs Categorical
+    elif rel_type == "numeric-categorical":
+        cats = profiles.as_str(col2)
+        mask = profiles.notna(col1) & cats.notna()
+        with stage('statistics'):
+            correlation, stats_res, gm = group_tests(cats[mask], s1[mask])
+        with stage('downsample'):
+            cats, s1, sampling = thin_rows(max_points, cats, cats, s1)
+        plot_data = {'x': cats.to_numpy(), 'y': s1.to_numpy(), 'group_means': gm}
+
+    # -- Categorical vs Numeric
+    elif rel_type == "categorical-numeric":
+        cats = profiles.as_str(col1)
+        mask = profiles.notna(col2) & cats.notna()
+        with stage('statistics'):
+            correlation, stats_res, gm = group_tests(cats[mask], s2[mask])
+        with stage('downsample'):
+            cats, s2, sampling = thin_rows(max_points, cats, cats, s2)
+        plot_data = {'x': cats.to_numpy(), 'y': s2.to_numpy(), 'group_means': gm}
+
+    # -- Categorical vs Categorical
+    else:
+        with stage('statistics'):
+            tab = pd.crosstab(profiles.as_str(col1), profiles.as_str(col2))
+            if tab.size:
+                chi2, p, dof, _ = chi2_contingency(tab)
+                stats_res = {'chi_square': {'statistic': chi2, 'p_value': p, 'degrees_of_freedom': dof}}
+        with stage('downsample'):
+            x, y = profiles.as_str(col1), profiles.as_str(col2)
+            x, y, sampling = thin_rows(max_points, x + '\x00' + y, x, y)
+        plot_data = {'x': x.to_numpy(), 'y': y.to_numpy()}
+
+    with stage('column_stats'):
+        column_stats = {
+            col1: profiles.stats(col1, sketch),
+            col2: profiles.stats(col2, sketch)
+        }
+
     return {
-        'labels': list(counts.keys()),
-        'values': list(counts.values())
+        'status': 'success',
+        'data_source_type': file_type,
+        'output_type': output_type,
+        'relationship_type': rel_type,
+        'correlation': correlation,
+        'plot_data': plot_data,
+        'column_names': [col1, col2],
+        'column_stats': column_stats,
+        'statistical_tests': stats_res,
+        'model_performance': model_perf,
+        'sampling': sampling,
+        'approximate': sketch and sketch.describe()
     }
 
 
 @csrf_exempt
-def analyze_data(request):
+@instrumented('upload_dataset')
+def upload_dataset(request):
+    """
+    Parse a dataset once and keep it server-side.
+    The returned `dataset_id` can be sent to analyze_data instead of the file.
+    """
     if request.method != 'POST':
         return JsonResponse({'error': 'Only POST method allowed'}, status=405)
 
-    # Ensure H2O cluster is up (or return clean JSON error)
+    data_source = None
     try:
-        ensure_h2o()
+        data_source, file_type = get_data_source(request)
+        dataset_id = content_hash(data_source)
+
+        info = registry.describe(dataset_id)
+        created = info is None
+        if created:
+            df = load_data(data_source, file_type)
+            if df is None:
+                return JsonResponse({'error': 'Failed to load data'}, status=400)
+            name = getattr(data_source, 'name', '')
+            registry.put(dataset_id, df, file_type, name)
+            info = (file_type, name, len(df), list(df.columns))
+
+        file_type, _, rows, columns = info
+        return JsonResponse({
+            'status': 'success',
+            'dataset_id': dataset_id,
+            'data_source_type': file_type,
+            'column_names': columns,
+            'rows': rows,
+            'created': created
+        })
+
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except H2OStartupError:
         return JsonResponse(
             {'error': 'Server mis-configured: could not start H2O (Java missing?)'},
             status=500
         )
+    except Exception as e:
+        logging.exception("Processing error")
+        return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        close_source(data_source)
 
+
+def parse_json_list(params, field):
     try:
-        # 1. Determine data source
-        file_type = None
-        data_source = None
-        output_type = request.POST.get('output_type', 'relationship').strip()
-
-        if 'file' in request.FILES:
-            f = request.FILES['file']
-            if f.name.lower().endswith('.csv'):
-                file_type = 'csv'
-            elif f.name.lower().endswith('.json'):
-                file_type = 'json'
-            else:
-                return JsonResponse({'error': 'Unsupported file type. Use CSV or JSON.'}, status=400)
-            data_source = f
-
-        elif 'json_url' in request.POST:
-            url = request.POST['json_url'].strip()
-            if not is_valid_url(url):
-                return JsonResponse({'error': 'Invalid URL provided'}, status=400)
-            resp = requests.get(url)
-            resp.raise_for_status()
-            data_source = resp.text
-            file_type = 'json'
-
-        elif 'json_data' in request.POST:
-            data_source = request.POST['json_data']
-            file_type = 'json'
-        else:
+        value = json.loads(params.get(field) or '[]')
+    except json.JSONDecodeError as e:
+        raise BadRequest(f'Invalid {field}: {e}')
+    if not isinstance(value, list):
+        raise BadRequest(f'{field} must be a JSON list')
+    return value
+
+
+def calculation_result(value):
+    """Formula result for the response: a number, or an array capped at FORMULA_MAX_RESULT_VALUES."""
+    value = np.asarray(value)
+    if value.ndim == 0:
+        return {'result': value.item()}
+    limit = settings.FORMULA_MAX_RESULT_VALUES
+    return {'result': value[:limit], 'length': len(value), 'truncated': len(value) > limit}
+
+
+@csrf_exempt
+@instrumented('calculate')
+def calculate(request):
+    """
+    Evaluate formula-page variables and formulas over a stored dataset.
+    `variables` is a JSON list of {name, column, type} (sum/mean/median/mode);
+    `formulas` a JSON list of formula strings or {name, formula} objects,
+    whose results later formulas can use by name. The returned
+    `variables` and `calculations` can be sent on to the PDF report.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    try:
+        dataset_id = request.POST.get('dataset_id', '').strip()
+        variables = parse_json_list(request.POST, 'variables')
+        formulas = parse_json_list(request.POST, 'formulas')
+
+        info = registry.describe(dataset_id) if DATASET_ID_RE.fullmatch(dataset_id) else None
+        if info is None:
             return JsonResponse({
-                'error': 'No data source provided. Upload file, JSON URL, or JSON data.'
-            }, status=400)
-
-        # 2. Validate required form fields
-        col1 = request.POST.get('target_column1', '').strip()
-        col2 = request.POST.get('target_column2', '').strip()
-        if output_type == 'pie' and not col1:
-            return JsonResponse({'error': 'Must specify target_column1 for pie chart'}, status=400)
-        if output_type != 'pie' and (not col1 or not col2):
-            return JsonResponse({'error': 'Must specify both target columns'}, status=400)
-
-        # 3. Load into pandas DataFrame
-        df = load_data(data_source, file_type)
+                'error': 'Unknown or expired dataset_id. Upload the dataset again.'
+            }, status=404)
+        available = set(info[3])
+
+        for var in variables:
+            if not isinstance(var, dict) or not str(var.get('name', '')).isidentifier():
+                raise BadRequest('Each variable needs a name made of letters, digits and underscores')
+            if var.get('type') not in VARIABLE_TYPES:
+                raise BadRequest(f'Unknown variable type: {var.get("type")!r}')
+            column = var.get('column')
+            if not isinstance(column, str) or column not in available:
+                raise BadRequest(f'Column {column!r} not found. Available: {info[3]}')
+        compiled = []
+        for item in formulas:
+            if isinstance(item, str):
+                text, name = item, None
+            elif isinstance(item, dict) and isinstance(item.get('formula'), str):
+                text, name = item['formula'], item.get('name') or None
+            else:
+                raise BadRequest('Each formula must be a string or a {"name", "formula"} object')
+            if name is not None and not (isinstance(name, str) and name.isidentifier()):
+                raise BadRequest('Formula names must be made of letters, digits and underscores')
+            compiled.append((name, compile_formula(text)))
+
+        # only the columns actually referenced are loaded (memory-mapped from the store)
+        referenced = {var['column'] for var in variables}
+        for _, formula in compiled:
+            referenced |= formula.names
+        columns = [c for c in info[3] if c in referenced]
+        with stage('load_dataset'):
+            df = registry.load(dataset_id, columns).df
+        with stage('coercion'):
+            data = {c: numeric_column(df[c]) for c in columns}
+
+        # names resolve to saved variables first, then constants, then columns
+        scope = dict(data, **CONSTANTS)
+        variable_results = []
+        for var in variables:
+            with np.errstate(all='ignore'):
+                value = FUNCTIONS[var['type']](data[var['column']])
+            scope[var['name']] = value
+            variable_results.append(dict(var, value=calculation_result(value)['result']))
+
+        timestamp = time.strftime('%Y-%m-%d %H:%M:%S')
+        calculations = []
+        for name, formula in compiled:
+            with stage('evaluate'):
+                value = evaluate(formula, scope)
+            if name:
+                scope[name] = value
+            calculations.append(dict(
+                {'formula': formula.text, 'name': name, 'timestamp': timestamp},
+                **calculation_result(value)
+            ))
+
+        return json_response({
+            'status': 'success',
+            'dataset_id': dataset_id,
+            'rows': info[2],
+            'variables': variable_results,
+            'calculations': calculations
+        })
+
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logging.exception("Processing error")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def get_analysis_params(params):
+    """
+    (output_type, target_column1, target_column2) from the form fields
+    (request.POST) or one batch spec.
+    """
+    output_type = str(params.get('output_type') or 'relationship').strip()
+    col1 = str(params.get('target_column1') or '').strip()
+    col2 = str(params.get('target_column2') or '').strip()
+    if output_type == 'pie' and not col1:
+        raise BadRequest('Must specify target_column1 for pie chart')
+    if output_type != 'pie' and (not col1 or not col2):
+        raise BadRequest('Must specify both target columns')
+    return output_type, col1, col2
+
+
+def get_analysis_options(params):
+    """
+    Optional analyze_data settings, as keyword arguments for analyze_frame.
+    """
+    model_tier = str(params.get('model_tier') or 'balanced').strip()
+    if model_tier not in MODEL_TIERS:
+        raise BadRequest(f'model_tier must be one of {list(MODEL_TIERS)}')
+
+    max_points = str(params.get('max_points') or '').strip() or None
+    if max_points is not None:
+        try:
+            max_points = int(max_points)
+        except ValueError:
+            raise BadRequest('max_points must be an integer')
+        if max_points < MIN_PLOT_POINTS:
+            raise BadRequest(f'max_points must be at least {MIN_PLOT_POINTS}')
+
+    sketch = None
+    if is_true(params.get('approximate')):
+        error = str(params.get('sketch_error') or '').strip() or settings.SKETCH_ERROR
+        try:
+            error = float(error)
+        except ValueError:
+            raise BadRequest('sketch_error must be a number')
+        if not 0.001 <= error <= 0.5:
+            raise BadRequest('sketch_error must be between 0.001 and 0.5')
+        sketch = SketchConfig.from_error(error, settings.SKETCH_PIE_SLICES)
+
+    return {'model_tier': model_tier, 'max_points': max_points, 'sketch': sketch}
+
+
+def is_true(value):
+    return str(value or '').strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def use_streaming(params, data_source, file_type):
+    """
+    streaming=true asks for the chunked, out-of-core analysis. It applies
+    to CSV uploads; registered datasets are already memory-mapped from
+    disk and JSON sources are already in memory, so those are unaffected.
+    """
+    return is_true(params.get('streaming')) and data_source is not None and file_type == 'csv'
+
+
+def load_for_analysis(data_source, file_type, dataset_id, usecols):
+    """
+    DataFrame with `usecols` from a registered dataset (data_source None)
+    or from a fresh upload. Returns (df, file_type) or (None, None).
+    """
+    if data_source is None:
+        with stage('load_dataset'):
+            dataset = registry.load(dataset_id, usecols)
+        if dataset is None:
+            return None, None
+        return dataset.df, dataset.file_type
+    return load_data(data_source, file_type, usecols=usecols), file_type
+
+
+def run_analysis(report, data_source, file_type, dataset_id, output_type, col1, col2, options,
+                 streaming=False):
+    """Background-job body for analyze_data."""
+    with collect('analysis_job'):
+        if streaming:
+            report('reading chunks', 0.1)
+            return analyze_streamed(data_source, output_type, col1, col2, report, **options)
+        report('loading data', 0.1)
+        usecols = [col1] if output_type == 'pie' else [col1, col2]
+        df, file_type = load_for_analysis(data_source, file_type, dataset_id, usecols)
         if df is None:
-            return JsonResponse({'error': 'Failed to load data'}, status=400)
+            raise BadRequest('Unknown or expired dataset_id. Upload the dataset again.')
+        report('analyzing', 0.2)
+        return analyze_frame(df, file_type, output_type, col1, col2, dataset_id, report, **options)
 
-        # 4. Pie chart logic
-        if output_type == 'pie':
-            if col1 not in df.columns:
-                return JsonResponse({
-                    'error': f'Column "{col1}" not found. Available: {list(df.columns)}'
-                }, status=400)
 
-            pie = process_pie_chart(df, col1)
-            series = df[col1]
-            is_num = pd.api.types.is_numeric_dtype(series)
+def analyze_streamed(file_obj, output_type, col1, col2, report=None, **options):
+    """analyze_stream, timed as one stage (parsing and statistics interleave per chunk)."""
+    with stage('stream'):
+        payload = analyze_stream(file_obj, output_type, col1, col2, report, **options)
+    label(rel_type=payload.get('relationship_type', 'pie'))
+    return payload
 
-            return JsonResponse({
-                'status': 'success',
-                'data_source_type': file_type,
-                'output_type': 'pie',
-                'plot_data': pie,
-                'column_names': [col1],
-                'column_stats': {
-                    col1: {
-                        'type': 'numeric' if is_num else 'categorical',
-                        'unique_values': int(series.nunique()),
-                        'null_count': int(series.isnull().sum())
-                    }
-                }
-            })
 
-        # 5. Relationship analysis
-        for c in [col1, col2]:
-            if c not in df.columns:
-                return JsonResponse({
-                    'error': f'Column "{c}" not found. Available: {list(df.columns)}'
-                }, status=400)
-
-        s1 = pd.to_numeric(df[col1], errors='ignore')
-        s2 = pd.to_numeric(df[col2], errors='ignore')
-        n1 = pd.api.types.is_numeric_dtype(s1)
-        n2 = pd.api.types.is_numeric_dtype(s2)
-
-        rel_type = (
-            "numeric-numeric" if n1 and n2 else
-            "numeric-categorical" if n1 else
-            "categorical-numeric" if n2 else
-            "categorical-categorical"
-        )
+@csrf_exempt
+@instrumented('analyze_data')
+def analyze_data(request):
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
 
-        plot_data = {'x': [], 'y': [], 'predicted': None, 'confidence_interval': None, 'group_means': None}
-        correlation = None
-        stats_res = None
-        model_perf = None
+    data_source = None
+    try:
+        # 1. Validate required form fields
+        output_type, col1, col2 = get_analysis_params(request.POST)
+        options = get_analysis_options(request.POST)
+
+        # 2. Previously uploaded dataset, or load into pandas DataFrame
+        usecols = [col1] if output_type == 'pie' else [col1, col2]
+        if 'dataset_id' in request.POST:
+            data_source, file_type = None, None
+            dataset_id = request.POST['dataset_id'].strip()
+        else:
+            data_source, file_type = get_data_source(request)
+            if use_streaming(request.POST, data_source, file_type):
+                return json_response(analyze_streamed(data_source, output_type, col1, col2, **options))
+            with stage('hash'):
+                dataset_id = content_hash(data_source)
+
+        df, file_type = load_for_analysis(data_source, file_type, dataset_id, usecols)
+        if df is None and data_source is None:
+            return JsonResponse({
+                'error': 'Unknown or expired dataset_id. Upload the dataset again.'
+            }, status=404)
+        if df is None:
+            return JsonResponse({'error': 'Failed to load data'}, status=400)
 
-        # -- Numeric vs Numeric
-        if rel_type == "numeric-numeric":
-            mask = s1.notna() & s2.notna()
-            if mask.sum() > 1:
-                correlation = pearsonr(s1[mask], s2[mask])[0]
+        # 3. Pie chart or relationship analysis
+        return json_response(analyze_frame(df, file_type, output_type, col1, col2, dataset_id, **options))
 
-            hf = h2o.H2OFrame(df[[col1, col2]].dropna())
-            # feature engineering if low correlation
-            features = [col1]
-            if abs(correlation or 0) < 0.3:
-                hf['x2'] = hf[col1] ** 2
-                features.append('x2')
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except H2OStartupError:
+        return JsonResponse(
+            {'error': 'Server mis-configured: could not start H2O (Java missing?)'},
+            status=500
+        )
+    except Exception as e:
+        logging.exception("Processing error")
+        return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        close_source(data_source)
 
-            aml = H2OAutoML(max_models=3, seed=42, max_runtime_secs=30,
-                            stopping_metric="RMSE", stopping_tolerance=0.01)
-            aml.train(x=features, y=col2, training_frame=hf)
 
-            preds = aml.leader.predict(hf).as_data_frame()['predict']
-            residuals = s2[mask] - preds
-            se = np.std(residuals)
-            ci = 1.96 * se
+def run_batch_spec(df, file_type, dataset_id, profiles, header, spec):
+    """
+    One entry of a batch: the analyze_data payload or an error entry.
+    `header` is every column of the source (df holds only those requested).
+    """
+    try:
+        output_type, col1, col2 = get_analysis_params(spec)
+        options = get_analysis_options(spec)
+        check_columns(df, [col1] if output_type == 'pie' else [col1, col2], available=header)
+        return analyze_frame(df, file_type, output_type, col1, col2, dataset_id,
+                             profiles=profiles, **options)
+    except BadRequest as e:
+        return {'status': 'error', 'status_code': 400, 'error': str(e)}
+    except H2OStartupError:
+        return {
+            'status': 'error', 'status_code': 500,
+            'error': 'Server mis-configured: could not start H2O (Java missing?)'
+        }
+    except Exception as e:
+        logging.exception("Batch analysis error")
+        return {'status': 'error', 'status_code': 500, 'error': str(e)}
 
-            plot_data = {
-                'x': s1.tolist(),
-                'y': s2.tolist(),
-                'predicted': preds.tolist(),
-                'confidence_interval': {
-                    'upper': (preds + ci).tolist(),
-                    'lower': (preds - ci).tolist()
-                }
-            }
 
-            model_perf = {
-                'model_type': str(aml.leader),
-                'r2': aml.leader.r2(),
-                'rmse': aml.leader.rmse(),
-                'mae': aml.leader.mae()
-            }
+@csrf_exempt
+@instrumented('analyze_batch')
+def analyze_batch(request):
+    """
+    Several analyses over one dataset in a single request.
+    `specs` is a JSON list of {output_type, target_column1, target_column2}
+    (plus optional model_tier / max_points); the data is loaded once, per
+    column work is shared, and the analyses run in parallel. Results come
+    back in spec order, with a per-spec error entry (and the status code
+    analyze_data would have returned) for failed ones.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
 
-        # -- Numeric vs Categorical
-        elif rel_type == "numeric-categorical":
-            cats = s2.astype(str)
-            mask = s1.notna() & cats.notna()
-            if mask.sum() > 1:
-                uc = cats[mask].nunique()
-                if uc == 2:
-                    codes = pd.factorize(cats[mask])[0]
-                    correlation = pointbiserialr(s1[mask], codes)[0]
-                elif uc > 2:
-                    groups = defaultdict(list)
-                    for cat, val in zip(cats[mask], s1[mask]):
-                        groups[cat].append(val)
-                    f, p = f_oneway(*groups.values())
-                    stats_res = {
-                        'anova': {'f_statistic': f, 'p_value': p,
-                                  'effect_size': np.sqrt(f / (f + (len(s1[mask]) - len(groups))))}
-                    }
-            gm = s1.groupby(cats).mean().to_dict()
-            plot_data = {'x': cats.tolist(), 'y': s1.tolist(), 'group_means': gm}
-
-        # -- Categorical vs Numeric
-        elif rel_type == "categorical-numeric":
-            cats = s1.astype(str)
-            mask = s2.notna() & cats.notna()
-            if mask.sum() > 1:
-                uc = cats[mask].nunique()
-                if uc == 2:
-                    codes = pd.factorize(cats[mask])[0]
-                    correlation = pointbiserialr(s2[mask], codes)[0]
-                elif uc > 2:
-                    groups = defaultdict(list)
-                    for cat, val in zip(cats[mask], s2[mask]):
-                        groups[cat].append(val)
-                    f, p = f_oneway(*groups.values())
-                    stats_res = {
-                        'anova': {'f_statistic': f, 'p_value': p,
-                                  'effect_size': np.sqrt(f / (f + (len(s2[mask]) - len(groups))))}
-                    }
-            gm = s2.groupby(cats).mean().to_dict()
-            plot_data = {'x': cats.tolist(), 'y': s2.tolist(), 'group_means': gm}
-
-        # -- Categorical vs Categorical
+    data_source = None
+    try:
+        try:
+            specs = json.loads(request.POST.get('specs', ''))
+        except json.JSONDecodeError:
+            return JsonResponse({'error': 'specs must be a JSON list'}, status=400)
+        if not isinstance(specs, list) or not specs or not all(isinstance(x, dict) for x in specs):
+            return JsonResponse({'error': 'specs must be a non-empty JSON list of objects'}, status=400)
+        if len(specs) > settings.BATCH_MAX_SPECS:
+            return JsonResponse({'error': f'At most {settings.BATCH_MAX_SPECS} specs per batch'}, status=400)
+
+        # one parse covering every column any spec needs
+        usecols = []
+        for spec in specs:
+            for key in ('target_column1', 'target_column2'):
+                col = str(spec.get(key) or '').strip()
+                if col and col not in usecols:
+                    usecols.append(col)
+
+        if 'dataset_id' in request.POST:
+            data_source, file_type = None, None
+            dataset_id = request.POST['dataset_id'].strip()
         else:
-            tab = pd.crosstab(s1.astype(str), s2.astype(str))
-            if tab.size:
-                chi2, p, dof, _ = chi2_contingency(tab)
-                stats_res = {'chi_square': {'statistic': chi2, 'p_value': p, 'degrees_of_freedom': dof}}
-            plot_data = {'x': s1.astype(str).tolist(), 'y': s2.astype(str).tolist()}
+            data_source, file_type = get_data_source(request)
+            dataset_id = content_hash(data_source)
+
+        # unknown columns become per-spec errors instead of failing the load
+        if data_source is None:
+            info = registry.describe(dataset_id)
+            available = info[3] if info is not None else usecols
+        elif file_type == 'csv':
+            available = sniff_csv(data_source)[1]
+        else:
+            available = usecols
+        usecols = [c for c in usecols if c in available]
 
-        # Final JSON response
-        return JsonResponse({
+        df, file_type = load_for_analysis(data_source, file_type, dataset_id, usecols or None)
+        if df is None and data_source is None:
+            return JsonResponse({
+                'error': 'Unknown or expired dataset_id. Upload the dataset again.'
+            }, status=404)
+        if df is None:
+            return JsonResponse({'error': 'Failed to load data'}, status=400)
+        # JSON sources are parsed whole, so their frame has every column
+        header = list(available) if data_source is None or file_type == 'csv' else list(df.columns)
+
+        profiles = ColumnProfiles(df)
+        label(rel_type='batch')
+        with ThreadPoolExecutor(max_workers=settings.BATCH_WORKERS) as pool:
+            results = list(pool.map(
+                bind(lambda spec: run_batch_spec(df, file_type, dataset_id, profiles, header, spec)), specs
+            ))
+
+        return json_response({
             'status': 'success',
             'data_source_type': file_type,
-            'output_type': output_type,
-            'relationship_type': rel_type,
-            'correlation': correlation,
-            'plot_data': plot_data,
-            'column_names': [col1, col2],
-            'column_stats': {
-                col1: {
-                    'type': 'numeric' if n1 else 'categorical',
-                    'unique_values': int(s1.nunique()),
-                    'null_count': int(s1.isnull().sum())
-                },
-                col2: {
-                    'type': 'numeric' if n2 else 'categorical',
-                    'unique_values': int(s2.nunique()),
-                    'null_count': int(s2.isnull().sum())
-                }
-            },
-            'statistical_tests': stats_res,
-            'model_performance': model_perf
+            'results': results
         })
 
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
         logging.exception("Processing error")
         return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        close_source(data_source)
+
+
+@csrf_exempt
+def submit_analysis_job(request):
+    """
+    Queue an analyze_data request and return its job id straight away.
+    Takes the same fields as analyze_data; poll analysis_job_status.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Only POST method allowed'}, status=405)
+
+    source = None
+    try:
+        output_type, col1, col2 = get_analysis_params(request.POST)
+        options = get_analysis_options(request.POST)
+
+        streaming = False
+        if 'dataset_id' in request.POST:
+            data_source, file_type = None, None
+            dataset_id = request.POST['dataset_id'].strip()
+            if registry.describe(dataset_id) is None:
+                return JsonResponse({
+                    'error': 'Unknown or expired dataset_id. Upload the dataset again.'
+                }, status=404)
+        else:
+            source, file_type = get_data_source(request)
+            data_source = source
+            streaming = use_streaming(request.POST, source, file_type)
+            if streaming:
+                # spool to disk rather than memory; the upload is gone once this request ends
+                data_source = tempfile.TemporaryFile()
+                shutil.copyfileobj(source, data_source)
+                data_source.seek(0)
+            elif hasattr(source, 'read'):
+                # the upload is gone once this request ends
+                data_source = io.BytesIO(source.read())
+            dataset_id = content_hash(data_source)
+
+        job_id = analysis_jobs.submit(
+            run_analysis, data_source, file_type, dataset_id, output_type, col1, col2, options,
+            streaming
+        )
+        return JsonResponse({'status': 'queued', 'job_id': job_id}, status=202)
+
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logging.exception("Processing error")
+        return JsonResponse({'error': str(e)}, status=500)
+    finally:
+        close_source(source)  # jobs get their own copy
+
+
+def analysis_job_status(request, job_id):
+    """Progress of a queued analysis, with the analyze_data payload once done."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Only GET method allowed'}, status=405)
+
+    state = analysis_jobs.status(job_id)
+    if state is None:
+        return JsonResponse({'error': 'Unknown or expired job id'}, status=404)
+    return json_response(state)
 
 
 @csrf_exempt
@@ -0,0 +1,210 @@
+"""
+Vector charts for PDF reports, drawn server-side with reportlab.graphics.
+
+A chart is sent either as a spec (`chartSpec_<i>`, JSON) or as the id of a
+finished analysis job (`chartJob_<i>`), whose analyze_data payload is
+turned into a spec:
+
+    {"type": "pie", "labels": [...], "values": [...]}
+    {"type": "scatter", "x": [...], "y": [...], "line_x": [...], "line_y": [...],
+     "x_label": "...", "y_label": "..."}
+    {"type": "group_means", "labels": [...], "means": [...], "x_label": "...", "y_label": "..."}
+
+Specs are cleaned up and downsampled to REPORT_CHART_MAX_POINTS when the
+request is read, so only what gets drawn is pickled, hashed and drawn.
+"""
+import numpy as np
+from django.core.exceptions import BadRequest
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.lineplots import LinePlot
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.shapes import Drawing, Rect, String
+from reportlab.graphics.widgets.markers import makeMarker
+from reportlab.lib import colors
+
+from csv_upload.downsample import sample_scatter, sample_line
+from csv_upload.sketches import OTHER_LABEL
+
+
+PALETTE = [
+    colors.HexColor(c) for c in
+    ('#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f',
+     '#edc948', '#b07aa1', '#ff9da7', '#9c755f', '#bab0ac')
+]
+PIE_MAX_SLICES = 10
+MAX_BARS = 30
+
+
+def spec_from_analysis(payload):
+    """Chart spec for an analyze_data payload."""
+    plot_data = payload.get('plot_data') or {}
+    columns = payload.get('column_names') or []
+    if payload.get('output_type') == 'pie':
+        return {'type': 'pie', 'labels': plot_data.get('labels'), 'values': plot_data.get('values')}
+
+    rel_type = payload.get('relationship_type')
+    if rel_type == 'numeric-numeric':
+        x, y = plot_data.get('x'), plot_data.get('y')
+        line_x = plot_data.get('predicted_x')
+        if line_x is None:
+            # predictions cover the rows where both columns are present
+            line_x = [a for a, b in zip(x, y) if a is not None and b is not None]
+        return {
+            'type': 'scatter', 'x': x, 'y': y,
+            'line_x': line_x, 'line_y': plot_data.get('predicted'),
+            'x_label': columns[0], 'y_label': columns[1],
+        }
+    if rel_type in ('numeric-categorical', 'categorical-numeric'):
+        means = plot_data.get('group_means') or {}
+        numeric, category = columns if rel_type == 'numeric-categorical' else reversed(columns)
+        return {
+            'type': 'group_means', 'labels': list(means), 'means': list(means.values()),
+            'x_label': category, 'y_label': numeric,
+        }
+    raise BadRequest(f'No server-side chart for {rel_type} results')
+
+
+def as_floats(values, name):
+    try:
+        return np.asarray(values if values is not None else [], dtype=np.float64)
+    except (TypeError, ValueError):
+        raise BadRequest(f'Chart "{name}" values must be numbers')
+
+
+def normalize_spec(spec, max_points):
+    """Validated copy of `spec` with series downsampled to max_points, as plain lists."""
+    if not isinstance(spec, dict):
+        raise BadRequest('Chart spec must be a JSON object')
+    kind = spec.get('type')
+
+    if kind == 'pie':
+        labels = [str(label) for label in spec.get('labels') or []]
+        values = as_floats(spec.get('values'), 'values')
+        if len(labels) != len(values) or not len(values):
+            raise BadRequest('Pie chart needs as many values as labels')
+        order = np.argsort(-values, kind='stable')
+        if len(order) > PIE_MAX_SLICES:
+            # smallest slices folded into "Other", along with the spec's own
+            # "Other" slice if it has one (approximate analyses do)
+            order = order[[labels[i] != OTHER_LABEL for i in order]][:PIE_MAX_SLICES - 1]
+            rest = np.delete(values, order).sum()
+            labels, values = [labels[i] for i in order] + [OTHER_LABEL], np.append(values[order], rest)
+        else:
+            labels, values = [labels[i] for i in order], values[order]
+        return {'type': 'pie', 'labels': labels, 'values': values.tolist()}
+
+    if kind == 'scatter':
+        x, y = as_floats(spec.get('x'), 'x'), as_floats(spec.get('y'), 'y')
+        if len(x) != len(y):
+            raise BadRequest('Scatter chart needs as many x as y values')
+        keep = np.isfinite(x) & np.isfinite(y)
+        x, y = x[keep], y[keep]
+        idx, _ = sample_scatter(x, y, max_points)
+        line_x, line_y = as_floats(spec.get('line_x'), 'line_x'), as_floats(spec.get('line_y'), 'line_y')
+        if len(line_x) != len(line_y):
+            line_x = line_y = np.empty(0)
+        keep = np.isfinite(line_x) & np.isfinite(line_y)
+        line_x, line_y = line_x[keep], line_y[keep]
+        line = sample_line(line_x, max_points)
+        return {
+            'type': 'scatter',
+            'x': x[idx].tolist(), 'y': y[idx].tolist(),
+            'line_x': line_x[line].tolist(), 'line_y': line_y[line].tolist(),
+            'x_label': str(spec.get('x_label') or ''), 'y_label': str(spec.get('y_label') or ''),
+        }
+
+    if kind == 'group_means':
+        labels = [str(label) for label in spec.get('labels') or []]
+        means = as_floats(spec.get('means'), 'means')
+        if len(labels) != len(means) or not len(means):
+            raise BadRequest('Group means chart needs as many means as labels')
+        means = np.where(np.isfinite(means), means, 0.0)
+        return {
+            'type': 'group_means',
+            'labels': labels[:MAX_BARS], 'means': means[:MAX_BARS].tolist(),
+            'total_groups': len(labels),
+            'x_label': str(spec.get('x_label') or ''), 'y_label': str(spec.get('y_label') or ''),
+        }
+
+    raise BadRequest(f'Unknown chart type: {kind!r}')
+
+
+def draw_pie(spec, width, height):
+    drawing = Drawing(width, height)
+    pie = Pie()
+    size = min(width * 0.5, height) - 20
+    pie.x, pie.y = 10, (height - size) / 2
+    pie.width = pie.height = size
+    pie.data = spec['values']
+    pie.labels = None
+    pie.slices.strokeColor = colors.white
+    pie.slices.strokeWidth = 0.5
+    for i in range(len(spec['values'])):
+        pie.slices[i].fillColor = PALETTE[i % len(PALETTE)]
+    drawing.add(pie)
+
+    # legend with shares, to the right of the pie
+    total = sum(spec['values']) or 1
+    top = pie.y + size
+    for i, (label, value) in enumerate(zip(spec['labels'], spec['values'])):
+        y = top - 12 * (i + 1)
+        drawing.add(Rect(pie.x + size + 30, y, 8, 8, fillColor=PALETTE[i % len(PALETTE)], strokeColor=None))
+        drawing.add(String(
+            pie.x + size + 44, y + 1, f'{label[:40]}  {value / total:.1%}',
+            fontName='Helvetica', fontSize=8
+        ))
+    return drawing
+
+
+def draw_scatter(spec, width, height):
+    drawing = Drawing(width, height)
+    plot = LinePlot()
+    plot.x, plot.y = 40, 30
+    plot.width, plot.height = width - 60, height - 50
+    plot.data = [list(zip(spec['x'], spec['y'])) or [(0, 0)]]
+    plot.joinedLines = 0
+    plot.lines[0].strokeColor = PALETTE[0]
+    plot.lines[0].symbol = makeMarker('FilledCircle', size=1.5, fillColor=PALETTE[0], strokeColor=None)
+    if spec['line_x']:
+        plot.data.append(list(zip(spec['line_x'], spec['line_y'])))
+        plot.lines[1].lineStyle = 'joinedLine'
+        plot.lines[1].strokeColor = PALETTE[2]
+        plot.lines[1].strokeWidth = 1.5
+    plot.xValueAxis.labels.fontSize = 7
+    plot.yValueAxis.labels.fontSize = 7
+    drawing.add(plot)
+    drawing.add(String(plot.x + plot.width / 2, 4, spec['x_label'], fontName='Helvetica', fontSize=8, textAnchor='middle'))
+    drawing.add(String(plot.x, plot.y + plot.height + 8, spec['y_label'], fontName='Helvetica', fontSize=8))
+    return drawing
+
+
+def draw_group_means(spec, width, height):
+    drawing = Drawing(width, height)
+    chart = VerticalBarChart()
+    chart.x, chart.y = 40, 50
+    chart.width, chart.height = width - 60, height - 70
+    chart.data = [spec['means']]
+    chart.bars[0].fillColor = PALETTE[0]
+    chart.bars.strokeColor = None
+    chart.categoryAxis.categoryNames = [label[:15] for label in spec['labels']]
+    chart.categoryAxis.labels.fontSize = 7
+    chart.categoryAxis.labels.angle = 30
+    chart.categoryAxis.labels.boxAnchor = 'ne'
+    chart.valueAxis.labels.fontSize = 7
+    if min(spec['means']) >= 0:
+        chart.valueAxis.valueMin = 0
+    drawing.add(chart)
+    x_label = spec['x_label']
+    if spec['total_groups'] > len(spec['labels']):
+        x_label += f" (first {len(spec['labels'])} of {spec['total_groups']} groups)"
+    drawing.add(String(chart.x + chart.width / 2, 4, x_label, fontName='Helvetica', fontSize=8, textAnchor='middle'))
+    drawing.add(String(chart.x, chart.y + chart.height + 8, f"Mean {spec['y_label']}", fontName='Helvetica', fontSize=8))
+    return drawing
+
+
+DRAW = {'pie': draw_pie, 'scatter': draw_scatter, 'group_means': draw_group_means}
+
+
+def draw_chart(spec, width, height):
+    """reportlab Drawing (a flowable) for a normalised spec."""
+    return DRAW[spec['type']](spec, width, height)
@@ -0,0 +1,87 @@
+"""
+Chart images for PDF reports, prepared in memory.
+
+An upload is opened once from its bytes (PIL reads only the header until
+pixels are needed), downscaled to REPORT_IMAGE_DPI at the size it will be
+drawn in the A4 frame, and re-encoded: flat-colour charts as PNG,
+photographic images as JPEG, which ReportLab embeds without decoding.
+Identical uploads in one report are prepared once, by content hash.
+"""
+import hashlib
+import io
+from collections import namedtuple
+
+from PIL import Image
+from reportlab.platypus import Image as PlatypusImage
+
+
+POINTS_PER_INCH = 72
+# anti-aliased charts stay well under this; more distinct colours means a photograph
+PNG_MAX_COLORS = 4096
+
+
+class ChartImage(namedtuple('ChartImage', 'data draw_width draw_height')):
+    """Encoded image bytes and the size (points) it is drawn at."""
+
+    def flowable(self):
+        return PlatypusImage(io.BytesIO(self.data), width=self.draw_width, height=self.draw_height)
+
+
+def fit(width, height, max_width, max_height):
+    """Draw size filling the frame with the image's aspect ratio."""
+    scale = min(max_width / width, max_height / height)
+    return width * scale, height * scale
+
+
+def flatten(img):
+    """RGB image, with transparency composited onto the white page."""
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        img = img.convert('RGBA')
+        page = Image.new('RGB', img.size, 'white')
+        page.paste(img, mask=img.getchannel('A'))
+        return page
+    return img.convert('RGB')
+
+
+def encode(img, jpeg_quality):
+    out = io.BytesIO()
+    if img.getcolors(PNG_MAX_COLORS) is not None:
+        img.save(out, 'PNG', optimize=True)
+    else:
+        img.save(out, 'JPEG', quality=jpeg_quality, optimize=True)
+    return out.getvalue()
+
+
+def prepare(data, max_width, max_height, dpi, jpeg_quality):
+    """ChartImage for the image bytes `data`, drawn within max_width x max_height points."""
+    with Image.open(io.BytesIO(data)) as img:
+        draw_width, draw_height = fit(img.width, img.height, max_width, max_height)
+        target = (
+            max(1, round(draw_width * dpi / POINTS_PER_INCH)),
+            max(1, round(draw_height * dpi / POINTS_PER_INCH)),
+        )
+        if img.format == 'JPEG':
+            img.draft('RGB', target)  # decode JPEGs at a reduced scale straight away
+        img = flatten(img)
+        if img.width > target[0] or img.height > target[1]:
+            img = img.resize(target, Image.LANCZOS)
+        return ChartImage(encode(img, jpeg_quality), draw_width, draw_height)
+
+
+class ImageSet:
+    """Chart images of one report, each distinct upload prepared once."""
+
+    def __init__(self, max_width, max_height, dpi, jpeg_quality):
+        self.max_width = max_width
+        self.max_height = max_height
+        self.dpi = dpi
+        self.jpeg_quality = jpeg_quality
+        self._prepared = {}
+
+    def add(self, data):
+        key = hashlib.sha256(data).digest()
+        image = self._prepared.get(key)
+        if image is None:
+            image = prepare(data, self.max_width, self.max_height, self.dpi, self.jpeg_quality)
+            self._prepared[key] = image
+        return image
@@ -0,0 +1,128 @@
+"""
+Finished PDF reports kept on disk, keyed by what they were built from.
+
+The key hashes the normalised inputs (company name, dataset metadata,
+calculations and variables, chart titles, insights, image digests and
+chart specs) plus the settings that change the output, and the day of the
+request. Only the day: the "Generated on" footer and timestamped filename
+would otherwise make every build unique. A repeated request on the same
+day gets the first build's bytes, footer time included; the next day it
+is built again, so the footer never shows an earlier date.
+
+Reports are evicted least recently served first once the directory is
+over REPORT_CACHE_MAX_BYTES.
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from django.conf import settings
+
+
+# bump when the report layout changes, so older cached builds are not served
+FORMAT_VERSION = 1
+
+
+def normalize_json(text):
+    """Parsed JSON, so formatting and key order do not change the key; raw text if invalid."""
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def report_key(inputs):
+    normalized = {
+        'version': FORMAT_VERSION,
+        'generated_on': time.strftime('%Y-%m-%d'),  # the date in the footer
+        'image_dpi': settings.REPORT_IMAGE_DPI,
+        'jpeg_quality': settings.REPORT_IMAGE_JPEG_QUALITY,
+        'company_name': inputs['company_name'],
+        'chart_count': inputs['chart_count'],
+        'csv_metadata': inputs['csv_metadata'],
+        'calculations': normalize_json(inputs['calculations']),
+        'variables': normalize_json(inputs['variables']),
+        'charts': [
+            {
+                'index': chart['index'],
+                'title': chart['title'],
+                'insights': chart['insights'],
+                'image': hashlib.sha256(chart['image']).hexdigest() if 'image' in chart else None,
+                'spec': chart.get('spec'),
+            }
+            for chart in inputs['charts']
+        ],
+    }
+    encoded = json.dumps(normalized, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+class ReportCache:
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        return os.path.join(self.root, f'{key}.pdf')
+
+    def get(self, key):
+        """The cached PDF bytes for `key`, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # recently served, for prune()
+            return data
+        except OSError:
+            return None
+
+    def put(self, key, data):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self.path(key))
+        except OSError as e:
+            logging.warning(f"Report {key} not cached: {e}")
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            return
+        self.prune(keep=self.path(key))
+
+    def prune(self, keep=None):
+        """
+        Drop the least recently served reports until under max_bytes,
+        never the one at `keep`.
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if not name.endswith('.pdf'):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), os.path.getsize(path), path))
+            except OSError:
+                continue
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not remove cached report {path}: {e}")
+            total -= size
+
+
+report_cache = ReportCache(settings.REPORT_CACHE_ROOT, settings.REPORT_CACHE_MAX_BYTES)
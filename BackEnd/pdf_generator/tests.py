@@ -1,3 +1,269 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.core.exceptions import BadRequest
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, SimpleTestCase
+from PIL import Image, ImageDraw
+
+from csv_upload.jobs import JobQueue
+from csv_upload.serializers import dumps
+from csv_upload.views import analyze_frame
+from pdf_generator.charts import draw_chart, normalize_spec, spec_from_analysis
+from pdf_generator.images import ImageSet, POINTS_PER_INCH, prepare
+from pdf_generator.report_cache import ReportCache
+from pdf_generator.views import render_report
+
+
+def pdf_text(pdf):
+    """Strings drawn in each content stream of a ReportLab PDF."""
+    texts = []
+    for match in re.finditer(rb'stream\r?\n(.*?)endstream', pdf, re.S):
+        data = zlib.decompress(base64.a85decode(match.group(1).strip().removesuffix(b'~>')))
+        texts.append([s.decode('latin-1') for s in re.findall(rb'\((.*?)\) Tj', data)])
+    return texts
+
+
+def calculations(count):
+    return json.dumps([
+        {'formula': f'{i} + 1', 'result': i + 1, 'timestamp': '2024-01-01 00:00'} for i in range(count)
+    ])
+
+
+def png(width, height, noise=False):
+    if noise:
+        pixels = np.random.default_rng(0).integers(0, 256, size=(height, width, 3), dtype=np.uint8)
+        img = Image.fromarray(pixels)
+    else:
+        img = Image.new('RGB', (width, height), 'white')
+        draw = ImageDraw.Draw(img)
+        for i in range(10):
+            draw.rectangle([i * width // 10, height // 2, (i + 1) * width // 10 - 5, height - 1],
+                           fill=(40 * i % 256, 90, 160))
+    out = io.BytesIO()
+    img.save(out, 'PNG')
+    return out.getvalue()
+
+
+def analysis(df, output_type, col1, col2='', **options):
+    """analyze_data payload as a finished analysis job stores it (plain JSON)."""
+    return json.loads(dumps(analyze_frame(df, 'csv', output_type, col1, col2, model_tier='fast', **options)))
+
+
+class TempReportStateMixin:
+    """Report cache and job queue in scratch directories; jobs run on a thread."""
+
+    def setUp(self):
+        super().setUp()
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.cache = ReportCache(tempfile.mkdtemp(dir=self.root), 10**8)
+        self.jobs = JobQueue(lambda: ThreadPoolExecutor(max_workers=1),
+                             tempfile.mkdtemp(dir=self.root), 3600)
+        for name, value in (('report_cache', self.cache), ('report_jobs', self.jobs)):
+            patcher = mock.patch(f'pdf_generator.views.{name}', value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class ReportJobTests(TempReportStateMixin, SimpleTestCase):
+
+    def test_submit_poll_download(self):
+        response = Client().post('/api/pdf/jobs/', {
+            'companyName': 'Acme Corp', 'chartCount': '1', 'chartTitle_0': 'Shares',
+            'chartSpec_0': json.dumps({'type': 'pie', 'labels': ['a', 'b'], 'values': [2, 1]}),
+            'calculations': calculations(2),
+        })
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()['job_id']
+
+        seen = set()
+        for _ in range(200):
+            state = Client().get(f'/api/pdf/jobs/{job_id}/').json()
+            seen.add(state['status'])
+            if state['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        self.assertEqual(state['status'], 'done')
+        self.assertTrue(seen <= {'queued', 'running', 'done'})
+        self.assertTrue(state['filename'].startswith('Acme_Corp_'))
+
+        response = Client().get(f'/api/pdf/jobs/{job_id}/download/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Filename'], state['filename'])
+        pdf = b''.join(response.streaming_content)
+        self.assertTrue(pdf.startswith(b'%PDF'))
+        # the build is cached for later identical requests
+        cached, = os.listdir(self.cache.root)
+        self.assertEqual(self.cache.get(cached.removesuffix('.pdf')), pdf)
+
+    def test_rejected_input_is_not_queued(self):
+        response = Client().post('/api/pdf/jobs/', {'companyName': 'Acme', 'chartCount': '0'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_job(self):
+        self.assertEqual(Client().get(f'/api/pdf/jobs/{"0" * 32}/').status_code, 404)
+        self.assertEqual(Client().get('/api/pdf/jobs/not-a-job/download/').status_code, 404)
+
+
+class ReportCacheTests(TempReportStateMixin, SimpleTestCase):
+
+    fields = {'companyName': 'Acme', 'chartCount': '1', 'chartTitle_0': 'Chart', 'calculations': calculations(3)}
+
+    def generate(self, **fields):
+        image = SimpleUploadedFile('chart.png', fields.pop('image', png(400, 300)), content_type='image/png')
+        response = Client().post('/api/pdf/generate-report/', dict(self.fields, chart_0=image, **fields))
+        self.assertEqual(response.status_code, 200)
+        return response['X-Report-Cache'], response.content
+
+    def test_identical_request_hits(self):
+        first = self.generate()
+        self.assertEqual(first[0], 'miss')
+        self.assertEqual(self.generate(), ('hit', first[1]))
+
+    def test_changed_input_misses(self):
+        self.generate()
+        for fields in ({'companyName': 'Other'}, {'chartTitle_0': 'Renamed'},
+                       {'calculations': calculations(4)}, {'image': png(401, 300)}):
+            with self.subTest(fields=list(fields)):
+                self.assertEqual(self.generate(**fields)[0], 'miss')
+
+    def test_new_day_misses(self):
+        self.generate()
+        with mock.patch('pdf_generator.report_cache.time.strftime', return_value='2099-01-01'):
+            self.assertEqual(self.generate()[0], 'miss')
+
+
+class RenderReportTests(SimpleTestCase):
+
+    def render(self, **inputs):
+        inputs = dict({
+            'company_name': 'Acme', 'chart_count': 0, 'calculations': None, 'variables': '[]',
+            'csv_metadata': {'file_name': 'data.csv', 'rows': '10', 'columns': '2', 'data_points': '20'},
+            'charts': [],
+        }, **inputs)
+        out = io.BytesIO()
+        render_report(inputs, out)
+        return out.getvalue()
+
+    def assertPageTotal(self, pdf):
+        pages = len(re.findall(rb'/Type /Page\b', pdf))
+        texts = pdf_text(pdf)
+        footers = [t for text in texts for t in text if t.startswith('Page ')]
+        self.assertEqual(footers, [f'Page {n} of ' for n in range(1, pages + 1)])
+        # the total the footers refer to, drawn once in a shared form
+        self.assertIn([str(pages)], texts)
+        return pages
+
+    def test_page_total(self):
+        self.assertEqual(self.assertPageTotal(self.render(calculations=calculations(1))), 1)
+        self.assertGreater(self.assertPageTotal(self.render(calculations=calculations(80))), 2)
+
+
+class ImageTests(SimpleTestCase):
+
+    def target(self, draw_size):
+        return round(draw_size * settings.REPORT_IMAGE_DPI / POINTS_PER_INCH)
+
+    def test_downscales_oversized_png(self):
+        image = prepare(png(4000, 3000), 300, 400, settings.REPORT_IMAGE_DPI,
+                        settings.REPORT_IMAGE_JPEG_QUALITY)
+        self.assertEqual((image.draw_width, image.draw_height), (300, 225))
+        with Image.open(io.BytesIO(image.data)) as img:
+            self.assertEqual(img.format, 'PNG')  # flat colours stay lossless
+            self.assertLessEqual(img.width, self.target(300))
+            self.assertLessEqual(img.height, self.target(225))
+
+    def test_photographs_become_jpeg(self):
+        image = prepare(png(1200, 800, noise=True), 300, 400, settings.REPORT_IMAGE_DPI,
+                        settings.REPORT_IMAGE_JPEG_QUALITY)
+        with Image.open(io.BytesIO(image.data)) as img:
+            self.assertEqual(img.format, 'JPEG')
+            self.assertLessEqual(img.width, self.target(300))
+
+    def test_small_image_is_not_upscaled(self):
+        image = prepare(png(100, 50), 300, 400, settings.REPORT_IMAGE_DPI, settings.REPORT_IMAGE_JPEG_QUALITY)
+        with Image.open(io.BytesIO(image.data)) as img:
+            self.assertEqual(img.size, (100, 50))
+
+    def test_identical_uploads_prepared_once(self):
+        images = ImageSet(300, 400, settings.REPORT_IMAGE_DPI, settings.REPORT_IMAGE_JPEG_QUALITY)
+        data = png(800, 600)
+        self.assertIs(images.add(data), images.add(bytes(data)))
+        self.assertIsNot(images.add(png(801, 600)), images.add(data))
+
+
+class ChartSpecTests(SimpleTestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        x = rng.normal(size=500)
+        self.df = pd.DataFrame({
+            'x': x,
+            'y': 2 * x + rng.normal(size=500),
+            'cat': rng.choice([f'g{i}' for i in range(14)], size=500),
+            'kind': rng.choice(['a', 'b'], size=500),
+        })
+        self.df.loc[::50, 'y'] = np.nan
+
+    def check_drawable(self, spec):
+        self.assertIsInstance(spec, dict)
+        drawing = draw_chart(spec, 400, 240)
+        self.assertEqual((drawing.width, drawing.height), (400, 240))
+        drawing.getContents()  # lays out the chart
+
+    def test_specs_from_analyses(self):
+        cases = [
+            ('pie', 'cat', '', {}),
+            ('relationship', 'x', 'y', {}),
+            ('relationship', 'x', 'y', {'max_points': 100}),
+            ('relationship', 'x', 'cat', {}),
+            ('relationship', 'cat', 'y', {}),
+        ]
+        for output_type, col1, col2, options in cases:
+            with self.subTest(columns=(col1, col2), options=options):
+                spec = normalize_spec(spec_from_analysis(analysis(self.df, output_type, col1, col2, **options)), 200)
+                self.check_drawable(spec)
+                if spec['type'] == 'scatter':
+                    self.assertLessEqual(len(spec['x']), 200)
+                    self.assertGreater(len(spec['line_x']), 1)
+
+    def test_pie_slices_folded(self):
+        spec = normalize_spec(spec_from_analysis(analysis(self.df, 'pie', 'cat')), 200)
+        self.assertEqual(len(spec['labels']), 10)
+        self.assertEqual(spec['labels'][-1], 'Other')
+        self.assertEqual(sum(spec['values']), 500)
+
+    def test_pie_keeps_one_other_slice(self):
+        labels = [f'g{i}' for i in range(12)] + ['Other']
+        spec = normalize_spec({'type': 'pie', 'labels': labels, 'values': list(range(12, 0, -1)) + [20]}, 200)
+        self.assertEqual(spec['labels'], [f'g{i}' for i in range(9)] + ['Other'])
+        self.assertEqual(spec['values'][-1], 3 + 2 + 1 + 20)
+
+    def test_categorical_pair_has_no_chart(self):
+        with self.assertRaises(BadRequest):
+            spec_from_analysis(analysis(self.df, 'relationship', 'cat', 'kind'))
+
+    def test_report_from_analysis_job(self):
+        payload = analysis(self.df, 'relationship', 'x', 'y')
+        state = {'status': 'done', 'result': payload}
+        with mock.patch('pdf_generator.views.analysis_jobs.status', return_value=state), \
+                mock.patch('pdf_generator.views.report_cache', ReportCache(tempfile.mkdtemp(), 10**8)) as cache:
+            self.addCleanup(shutil.rmtree, cache.root)
+            response = Client().post('/api/pdf/generate-report/', {
+                'companyName': 'Acme', 'chartCount': '1', 'chartJob_0': 'a' * 32,
+            })
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content.startswith(b'%PDF'))
@@ -1,7 +1,10 @@
 from django.urls import path
-from .views import pdf_generator_view
+from .views import pdf_generator_view, submit_report_job, report_job_status, download_report
 
 
 urlpatterns = [
     path('generate-report/', pdf_generator_view, name='pdf_generator_view'),
+    path('jobs/', submit_report_job, name='submit_report_job'),
+    path('jobs/<str:job_id>/', report_job_status, name='report_job_status'),
+    path('jobs/<str:job_id>/download/', download_report, name='download_report'),
 ]
@@ -1,11 +1,14 @@
-import os
+import io
+import logging
+import multiprocessing
 import time
-import threading
-from PIL import Image
-from django.http import JsonResponse, FileResponse
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.exceptions import BadRequest
+from django.http import JsonResponse, FileResponse, HttpResponse
 from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageTemplate, Frame, Image as PlatypusImage
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageTemplate, Frame
 from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.pdfgen import canvas
 from django.conf import settings
@@ -13,24 +16,53 @@ from django.views.decorators.csrf import csrf_exempt
 import json
 from reportlab.platypus import Table, TableStyle
 from reportlab.lib import colors
+from csv_upload.jobs import JobQueue
+from csv_upload.metrics import instrumented, stage
+from csv_upload.views import analysis_jobs
+from .charts import draw_chart, normalize_spec, spec_from_analysis
+from .images import ImageSet
+from .report_cache import report_cache, report_key
+
+# reports are CPU-bound ReportLab work, so they get their own processes; spawned,
+# not forked, since the web worker already runs threads (job pool, H2O monitor)
+# whose locks a fork would copy in whatever state they are in
+report_jobs = JobQueue(
+    lambda: ProcessPoolExecutor(
+        max_workers=settings.PDF_JOB_WORKERS,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup
+    ),
+    settings.PDF_JOB_ROOT,
+    settings.JOB_RESULT_TTL
+)
             
 # Custom canvas for adding watermark and page number
 class DetailForCanvas(canvas.Canvas):
+    """
+    Pages are finished as they are drawn. "Page X of Y" refers to the
+    total through a form XObject that is only filled in by save(), once
+    the page count is known, so no page state is kept around.
+    """
+    TOTAL_FORM = 'pageTotal'
+    FOOTER_Y = 10 * mm
+
     def __init__(self, *args, **kwargs):
         canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
+        self.generated_on = time.strftime('%Y-%m-%d %H:%M:%S')
+        self.total_x = 190 * mm - self.stringWidth('0000', "Helvetica", 8)
 
     def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
+        self.draw_watermark()
+        self.draw_page_number()
+        canvas.Canvas.showPage(self)
 
     def save(self):
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.draw_watermark()
-            self.draw_page_number(num_pages)
-            canvas.Canvas.showPage(self)
+        # the page count the footers point at
+        self.beginForm(self.TOTAL_FORM)
+        self.setFont("Helvetica", 8)
+        self.setFillColorRGB(0.5, 0.5, 0.5, alpha=1)
+        self.drawString(self.total_x, self.FOOTER_Y, str(self.getPageNumber() - 1))
+        self.endForm()
         canvas.Canvas.save(self)
 
     def draw_watermark(self):
@@ -42,268 +74,393 @@ class DetailForCanvas(canvas.Canvas):
         self.drawCentredString(0, 0, "DATALYSIS")
         self.restoreState()
 
-    def draw_page_number(self, page_count):
+    def draw_page_number(self):
         self.setFont("Helvetica", 8)
         self.setFillColorRGB(0.5, 0.5, 0.5, alpha=1)
-        footer_text = f"Generated on: {time.strftime('%Y-%m-%d %H:%M:%S')}"
-        self.drawString(20 * mm, 10 * mm, footer_text)
+        footer_text = f"Generated on: {self.generated_on}"
+        self.drawString(20 * mm, self.FOOTER_Y, footer_text)
         page_num = self.getPageNumber()
-        page_info = f"Page {page_num} of {page_count}"
-        self.drawRightString(190 * mm, 10 * mm, page_info)
+        page_info = f"Page {page_num} of "
+        self.drawRightString(self.total_x, self.FOOTER_Y, page_info)
+        self.doForm(self.TOTAL_FORM)
 
-@csrf_exempt
-def pdf_generator_view(request):
-    # Debug logging
-    print("\n=== PDF GENERATION REQUEST ===")
-    print("Method:", request.method)
-    print("Content-Type:", request.content_type)
-    print("POST data:", dict(request.POST))
-    print("FILES data:", dict(request.FILES))
+def read_report_inputs(request):
+    """
+    Everything a report is built from, as plain picklable data (chart
+    images as bytes) so it can be handed to a worker process.
+    """
+    company_name = request.POST.get('companyName', 'Unnamed_Report')
+    chart_count = int(request.POST.get('chartCount', 0))
+    calculations = request.POST.get('calculations', request.POST.get('calculation'))  # Handle both field names
+    variables = request.POST.get('variables', request.POST.get('variable'))  # Handle both field names
 
-    if request.method != 'POST':
-        return JsonResponse({'error': 'Invalid method'}, status=405)
+    logging.debug(f"Company: {company_name} | Charts: {chart_count} | Calculations: {bool(calculations)}")
 
-    try:
-        # Extract and validate data
-        company_name = request.POST.get('companyName', 'Unnamed_Report')
-        chart_count = int(request.POST.get('chartCount', 0))
-        calculations = request.POST.get('calculations', request.POST.get('calculation'))  # Handle both field names
-        variables = request.POST.get('variables', request.POST.get('variable'))  # Handle both field names
-        
-        # Debug logging
-        print(f"Company: {company_name} | Charts: {chart_count} | Calculations: {bool(calculations)}")
-
-        # Validate at least one content type exists
-        if chart_count == 0 and not calculations:
-            error_msg = "No content provided (neither charts nor calculations)"
-            print(error_msg)
-            return JsonResponse({'error': error_msg}, status=400)
-
-        # Extract CSV metadata
-        csv_metadata = {
-            'file_name': request.POST.get('fileName', ''),
-            'rows': request.POST.get('rowsCount', ''),
-            'columns': request.POST.get('columnsCount', ''),
-            'data_points': request.POST.get('dataPointsCount', ''),
+    # Validate at least one content type exists
+    if chart_count == 0 and not calculations:
+        raise BadRequest("No content provided (neither charts nor calculations)")
+
+    # Extract CSV metadata
+    csv_metadata = {
+        'file_name': request.POST.get('fileName', ''),
+        'rows': request.POST.get('rowsCount', ''),
+        'columns': request.POST.get('columnsCount', ''),
+        'data_points': request.POST.get('dataPointsCount', ''),
+    }
+    logging.debug(f"CSV Metadata: {csv_metadata}")
+
+    charts = []
+    for i in range(chart_count):
+        chart = {
+            'index': i,
+            'title': request.POST.get(f'chartTitle_{i}', f'Chart {i+1}'),
+            'insights': request.POST.get(f'chartInsights_{i}', ''),
         }
-        print("CSV Metadata:", csv_metadata)
+        chart_file = request.FILES.get(f'chart_{i}')
+        if chart_file:
+            chart['image'] = chart_file.read()
+        elif f'chartSpec_{i}' in request.POST or f'chartJob_{i}' in request.POST:
+            chart['spec'] = read_chart_spec(request.POST, i)
+        else:
+            logging.warning(f"Chart {i} not found in files")
+            continue
+        charts.append(chart)
+
+    return {
+        'company_name': company_name,
+        'chart_count': chart_count,
+        'calculations': calculations,
+        'variables': variables,
+        'csv_metadata': csv_metadata,
+        'charts': charts,
+    }
 
-        # PDF Setup
-        timestamp = int(time.time())
-        pdf_filename = f"{company_name.replace(' ', '_')}_{timestamp}.pdf"
-        pdf_path = os.path.join(settings.PDF_TEMP_ROOT, pdf_filename)
+
+def read_chart_spec(post, i):
+    """Spec of a server-side chart, given inline or as a finished analysis job id."""
+    if f'chartSpec_{i}' in post:
+        try:
+            spec = json.loads(post[f'chartSpec_{i}'])
+        except json.JSONDecodeError as e:
+            raise BadRequest(f'Invalid chartSpec_{i}: {e}')
+    else:
+        job_id = post[f'chartJob_{i}'].strip()
+        state = analysis_jobs.status(job_id)
+        if state is None:
+            raise BadRequest(f'Unknown or expired analysis job id: {job_id}')
+        if state['status'] != 'done':
+            raise BadRequest(f'Analysis job {job_id} is {state["status"]}, not done')
+        spec = spec_from_analysis(state['result'])
+    return normalize_spec(spec, settings.REPORT_CHART_MAX_POINTS)
+
+
+def report_filename(company_name):
+    timestamp = int(time.time())
+    return f"{company_name.replace(' ', '_')}_{timestamp}.pdf"
+
+
+def render_report(inputs, output, report=None):
+    """
+    Build the report described by `inputs` into `output` (a path or a
+    binary file object). `report(stage, progress)` is told how far it got.
+    """
+    report = report or (lambda stage, progress=None: None)
+    company_name = inputs['company_name']
+    chart_count = inputs['chart_count']
+    calculations = inputs['calculations']
+    variables = inputs['variables']
+    csv_metadata = inputs['csv_metadata']
+
+    doc = SimpleDocTemplate(
+        output, 
+        pagesize=A4, 
+        leftMargin=20*mm, 
+        rightMargin=20*mm, 
+        topMargin=20*mm, 
+        bottomMargin=25*mm
+    )
+    styles = getSampleStyleSheet()
+    normal_style = styles['Normal']
+    title_style = styles['Title']
+    heading2_style = styles['Heading2']
+    heading3_style = styles['Heading3']
         
-        doc = SimpleDocTemplate(
-            pdf_path, 
-            pagesize=A4, 
-            leftMargin=20*mm, 
-            rightMargin=20*mm, 
-            topMargin=20*mm, 
-            bottomMargin=25*mm
-        )
-        styles = getSampleStyleSheet()
-        normal_style = styles['Normal']
-        title_style = styles['Title']
-        heading2_style = styles['Heading2']
-        heading3_style = styles['Heading3']
-            
-        center_style = normal_style.clone('CenterStyle')
-        center_style.alignment = 1  
+    center_style = normal_style.clone('CenterStyle')
+    center_style.alignment = 1  
+
+    story = []
 
-        story = []
+    # ===== HEADER SECTION =====
+    story.append(Paragraph(company_name, title_style))
+    story.append(Spacer(1, 12))
+    
+    # Dynamic subtitle based on content
+    subtitle = "Data Analysis Report"
+    if calculations and chart_count == 0:
+        subtitle = "Calculations Report"
+
+    elif calculations and chart_count > 0:
+        subtitle = "Full Analysis Report"
+    story.append(Paragraph(subtitle, heading2_style))
+    story.append(Spacer(1, 24))
 
-        # ===== HEADER SECTION =====
-        story.append(Paragraph(company_name, title_style))
+    # ===== DATASET INFORMATION =====
+    if csv_metadata['file_name']:  # Only show if we have file info
+        story.append(Paragraph("Dataset Information", heading2_style))
         story.append(Spacer(1, 12))
         
-        # Dynamic subtitle based on content
-        subtitle = "Data Analysis Report"
-        if calculations and chart_count == 0:
-            subtitle = "Calculations Report"
-
-        elif calculations and chart_count > 0:
-            subtitle = "Full Analysis Report"
-        story.append(Paragraph(subtitle, heading2_style))
+        dataset_info = [
+            ["File Name", "Total Rows", "Total Columns", "Total Data Points"],
+            [
+                csv_metadata['file_name'],
+                str(csv_metadata['rows']),
+                str(csv_metadata['columns']),
+                str(csv_metadata['data_points'])
+            ]
+        ]
+        
+        dataset_table = Table(dataset_info, colWidths=[45*mm] * 4)
+        dataset_table.setStyle(TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('LINEBELOW', (0, 0), (-1, 0), 1, colors.grey),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
+            ('PADDING', (0, 0), (-1, -1), 6),
+        ]))
+        story.append(dataset_table)
         story.append(Spacer(1, 24))
 
-        # ===== DATASET INFORMATION =====
-        if csv_metadata['file_name']:  # Only show if we have file info
-            story.append(Paragraph("Dataset Information", heading2_style))
+    # ===== CALCULATIONS SECTION =====
+    if calculations or variables != '[]':
+        try:
+            # Combine both calculations and variables into one section
+            story.append(Paragraph("Calculations", heading2_style))
             story.append(Spacer(1, 12))
             
-            dataset_info = [
-                ["File Name", "Total Rows", "Total Columns", "Total Data Points"],
-                [
-                    csv_metadata['file_name'],
-                    str(csv_metadata['rows']),
-                    str(csv_metadata['columns']),
-                    str(csv_metadata['data_points'])
-                ]
-            ]
+            # First process saved variables (if any)
+            if variables and variables != '[]':
+                vars_data = json.loads(variables)
+                logging.debug(f"Processing {len(vars_data)} variables")
+                
+                for var in vars_data:
+                    value = var.get('value', '')
+                    if isinstance(value, list):
+                        value = ', '.join(map(str, value))
+                    elif isinstance(value, (int, float)):
+                        value = f"{value:.2f}" if isinstance(value, float) else str(value)
+                    
+                    # Format variable as a calculation-like entry
+                    story.append(Paragraph(f"<b>Variable:</b> {var.get('name', '')} = {value}", styles['Normal']))
+                    story.append(Paragraph(f"<i>From column: {var.get('column', '')} ({var.get('type', '')})</i>", styles['Italic']))
+                    story.append(Spacer(1, 12))
             
-            dataset_table = Table(dataset_info, colWidths=[45*mm] * 4)
-            dataset_table.setStyle(TableStyle([
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 0), (-1, -1), 10),
-                ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-                ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                ('LINEBELOW', (0, 0), (-1, 0), 1, colors.grey),
-                ('GRID', (0, 0), (-1, -1), 0.5, colors.lightgrey),
-                ('PADDING', (0, 0), (-1, -1), 6),
-            ]))
-            story.append(dataset_table)
+            # Then process actual calculations (if any)
+            if calculations:
+                calc_data = json.loads(calculations)
+                logging.debug(f"Processing {len(calc_data)} calculations")
+                
+                for calc in calc_data:
+                    # Formula
+                    formula_text = f"<b>Formula:</b> {calc.get('formula', '')}"
+                    story.append(Paragraph(formula_text, styles['Normal']))
+                    
+                    # Result with formatting
+                    result = calc.get('result', '')
+                    if isinstance(result, (int, float)):
+                        result = f"{result:.2f}" if isinstance(result, float) else str(result)
+                    story.append(Paragraph(f"<b>Result:</b> {result}", styles['Normal']))
+                    
+                    # Timestamp
+                    story.append(Paragraph(f"<i>Calculated at: {calc.get('timestamp', '')}</i>", styles['Italic']))
+                    story.append(Spacer(1, 12))
+            
+            story.append(Spacer(1, 24))
+            
+        except json.JSONDecodeError as e:
+            logging.warning(f"Error parsing calculations/variables: {e}")
+            story.append(Paragraph("Error: Could not process calculations/variables", styles['Normal']))
             story.append(Spacer(1, 24))
 
-        # ===== CALCULATIONS SECTION =====
-        if calculations or variables != '[]':
+    # ===== CHARTS SECTION =====
+    if chart_count > 0:
+        logging.debug(f"Processing {chart_count} charts")
+
+        # Summary Section
+        story.append(Paragraph("Analysis Summary", heading2_style))
+        story.append(Spacer(1, 12))
+        
+        # Dynamic summary based on the data
+        summary_text = f"""
+        This report analyzes the dataset containing {csv_metadata['rows']} records with {csv_metadata['columns']} variables. 
+        The analysis includes {chart_count} visualizations showing key relationships and patterns in the data.
+        """
+        story.append(Paragraph(summary_text, normal_style))
+        story.append(Spacer(1, 24))
+
+        story.append(Paragraph("Data Visualizations", styles['Heading2']))
+        story.append(Spacer(1, 12))
+        
+        # Scale to fit page
+        images = ImageSet(
+            A4[0] - 40 * mm,
+            A4[1] - 80 * mm,
+            settings.REPORT_IMAGE_DPI,
+            settings.REPORT_IMAGE_JPEG_QUALITY
+        )
+        processed_charts = 0
+        for n, chart in enumerate(inputs['charts']):
+            report('adding charts', 0.1 + 0.6 * n / len(inputs['charts']))
             try:
-                # Combine both calculations and variables into one section
-                story.append(Paragraph("Calculations", heading2_style))
-                story.append(Spacer(1, 12))
-                
-                # First process saved variables (if any)
-                if variables and variables != '[]':
-                    vars_data = json.loads(variables)
-                    print(f"Processing {len(vars_data)} variables")
-                    
-                    for var in vars_data:
-                        value = var.get('value', '')
-                        if isinstance(value, list):
-                            value = ', '.join(map(str, value))
-                        elif isinstance(value, (int, float)):
-                            value = f"{value:.2f}" if isinstance(value, float) else str(value)
-                        
-                        # Format variable as a calculation-like entry
-                        story.append(Paragraph(f"<b>Variable:</b> {var.get('name', '')} = {value}", styles['Normal']))
-                        story.append(Paragraph(f"<i>From column: {var.get('column', '')} ({var.get('type', '')})</i>", styles['Italic']))
-                        story.append(Spacer(1, 12))
+                with stage('charts'):
+                    if 'spec' in chart:
+                        # Drawn as vector graphics from the (already downsampled) data
+                        img = draw_chart(chart['spec'], images.max_width, images.max_width * 0.6)
+                    else:
+                        # Downscaled and recompressed in memory; repeated charts are prepared once
+                        img = images.add(chart['image']).flowable()
+
+                # Add to PDF
+                story.append(Paragraph(chart['title'], styles['Heading3']))
+                story.append(Spacer(1, 8))
+                story.append(img)
+                story.append(Spacer(1, 24))
                 
-                # Then process actual calculations (if any)
-                if calculations:
-                    calc_data = json.loads(calculations)
-                    print(f"Processing {len(calc_data)} calculations")
-                    
-                    for calc in calc_data:
-                        # Formula
-                        formula_text = f"<b>Formula:</b> {calc.get('formula', '')}"
-                        story.append(Paragraph(formula_text, styles['Normal']))
-                        
-                        # Result with formatting
-                        result = calc.get('result', '')
-                        if isinstance(result, (int, float)):
-                            result = f"{result:.2f}" if isinstance(result, float) else str(result)
-                        story.append(Paragraph(f"<b>Result:</b> {result}", styles['Normal']))
-                        
-                        # Timestamp
-                        story.append(Paragraph(f"<i>Calculated at: {calc.get('timestamp', '')}</i>", styles['Italic']))
-                        story.append(Spacer(1, 12))
+                # Add insights if available
+                if chart['insights']:
+                    story.append(Paragraph("Key Insights:", styles['Normal']))
+                    story.append(Spacer(1, 4))
+                    story.append(Paragraph(chart['insights'], styles['Normal']))
+                    story.append(Spacer(1, 24))
                 
-                story.append(Spacer(1, 24))
+                processed_charts += 1
                 
-            except json.JSONDecodeError as e:
-                print(f"Error parsing data: {str(e)}")
-                story.append(Paragraph("Error: Could not process calculations/variables", styles['Normal']))
-                story.append(Spacer(1, 24))
+            except Exception as e:
+                logging.warning(f"Error processing chart {chart['index']}: {e}")
+                continue
+        
+        logging.debug(f"Successfully processed {processed_charts}/{chart_count} charts")
 
-        # ===== CHARTS SECTION =====
-        if chart_count > 0:
-            print(f"Processing {chart_count} charts")
+    # ===== BUILD PDF =====
+    logging.debug("Building PDF document")
+    report('building PDF', 0.8)
+    with stage('pdf_build'):
+        doc.build(story, canvasmaker=DetailForCanvas)
+    logging.debug("PDF generation successful")
 
-            # Summary Section
-            story.append(Paragraph("Analysis Summary", heading2_style))
-            story.append(Spacer(1, 12))
-            
-            # Dynamic summary based on the data
-            summary_text = f"""
-            This report analyzes the dataset containing {csv_metadata['rows']} records with {csv_metadata['columns']} variables. 
-            The analysis includes {chart_count} visualizations showing key relationships and patterns in the data.
-            """
-            story.append(Paragraph(summary_text, normal_style))
-            story.append(Spacer(1, 24))
 
-            story.append(Paragraph("Data Visualizations", styles['Heading2']))
-            story.append(Spacer(1, 12))
-            
-            processed_charts = 0
-            for i in range(chart_count):
-                chart_file = request.FILES.get(f'chart_{i}')
-                if not chart_file:
-                    print(f"Chart {i} not found in files")
-                    continue
-
-                try:
-                    # Save temporary image
-                    image_filename = f"chart_{i}_{timestamp}.png"
-                    image_path = os.path.join(settings.IMAGE_TEMP_ROOT, image_filename)
-                    
-                    with open(image_path, 'wb+') as destination:
-                        for chunk in chart_file.chunks():
-                            destination.write(chunk)
-
-                    # Add to PDF
-                    chart_title = request.POST.get(f'chartTitle_{i}', f'Chart {i+1}')
-                    story.append(Paragraph(chart_title, styles['Heading3']))
-                    story.append(Spacer(1, 8))
-                    
-                    img = PlatypusImage(image_path)
-                    img_width, img_height = Image.open(image_path).size
-                    
-                    # Scale to fit page
-                    available_width = A4[0] - 40 * mm
-                    available_height = A4[1] - 80 * mm
-                    scale = min(available_width / img_width, available_height / img_height)
-                    
-                    img.drawHeight = img_height * scale
-                    img.drawWidth = img_width * scale
-                    story.append(img)
-                    story.append(Spacer(1, 24))
-                    
-                    # Add insights if available
-                    chart_insights = request.POST.get(f'chartInsights_{i}', '')
-                    if chart_insights:
-                        story.append(Paragraph("Key Insights:", styles['Normal']))
-                        story.append(Spacer(1, 4))
-                        story.append(Paragraph(chart_insights, styles['Normal']))
-                        story.append(Spacer(1, 24))
-                    
-                    # Schedule cleanup
-                    delete_temp_file(image_path, delay=60)
-                    processed_charts += 1
-                    
-                except Exception as e:
-                    print(f"Error processing chart {i}: {str(e)}")
-                    continue
-            
-            print(f"Successfully processed {processed_charts}/{chart_count} charts")
+def build_report(report, inputs):
+    """Background-job body: the finished PDF as bytes, from the report cache if built before."""
+    key = report_key(inputs)
+    pdf = report_cache.get(key)
+    if pdf is None:
+        output = io.BytesIO()
+        render_report(inputs, output, report)
+        pdf = output.getvalue()
+        report_cache.put(key, pdf)
+    return pdf
 
-        # ===== BUILD PDF =====
-        print("Building PDF document...")
-        doc.build(story, canvasmaker=DetailForCanvas)
-        delete_temp_file(pdf_path, delay=60)
-        print("PDF generation successful!")
-        
-        return FileResponse(
-            open(pdf_path, 'rb'),
-            as_attachment=True,
-            filename=pdf_filename,
+
+@csrf_exempt
+@instrumented('pdf_generator_view')
+def pdf_generator_view(request):
+    logging.debug(
+        f"PDF generation request: {request.method} {request.content_type} "
+        f"fields {list(request.POST)} files {list(request.FILES)}"
+    )
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+
+    try:
+        with stage('read_inputs'):
+            inputs = read_report_inputs(request)
+
+        # Same inputs as an earlier request: serve that build as is
+        with stage('cache_lookup'):
+            key = report_key(inputs)
+            pdf = report_cache.get(key)
+
+        # PDF written straight into the response, no temp file
+        pdf_filename = report_filename(inputs['company_name'])
+        response = HttpResponse(
+            pdf or b'',
+            content_type='application/pdf',
             headers={
-                'X-PDF-URL': f'/pdfmedia/{pdf_filename}',
-                'X-Filename': pdf_filename
+                'Content-Disposition': f'attachment; filename="{pdf_filename}"',
+                'X-Filename': pdf_filename,
+                'X-Report-Cache': 'hit' if pdf is not None else 'miss'
             }
         )
+        if pdf is None:
+            render_report(inputs, response)
+            with stage('cache_store'):
+                report_cache.put(key, response.content)
+        return response
 
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
     except Exception as e:
-        print(f"PDF generation failed: {str(e)}")
+        logging.exception("PDF generation failed")
         return JsonResponse({'error': str(e)}, status=500)
-    
 
-#function to delete temp files after a delay
-def delete_temp_file(file_path, delay=60): #1 mins to delete the file NO FOR PRODUCTION
-    def delete_file():
-        try:
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        except Exception as e:
-            print(f"Error deleting {file_path}: {e}")
-    threading.Timer(delay, delete_file).start()
\ No newline at end of file
+
+@csrf_exempt
+def submit_report_job(request):
+    """
+    Queue a report (same fields as pdf_generator_view) and return its job
+    id straight away; poll report_job_status, then fetch download_report.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+
+    try:
+        inputs = read_report_inputs(request)
+        job_id = report_jobs.submit(
+            build_report, inputs, meta={'filename': report_filename(inputs['company_name'])}
+        )
+        return JsonResponse({'status': 'queued', 'job_id': job_id}, status=202)
+
+    except BadRequest as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    except Exception as e:
+        logging.exception("PDF job submission failed")
+        return JsonResponse({'error': str(e)}, status=500)
+
+
+def report_job_status(request, job_id):
+    """Progress of a queued report."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+
+    state = report_jobs.status(job_id)
+    if state is None:
+        return JsonResponse({'error': 'Unknown or expired job id'}, status=404)
+    return JsonResponse(state)
+
+
+def download_report(request, job_id):
+    """The finished PDF of a report job, streamed from disk."""
+    if request.method != 'GET':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+
+    state = report_jobs.status(job_id)
+    if state is None:
+        return JsonResponse({'error': 'Unknown or expired job id'}, status=404)
+    if state['status'] == 'failed':
+        return JsonResponse({'error': state['error']}, status=state['status_code'])
+    if state['status'] != 'done':
+        return JsonResponse({'error': 'Report is not ready yet', 'status': state['status']}, status=409)
+
+    try:
+        pdf_file = open(report_jobs.result_path(job_id), 'rb')
+    except OSError:
+        return JsonResponse({'error': 'Unknown or expired job id'}, status=404)
+    return FileResponse(
+        pdf_file,
+        as_attachment=True,
+        filename=state['filename'],
+        headers={'X-Filename': state['filename']}
+    )